@@ -12,7 +12,7 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 import os
 from pathlib import Path
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -46,11 +46,13 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inventory.instrumentation.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'inventory.routers.ReplicaMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -79,13 +81,146 @@ WSGI_APPLICATION = 'djangodelights.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-DATABASES = {
+# DATABASE_ENGINE is 'sqlite' (default) or 'postgresql'.
+
+DATABASE_ENGINE = config('DATABASE_ENGINE', default='sqlite')
+
+if DATABASE_ENGINE == 'postgresql':
+    DATABASE_POOL = config('DATABASE_POOL', default=False, cast=bool)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': config('DATABASE_NAME', default='djangodelights'),
+            'USER': config('DATABASE_USER', default=''),
+            'PASSWORD': config('DATABASE_PASSWORD', default=''),
+            'HOST': config('DATABASE_HOST', default=''),
+            'PORT': config('DATABASE_PORT', default=''),
+            # Persistent connections and psycopg's pool are mutually exclusive.
+            'CONN_MAX_AGE': 0 if DATABASE_POOL else config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'pool': {
+                    'min_size': config('DATABASE_POOL_MIN_SIZE', default=2, cast=int),
+                    'max_size': config('DATABASE_POOL_MAX_SIZE', default=10, cast=int),
+                    'timeout': config('DATABASE_POOL_TIMEOUT', default=10, cast=int),
+                },
+            } if DATABASE_POOL else {},
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': config('DATABASE_NAME', default=str(BASE_DIR / 'db.sqlite3')),
+            'CONN_MAX_AGE': config('DATABASE_CONN_MAX_AGE', default=60, cast=int),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                # Wait for the write lock instead of failing with "database is locked",
+                # and take it when the transaction starts so writers queue up cleanly.
+                'timeout': config('DATABASE_BUSY_TIMEOUT', default=20, cast=int),
+                'transaction_mode': 'IMMEDIATE',
+                # WAL lets readers carry on while a purchase is being written.
+                'init_command': (
+                    'PRAGMA journal_mode=WAL;'
+                    f"PRAGMA synchronous={config('DATABASE_SQLITE_SYNCHRONOUS', default='NORMAL')};"
+                    'PRAGMA temp_store=MEMORY;'
+                ),
+            },
+        }
+    }
+
+# Read replicas: DATABASE_REPLICAS lists SQLite files or PostgreSQL hosts
+# (same name and credentials as the primary), each added as replica1,
+# replica2, ... Reporting pages and API GETs read from them, except for
+# DATABASE_REPLICA_PIN seconds after the same client wrote something.
+# Replication itself is up to the database; `python manage.py sync_replica`
+# copies a SQLite primary into its replica files for trying this locally.
+
+DATABASE_REPLICAS = config('DATABASE_REPLICAS', default='', cast=Csv())
+DATABASE_REPLICA_PIN = config('DATABASE_REPLICA_PIN', default=10, cast=int)
+
+for number, replica in enumerate(DATABASE_REPLICAS, 1):
+    primary = DATABASES['default']
+    if DATABASE_ENGINE == 'postgresql':
+        options = {**primary['OPTIONS'], 'options': '-c default_transaction_read_only=on'}
+        DATABASES[f'replica{number}'] = {**primary, 'HOST': replica, 'OPTIONS': options}
+    else:
+        options = {'timeout': primary['OPTIONS']['timeout'], 'init_command': 'PRAGMA query_only=ON;'}
+        DATABASES[f'replica{number}'] = {**primary, 'NAME': replica, 'OPTIONS': options}
+    # The test runner points replicas at the test primary instead of creating them.
+    DATABASES[f'replica{number}']['TEST'] = {'MIRROR': 'default'}
+
+DATABASE_ROUTERS = ['inventory.routers.ReplicaRouter']
+
+
+# Cache
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# CACHE_BACKEND is one of 'locmem' (per process), 'file' or 'db' (shared
+# between processes; run `python manage.py createcachetable` first).
+
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'djangodelights'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', BASE_DIR / 'cache'),
+    'db': ('django.core.cache.backends.db.DatabaseCache', 'django_cache'),
+}
+cache_backend, cache_location = CACHE_BACKENDS[config('CACHE_BACKEND', default='locmem')]
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': cache_backend,
+        'LOCATION': config('CACHE_LOCATION', default=str(cache_location)),
+        'TIMEOUT': config('CACHE_TIMEOUT', default=300, cast=int),
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=1000, cast=int),
+        },
     }
 }
 
+# Live event stream broker: inventory.events.LocalBroker only reaches clients
+# connected to the same process; inventory.events.CacheBroker relays events
+# through a shared cache for multi-process deployments.
+
+EVENT_BROKER = config('EVENT_BROKER', default='inventory.events.LocalBroker')
+
+
+# Background tasks
+# Deferred work (sales rollups, reorder points, background exports) is queued
+# in the database. TASKS_EAGER runs each task that is due right after the
+# request's transaction commits, and does the worker's housekeeping (purging
+# old tasks, hourly stock snapshots, delayed tasks) every few minutes, so no
+# worker is needed (the PythonAnywhere deploy has none); set it to False where
+# `python manage.py run_tasks` is running.
+
+TASKS_EAGER = config('TASKS_EAGER', default=True, cast=bool)
+
+EXPORT_ROOT = Path(config('EXPORT_ROOT', default=str(BASE_DIR / 'exports')))
+
+
+# Purchase archives: `python manage.py archive_purchases` moves old months of
+# purchases into gzipped CSV files here. Back this directory up with the database.
+
+ARCHIVE_ROOT = Path(config('ARCHIVE_ROOT', default=str(BASE_DIR / 'archive')))
+
+
+# Performance instrumentation
+# Every request's timings are shown to staff at /performance/, and logged to
+# 'inventory.performance' when LOG_LEVEL is INFO. SERVER_TIMING also sends them
+# to the browser; it is off unless DEBUG is, as the header shows every client
+# query counts and database time.
+
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'inventory': {'handlers': ['console'], 'level': config('LOG_LEVEL', default='WARNING')},
+    },
+}
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -1,22 +1,128 @@
-from django.contrib import admin
-from .models import Ingredient, MenuItem, RecipeRequirement, Purchase
+import io
+from django.contrib import admin, messages
+from django.core.exceptions import PermissionDenied
+from django.shortcuts import redirect
+from django.template.response import TemplateResponse
+from django.urls import path
+from django.utils import timezone
+from .forms import ImportForm
+from .importers import run_import
+from .models import Ingredient, MenuItem, RecipeRequirement, Purchase, PurchaseArchive, DailySales, StockMovement, StockSnapshot, Task
+
+class ImportMixin:
+    """Adds an "Import" page to the changelist that runs ``import_kind``."""
+    import_kind = None
+    change_list_template = 'admin/inventory/import_change_list.html'
+
+    def get_urls(self):
+        opts = self.model._meta
+        urls = [
+            path('import/', self.admin_site.admin_view(self.import_view), name=f'{opts.app_label}_{opts.model_name}_import'),
+        ]
+        return urls + super().get_urls()
+
+    def import_view(self, request):
+        if not (self.has_add_permission(request) and self.has_change_permission(request)):
+            raise PermissionDenied
+        form = ImportForm(request.POST or None, request.FILES or None)
+        if request.method == 'POST' and form.is_valid():
+            dry_run = form.cleaned_data['dry_run']
+            stream = io.TextIOWrapper(form.cleaned_data['file'].file, encoding='utf-8-sig', newline='')
+            try:
+                result = run_import(self.import_kind, stream, form.get_format(), dry_run=dry_run)
+            except ValueError as e:
+                form.add_error('file', str(e))
+            else:
+                self.message_user(request, f'{"Dry run: " if dry_run else ""}{result}', messages.SUCCESS)
+                for line, message in result.errors[:20]:
+                    self.message_user(request, f'Line {line}: {message}', messages.WARNING)
+                if not dry_run:
+                    return redirect(f'admin:{self.model._meta.app_label}_{self.model._meta.model_name}_changelist')
+        context = {
+            **self.admin_site.each_context(request),
+            'opts': self.model._meta,
+            'form': form,
+            'title': f'Import {self.model._meta.verbose_name_plural}',
+        }
+        return TemplateResponse(request, 'admin/inventory/import.html', context)
 
 @admin.register(Ingredient)
-class IngredientAdmin(admin.ModelAdmin):
-    list_display = ('name', 'quantity', 'unit', 'unit_price', 'created_at', 'updated_at')
+class IngredientAdmin(ImportMixin, admin.ModelAdmin):
+    import_kind = 'ingredients'
+    list_display = ('name', 'quantity', 'unit', 'unit_price', 'reorder_point', 'needs_reorder', 'created_at', 'updated_at')
+    list_filter = ('needs_reorder',)
     search_fields = ('name',)
 
 @admin.register(MenuItem)
-class MenuItemAdmin(admin.ModelAdmin):
-    list_display = ('name', 'price', 'created_at', 'updated_at')
+class MenuItemAdmin(ImportMixin, admin.ModelAdmin):
+    import_kind = 'menu-items'
+    list_display = ('name', 'price', 'unit_cost', 'created_at', 'updated_at')
     search_fields = ('name',)
 
 @admin.register(RecipeRequirement)
-class RecipeRequirementAdmin(admin.ModelAdmin):
-    list_display = ('menu_item', 'ingredient', 'quantity')
+class RecipeRequirementAdmin(ImportMixin, admin.ModelAdmin):
+    import_kind = 'recipe-requirements'
+    list_display = ('menu_item', 'ingredient', 'quantity', 'unit')
+    list_select_related = ('menu_item', 'ingredient')
     search_fields = ('menu_item__name', 'ingredient__name')
 
 @admin.register(Purchase)
 class PurchaseAdmin(admin.ModelAdmin):
     list_display = ('menu_item', 'quantity', 'purchase_time', 'logged_by')
-    search_fields = ('menu_item__name', 'logged_by__username')
\ No newline at end of file
+    list_select_related = ('menu_item', 'logged_by')
+    search_fields = ('menu_item__name', 'logged_by__username')
+
+@admin.register(PurchaseArchive)
+class PurchaseArchiveAdmin(admin.ModelAdmin):
+    list_display = ('period', 'rows', 'file', 'first_purchase_time', 'last_purchase_time', 'created_at')
+
+    # Archives are made and restored with `manage.py archive_purchases`.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(DailySales)
+class DailySalesAdmin(admin.ModelAdmin):
+    list_display = ('day', 'menu_item', 'units_sold', 'revenue', 'cost')
+    list_select_related = ('menu_item',)
+    list_filter = ('day',)
+    search_fields = ('menu_item__name',)
+
+@admin.register(StockMovement)
+class StockMovementAdmin(admin.ModelAdmin):
+    list_display = ('created_at', 'ingredient', 'kind', 'quantity', 'note', 'recorded_by')
+    list_select_related = ('ingredient', 'recorded_by')
+    list_filter = ('kind', 'created_at')
+    search_fields = ('ingredient__name', 'note')
+
+    # The ledger is append-only; record movements from the ingredient pages.
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+@admin.register(StockSnapshot)
+class StockSnapshotAdmin(admin.ModelAdmin):
+    list_display = ('taken_at', 'ingredient', 'quantity')
+    list_select_related = ('ingredient',)
+    list_filter = ('taken_at',)
+    search_fields = ('ingredient__name',)
+
+@admin.register(Task)
+class TaskAdmin(admin.ModelAdmin):
+    list_display = ('name', 'status', 'attempts', 'run_after', 'created_at', 'updated_at')
+    list_filter = ('status', 'name')
+    search_fields = ('idempotency_key',)
+    readonly_fields = ('locked_at', 'result', 'last_error', 'created_at', 'updated_at')
+    actions = ['retry']
+
+    @admin.action(description='Retry selected tasks now')
+    def retry(self, request, queryset):
+        updated = queryset.exclude(status=Task.RUNNING).update(status=Task.QUEUED, run_after=timezone.now(), locked_at=None)
+        self.message_user(request, f'{updated} tasks queued.', messages.SUCCESS)
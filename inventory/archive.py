@@ -0,0 +1,156 @@
+import csv
+import gzip
+from array import array
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.utils import timezone
+from .models import MenuItem, Purchase, PurchaseArchive, bulk_changed, start_of_day
+
+COLUMNS = ['id', 'purchase_time', 'menu_item_id', 'menu_item', 'quantity', 'logged_by_id', 'logged_by']
+
+
+def next_month(month):
+    """Start of the local month after the one starting at ``month``."""
+    return timezone.make_aware(datetime.combine((month + timedelta(days=32)).date().replace(day=1), datetime.min.time()))
+
+
+def _filename(month):
+    return f'purchases-{month:%Y-%m}-{timezone.now():%Y%m%d%H%M%S%f}.csv.gz'
+
+
+def _read(archive):
+    with gzip.open(settings.ARCHIVE_ROOT / archive.file, 'rt', newline='') as f:
+        reader = csv.reader(f)
+        next(reader)
+        for pk, purchase_time, menu_item_id, menu_item, quantity, logged_by_id, logged_by in reader:
+            yield int(pk), datetime.fromisoformat(purchase_time), int(menu_item_id), menu_item, int(quantity), int(logged_by_id), logged_by
+
+
+def _delete(ids):
+    # A plain DELETE: post_delete would take the sales back out of the rollups.
+    table = connection.ops.quote_name(Purchase._meta.db_table)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {table} WHERE id IN ({", ".join(["%s"] * len(ids))})', list(ids))
+        return cursor.rowcount
+
+
+def archive_month(month, batch_size=5000):
+    """
+    Move the purchases of the local month starting at ``month`` into a
+    gzipped CSV file under ARCHIVE_ROOT, in one transaction. Returns the
+    PurchaseArchive, or None if the month had no purchases.
+    """
+    purchases = Purchase.objects.filter(purchase_time__gte=month, purchase_time__lt=next_month(month)).order_by('purchase_time', 'id')
+    rows = purchases.values_list('id', 'purchase_time', 'menu_item_id', 'menu_item__name', 'quantity', 'logged_by_id', 'logged_by__username')
+    settings.ARCHIVE_ROOT.mkdir(parents=True, exist_ok=True)
+    filename = _filename(month)
+    path = settings.ARCHIVE_ROOT / filename
+    ids = array('q')
+    try:
+        with transaction.atomic():
+            with gzip.open(path, 'wt', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(COLUMNS)
+                for row in rows.iterator(chunk_size=batch_size):
+                    writer.writerow([row[0], row[1].isoformat(), *row[2:]])
+                    ids.append(row[0])
+                    if len(ids) == 1:
+                        first = row[1]
+                    last = row[1]
+            if not ids:
+                path.unlink()
+                return None
+            archive = PurchaseArchive.objects.create(
+                period=timezone.localdate(month), file=filename, rows=len(ids), first_purchase_time=first, last_purchase_time=last,
+            )
+            deleted = sum(_delete(ids[start:start + batch_size]) for start in range(0, len(ids), batch_size))
+            if deleted != len(ids):
+                raise RuntimeError(f'Archived {len(ids)} purchases but deleted {deleted}')
+            transaction.on_commit(lambda: bulk_changed.send(sender=Purchase))
+    except BaseException:
+        # Nothing was committed, so the file must not outlive the transaction.
+        path.unlink(missing_ok=True)
+        raise
+    return archive
+
+
+def restore(archive, batch_size=5000):
+    """
+    Put an archive's purchases back into the purchase table and delete its
+    file. Purchases whose menu item or user has been deleted since can't go
+    back; they stay behind in a smaller archive. Returns the numbers of
+    purchases restored and left behind.
+    """
+    path = settings.ARCHIVE_ROOT / archive.file
+    menu_items = set(MenuItem.objects.values_list('pk', flat=True))
+    users = set(User.objects.values_list('pk', flat=True))
+    orphans = []
+
+    def restorable():
+        for row in _read(archive):
+            pk, purchase_time, menu_item_id, _, quantity, logged_by_id, _ = row
+            if menu_item_id in menu_items and logged_by_id in users:
+                yield Purchase(id=pk, purchase_time=purchase_time, menu_item_id=menu_item_id, quantity=quantity, logged_by_id=logged_by_id)
+            else:
+                orphans.append(row)
+
+    remainder = None
+    try:
+        with transaction.atomic():
+            # Stock and rollups are left as they are.
+            restored = Purchase.objects.insert_backdated(restorable(), batch_size=batch_size)
+            if orphans:
+                remainder = _filename(archive.period)
+                with gzip.open(settings.ARCHIVE_ROOT / remainder, 'wt', newline='') as f:
+                    writer = csv.writer(f)
+                    writer.writerow(COLUMNS)
+                    writer.writerows([row[0], row[1].isoformat(), *row[2:]] for row in orphans)
+                archive.file = remainder
+                archive.rows = len(orphans)
+                archive.first_purchase_time = orphans[0][1]
+                archive.last_purchase_time = orphans[-1][1]
+                archive.save()
+            else:
+                archive.delete()
+
+            def cleanup():
+                path.unlink(missing_ok=True)
+                bulk_changed.send(sender=Purchase)
+
+            transaction.on_commit(cleanup)
+    except BaseException:
+        if remainder:
+            (settings.ARCHIVE_ROOT / remainder).unlink(missing_ok=True)
+        raise
+    return restored, len(orphans)
+
+
+def purchases(start=None, end=None):
+    """
+    Archived purchases made on local days ``start`` to ``end`` inclusive, as
+    ``(id, purchase_time, menu_item_id, menu_item, quantity, logged_by_id,
+    logged_by)`` tuples read one at a time, oldest archive first.
+    """
+    lower = start and start_of_day(start)
+    upper = end and start_of_day(end + timedelta(days=1))
+    archives = PurchaseArchive.objects.all()
+    if lower:
+        archives = archives.filter(last_purchase_time__gte=lower)
+    if upper:
+        archives = archives.filter(first_purchase_time__lt=upper)
+    for archive in list(archives):
+        for row in _read(archive):
+            if (lower and row[1] < lower) or (upper and row[1] >= upper):
+                continue
+            yield row
+
+
+def daily_units(start=None, end=None):
+    """``{(day, menu_item_id): units}`` for the archived purchases in a day range."""
+    units = {}
+    for _, purchase_time, menu_item_id, _, quantity, _, _ in purchases(start, end):
+        key = (timezone.localdate(purchase_time), menu_item_id)
+        units[key] = units.get(key, 0) + quantity
+    return units
@@ -0,0 +1,171 @@
+import asyncio
+import json
+from asgiref.sync import sync_to_async
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.handlers.asgi import ASGIRequest
+from django.http import JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.views import View
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from . import availability, reorder
+from .caching import acached
+from .events import get_broker
+from .models import Ingredient, MenuItem, Purchase
+
+
+async def authenticate(request):
+    """The session user, or the user of a valid JWT bearer token, or None."""
+    user = await request.auser()
+    if user.is_authenticated:
+        return user
+    try:
+        authenticated = await sync_to_async(JWTAuthentication().authenticate)(request)
+    except AuthenticationFailed:
+        return None
+    return authenticated[0] if authenticated else None
+
+
+async def menu_items():
+    return await acached('menu_items', ('menuitem',), lambda: _list(MenuItem.objects.all()))
+
+
+async def ingredients():
+    return await acached('ingredients', ('ingredient', 'stock'), lambda: _list(Ingredient.objects.order_by('name')))
+
+
+async def _list(queryset):
+    return [obj async for obj in queryset]
+
+
+def _url(request, name, pk):
+    return request.build_absolute_uri(reverse(name, args=[pk]))
+
+
+def _menu_item(request, menu_item, servings):
+    return {
+        'url': _url(request, 'menuitem-detail', menu_item.pk),
+        'name': menu_item.name,
+        'price': menu_item.price,
+        'unit_cost': menu_item.unit_cost,
+        'image_url': menu_item.image_url,
+        'available_servings': servings.get(menu_item.pk),
+    }
+
+
+def _ingredient(request, ingredient):
+    return {
+        'url': _url(request, 'ingredient-detail', ingredient.pk),
+        'name': ingredient.name,
+        'quantity': ingredient.quantity,
+        'unit': ingredient.unit,
+        'unit_price': ingredient.unit_price,
+        'lead_time_days': ingredient.lead_time_days,
+        'daily_usage': ingredient.daily_usage,
+        'reorder_point': ingredient.reorder_point,
+        'needs_reorder': ingredient.needs_reorder,
+    }
+
+
+class AsyncMenuItemListView(View):
+    async def get(self, request):
+        items, servings = await asyncio.gather(menu_items(), availability.aget_availability())
+        return JsonResponse([_menu_item(request, item, servings) for item in items], safe=False)
+
+
+class AsyncIngredientListView(View):
+    async def get(self, request):
+        return JsonResponse([_ingredient(request, ingredient) for ingredient in await ingredients()], safe=False)
+
+
+class AsyncAvailabilityView(View):
+    async def get(self, request, pk=None):
+        if pk is None:
+            items, servings = await asyncio.gather(menu_items(), availability.aget_availability())
+        else:
+            try:
+                item, servings = await asyncio.gather(MenuItem.objects.aget(pk=pk), availability.aget_availability())
+            except MenuItem.DoesNotExist:
+                return JsonResponse({'detail': 'Not found.'}, status=404)
+            items = [item]
+        rows = [
+            {
+                'url': _url(request, 'menuitem-detail', item.pk),
+                'name': item.name,
+                'available_servings': servings.get(item.pk),
+            }
+            for item in sorted(items, key=lambda item: item.name)
+        ]
+        return JsonResponse(rows[0] if pk is not None else rows, safe=False)
+
+
+class AsyncDashboardView(View):
+    """The home page data, with its independent queries run concurrently."""
+
+    async def get(self, request):
+        if await authenticate(request) is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        today = timezone.localdate()
+        today_purchases, low_ingredients, reorder_count, items, servings = await asyncio.gather(
+            acached(
+                'today_purchases', ('purchase',),
+                lambda: _list(Purchase.objects.between(today, today).select_related('menu_item', 'logged_by')),
+                today,
+            ),
+            acached('low_ingredients', ('ingredient', 'stock'), lambda: _list(reorder.needs_reorder()[:5])),
+            acached('reorder_count', ('ingredient', 'stock'), reorder.needs_reorder().acount),
+            menu_items(),
+            availability.aget_availability(),
+        )
+        return JsonResponse({
+            'today_purchases': [
+                {
+                    'url': _url(request, 'purchase-detail', purchase.pk),
+                    'menu_item': purchase.menu_item.name,
+                    'quantity': purchase.quantity,
+                    'purchase_time': purchase.purchase_time,
+                    'logged_by': purchase.logged_by.username,
+                }
+                for purchase in today_purchases
+            ],
+            'low_ingredients': [_ingredient(request, ingredient) for ingredient in low_ingredients],
+            'reorder_count': reorder_count,
+            'menu_items': [_menu_item(request, item, servings) for item in items],
+        })
+
+
+async def event_stream(last_id=None, types=None):
+    subscription = get_broker().subscribe(last_id)
+    await anext(subscription)  # subscribed before anything is sent
+    yield 'retry: 3000\n\n'
+    async for event in subscription:
+        if event is None:
+            yield ': keepalive\n\n'
+            continue
+        event_id, type, data = event
+        if not types or type in types:
+            yield f'id: {event_id}\nevent: {type}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'
+
+
+class EventStreamView(View):
+    """
+    Server-Sent Events feed of ``sale``, ``stock`` and ``low_stock`` events.
+    ``?types=`` limits it to a comma separated list of event types. Needs an
+    ASGI server: under WSGI the endless stream would never finish the request.
+    """
+
+    async def get(self, request):
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse({'detail': 'The event stream needs the ASGI server.'}, status=501)
+        if await authenticate(request) is None:
+            return JsonResponse({'detail': 'Authentication credentials were not provided.'}, status=401)
+        try:
+            last_id = int(request.headers['Last-Event-ID'])
+        except (KeyError, ValueError):
+            last_id = None
+        types = set(filter(None, request.GET.get('types', '').split(',')))
+        response = StreamingHttpResponse(event_stream(last_id, types), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
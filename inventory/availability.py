@@ -0,0 +1,52 @@
+import math
+from django.db.models import F, FloatField, Min, Q
+from django.db.models.functions import Cast
+from .caching import CATALOGUE, acached, cached
+from .models import MenuItem
+from .units import conversion_factor
+
+
+def _servings():
+    needed = F('recipe_requirements__quantity') * conversion_factor(
+        'recipe_requirements__unit', 'recipe_requirements__ingredient__unit'
+    )
+    return MenuItem.objects.order_by().annotate(
+        servings=Min(
+            Cast('recipe_requirements__ingredient__quantity', FloatField()) / Cast(needed, FloatField()),
+            filter=Q(recipe_requirements__quantity__gt=0),
+        )
+    ).values_list('pk', 'servings')
+
+
+def _floor(servings):
+    return None if servings is None else max(0, math.floor(servings + 1e-9))
+
+
+def compute():
+    """
+    ``{menu_item_id: servings}`` for the whole menu in one query, where
+    servings is how many can be made from current stock. Items without a
+    recipe map to None.
+    """
+    return {pk: _floor(servings) for pk, servings in _servings()}
+
+
+async def acompute():
+    return {pk: _floor(servings) async for pk, servings in _servings()}
+
+
+def get_availability():
+    return cached('availability', CATALOGUE + ('stock',), compute)
+
+
+async def aget_availability():
+    return await acached('availability', CATALOGUE + ('stock',), acompute)
+
+
+def annotate(menu_items):
+    """Set ``available_servings`` on each menu item and return them as a list."""
+    availability = get_availability()
+    menu_items = list(menu_items)
+    for menu_item in menu_items:
+        menu_item.available_servings = availability.get(menu_item.pk)
+    return menu_items
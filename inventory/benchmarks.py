@@ -0,0 +1,198 @@
+import random
+import re
+import statistics
+import threading
+import time
+from datetime import timedelta
+from urllib.parse import urlencode
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.db import DatabaseError, connection, connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import URLPattern, URLResolver
+from django.utils import timezone
+from . import urls
+from .instrumentation import percentile
+from .models import Ingredient, MenuItem, Purchase, Task
+from .synthetic import generate
+
+# Endpoints that cannot be timed with a GET: POST only, never-ending
+# streams, or files that only exist after a background export.
+SKIPPED = {'purchase-bulk', 'live-events', 'export-download'}
+
+# Models whose primary keys fill URLs the views don't name a model for.
+PK_MODELS = {'live-availability-detail': MenuItem, 'task-status': Task}
+
+
+def database_profile():
+    settings = connection.settings_dict
+    profile = {
+        'engine': connection.vendor,
+        'conn_max_age': settings['CONN_MAX_AGE'],
+        'pool': bool(settings['OPTIONS'].get('pool')),
+    }
+    if connection.vendor == 'sqlite':
+        with connection.cursor() as cursor:
+            for pragma in ('journal_mode', 'synchronous', 'busy_timeout'):
+                cursor.execute(f'PRAGMA {pragma}')
+                profile[pragma] = cursor.fetchone()[0]
+    return profile
+
+
+def data_volume():
+    return {
+        'ingredients': Ingredient.objects.count(),
+        'menu_items': MenuItem.objects.count(),
+        'purchases': Purchase.objects.count(),
+    }
+
+
+def _patterns(patterns, prefix=''):
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            yield from _patterns(pattern.url_patterns, prefix + str(pattern.pattern))
+        elif isinstance(pattern, URLPattern) and pattern.name:
+            yield prefix + str(pattern.pattern), pattern
+
+
+def _model(pattern):
+    view = getattr(pattern.callback, 'view_class', None) or getattr(pattern.callback, 'cls', None)
+    queryset = getattr(view, 'queryset', None)
+    return PK_MODELS.get(pattern.name) or getattr(view, 'model', None) or getattr(queryset, 'model', None)
+
+
+def targets():
+    """
+    ``(name, url)`` for every GET endpoint in inventory/urls.py, named like
+    the instrumentation report names them, with path arguments filled from
+    existing rows. Endpoints whose arguments can't be filled are skipped.
+    """
+    seen = set()
+    for route, pattern in _patterns(urls.urlpatterns):
+        name = f'api:{pattern.name}' if route.startswith('api/') else pattern.name
+        if pattern.name in SKIPPED or name in seen or 'format' in route:
+            continue
+        values = {'dataset': 'purchases'}
+        if 'pk' in route:
+            model = _model(pattern)
+            pk = model and model.objects.order_by('pk').values_list('pk', flat=True).first()
+            if pk is None:
+                continue
+            values['pk'] = pk
+        url = '/' + re.sub(r'<(?:\w+:)?(\w+)>|\(\?P<(\w+)>[^)]*\)', lambda m: str(values[m[1] or m[2]]), route)
+        url = url.replace('^', '').replace('$', '')
+        if pattern.name == 'export':
+            url += '?' + urlencode({'start': timezone.localdate() - timedelta(days=7)})
+        elif pattern.name == 'ingredient-stock':
+            url += '?' + urlencode({'at': (timezone.now() - timedelta(hours=2)).isoformat()})
+        seen.add(name)
+        yield name, url
+
+
+def _get(client, url):
+    with CaptureQueriesContext(connection) as queries:
+        started = time.perf_counter()
+        response = client.get(url)
+        if response.streaming:
+            for _ in response.streaming_content:
+                pass
+        elapsed = time.perf_counter() - started
+    return response.status_code, elapsed * 1000, len(queries)
+
+
+def measure(client, url, repeat):
+    """
+    Time one request with an empty cache, then ``repeat`` more with whatever
+    it cached. An error response isn't timed: the result is marked ``failed``.
+    """
+    cache.clear()
+    status, cold, cold_queries = _get(client, url)
+    if status >= 400:
+        return {'url': url, 'status': status, 'failed': True}
+    timings, query_counts = [], []
+    for _ in range(repeat):
+        _, elapsed, queries = _get(client, url)
+        timings.append(elapsed)
+        query_counts.append(queries)
+    timings.sort()
+    return {
+        'url': url,
+        'status': status,
+        'cold_ms': round(cold, 2),
+        'cold_queries': cold_queries,
+        'mean_ms': round(statistics.fmean(timings), 2),
+        'p50_ms': round(percentile(timings, 0.50), 2),
+        'p95_ms': round(percentile(timings, 0.95), 2),
+        'p99_ms': round(percentile(timings, 0.99), 2),
+        'requests_per_second': round(len(timings) / (sum(timings) / 1000), 1),
+        'queries': max(query_counts),
+    }
+
+
+def benchmark_urls(repeat=20, user=None):
+    user = user or User.objects.get_or_create(username='benchmark', defaults={'is_staff': True})[0]
+    client = Client()
+    client.force_login(user)
+    return {name: measure(client, url, repeat) for name, url in targets()}
+
+
+def concurrent_purchases(threads=8, purchases=200, seed=0, keep=False):
+    """
+    Record ``purchases`` purchases from each of ``threads`` threads at once
+    against a freshly seeded menu, removed again afterwards unless ``keep``.
+    """
+    ingredients_before = set(Ingredient.objects.values_list('pk', flat=True))
+    menu_items_before = set(MenuItem.objects.values_list('pk', flat=True))
+    generate(ingredients=50, menu_items=10, purchases=0, days=0, seed=seed)
+    menu_items = list(MenuItem.objects.exclude(pk__in=menu_items_before))
+    user = User.objects.get(username='synthetic')
+    latencies, errors = [], []
+    lock = threading.Lock()
+    barrier = threading.Barrier(threads)
+
+    def register(number):
+        rng = random.Random(seed + number)
+        timings, failures = [], []
+        try:
+            barrier.wait()
+            for _ in range(purchases):
+                started = time.perf_counter()
+                try:
+                    Purchase.objects.create(menu_item=rng.choice(menu_items), quantity=1, logged_by=user)
+                except (DatabaseError, ValidationError) as error:
+                    failures.append(type(error).__name__)
+                else:
+                    timings.append(time.perf_counter() - started)
+        finally:
+            connections.close_all()
+        with lock:
+            latencies.extend(timings)
+            errors.extend(failures)
+
+    try:
+        workers = [threading.Thread(target=register, args=(number,)) for number in range(threads)]
+        started = time.perf_counter()
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        elapsed = time.perf_counter() - started
+    finally:
+        if not keep:
+            MenuItem.objects.exclude(pk__in=menu_items_before).delete()
+            Ingredient.objects.exclude(pk__in=ingredients_before).delete()
+
+    latencies = sorted(latency * 1000 for latency in latencies)
+    return {
+        'threads': threads,
+        'purchases': len(latencies),
+        'seconds': round(elapsed, 3),
+        'purchases_per_second': round(len(latencies) / elapsed, 1),
+        'p50_ms': round(percentile(latencies, 0.50), 2) if latencies else None,
+        'p95_ms': round(percentile(latencies, 0.95), 2) if latencies else None,
+        'max_ms': round(latencies[-1], 2) if latencies else None,
+        'errors': len(errors),
+        'error_types': sorted(set(errors)),
+    }
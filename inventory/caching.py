@@ -0,0 +1,160 @@
+import hashlib
+import time
+from django.conf import settings
+from django.core.cache import cache
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from . import routers
+from .models import Ingredient, MenuItem, Purchase, RecipeRequirement, bulk_changed, stock_changed
+
+PREFIX = 'inventory'
+
+# Cache labels bumped when each model changes. Ingredient saves can change
+# stock as well as catalogue data, purchases only ever change stock.
+MODEL_LABELS = {
+    Ingredient: ('ingredient', 'stock'),
+    MenuItem: ('menuitem',),
+    RecipeRequirement: ('reciperequirement',),
+    Purchase: ('purchase',),
+}
+
+CATALOGUE = ('ingredient', 'menuitem', 'reciperequirement')
+
+
+def _version_key(label):
+    return f'{PREFIX}:version:{label}'
+
+
+def versions(labels):
+    """
+    Current version of each label. Entries are never deleted on invalidation;
+    bumping a version changes every key built from it instead.
+    """
+    keys = [_version_key(label) for label in labels]
+    found = cache.get_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        cache.set_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+async def aversions(labels):
+    keys = [_version_key(label) for label in labels]
+    found = await cache.aget_many(keys)
+    missing = {key: time.time_ns() for key in keys if key not in found}
+    if missing:
+        await cache.aset_many(missing, None)
+        found.update(missing)
+    return [found[key] for key in keys]
+
+
+def bump(*labels):
+    for label in labels:
+        try:
+            cache.incr(_version_key(label))
+        except ValueError:
+            cache.set(_version_key(label), time.time_ns(), None)
+
+
+def _digest(label_versions, parts):
+    return hashlib.md5(repr((label_versions, parts)).encode()).hexdigest()
+
+
+def digest(labels, *parts):
+    return _digest(versions(labels), parts)
+
+
+def make_key(name, labels, *parts):
+    return f'{PREFIX}:{name}:{digest(labels, *parts)}'
+
+
+def _replica_timeout(timeout):
+    # The key holds the versions read before computing, and a lagging replica
+    # may return rows older than those, so what it computed is only kept as
+    # long as writers read from the primary after a write.
+    pin = settings.DATABASE_REPLICA_PIN
+    return pin if timeout is None or timeout is DEFAULT_TIMEOUT or timeout > pin else timeout
+
+
+def cached(name, labels, compute, *parts, timeout=None):
+    """
+    Return ``compute()`` from the cache, recomputing it after any of
+    ``labels`` has been bumped. ``parts`` further distinguish the key.
+    Computes on the current request's replica, if it has one.
+    """
+    key = make_key(name, labels, *parts)
+    if routers.current.get():
+        return cache.get_or_set(key, compute, _replica_timeout(timeout))
+    if timeout is None:
+        return cache.get_or_set(key, compute)
+    return cache.get_or_set(key, compute, timeout)
+
+
+async def acached(name, labels, compute, *parts, timeout=DEFAULT_TIMEOUT):
+    """
+    Async ``cached()`` for a coroutine function ``compute``. Uses the same
+    keys, so sync and async views share entries.
+    """
+    key = f'{PREFIX}:{name}:{_digest(await aversions(labels), parts)}'
+    value = await cache.aget(key)
+    if value is None:
+        value = await compute()
+        await cache.aset(key, value, _replica_timeout(timeout) if routers.current.get() else timeout)
+    return value
+
+
+class ConditionalListMixin:
+    """
+    Caches list responses of a viewset and answers If-None-Match with a 304
+    until one of ``cache_labels`` changes. Misses are computed on the primary:
+    a client holding the ETag gets 304s until the next change, so its body
+    must not come from a lagging replica.
+    """
+    cache_labels = CATALOGUE
+
+    def list(self, request, *args, **kwargs):
+        etag = quote_etag(digest(
+            self.cache_labels, self.basename, request.get_host(), request.get_full_path(), request.accepted_media_type,
+        ))
+        if etag in parse_etags(request.headers.get('If-None-Match', '')):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+        else:
+            key = f'{PREFIX}:response:{etag}'
+            data = cache.get(key)
+            if data is None:
+                with routers.primary():
+                    data = super().list(request, *args, **kwargs).data
+                cache.set(key, data)
+            response = Response(data)
+        response['ETag'] = etag
+        response['Vary'] = 'Accept'
+        return response
+
+
+def bump_on_change(sender, **kwargs):
+    # Bumping before commit would let another request cache the old rows
+    # under the new version.
+    transaction.on_commit(lambda: bump(*MODEL_LABELS[sender]))
+
+
+# Connected per model: a post_delete receiver for every sender would turn off
+# Django's fast delete for cascades into the ledger, snapshots and rollups.
+for model in MODEL_LABELS:
+    post_save.connect(bump_on_change, sender=model)
+    post_delete.connect(bump_on_change, sender=model)
+
+
+@receiver(bulk_changed)
+def bump_on_bulk_change(sender, **kwargs):
+    bump(*MODEL_LABELS[sender])
+
+
+@receiver(stock_changed)
+def bump_on_stock_change(sender, **kwargs):
+    bump('stock')
@@ -0,0 +1,198 @@
+import asyncio
+import itertools
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import cache as memoize
+from django.conf import settings
+from django.core.cache import DEFAULT_CACHE_ALIAS, cache, caches
+from django.core.cache.backends.filebased import FileBasedCache
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+from .caching import PREFIX
+from .models import Ingredient, Purchase, bulk_changed, stock_changed
+
+
+class LocalBroker:
+    """
+    Fans events out to the subscribers of this process. ``publish`` may be
+    called from any thread; each subscriber gets its own bounded queue and
+    loses its oldest events rather than holding up publishers.
+    """
+    def __init__(self, history=100, queue_size=1000):
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._history = deque(maxlen=history)
+        self._subscribers = set()
+        self._queue_size = queue_size
+
+    def publish(self, type, data):
+        with self._lock:
+            event = (next(self._ids), type, data)
+            self._history.append(event)
+            subscribers = list(self._subscribers)
+        for loop, queue in subscribers:
+            try:
+                loop.call_soon_threadsafe(self._offer, queue, event)
+            except RuntimeError:  # the subscriber's loop has closed
+                pass
+
+    @staticmethod
+    def _offer(queue, event):
+        if queue.full():
+            queue.get_nowait()
+        queue.put_nowait(event)
+
+    async def subscribe(self, last_id=None, keepalive=15):
+        """
+        Yield None once subscribed, then ``(id, type, data)`` for every event
+        published from then on, preceded by any still-remembered events after
+        ``last_id``. Yields None again after ``keepalive`` quiet seconds.
+        """
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue(self._queue_size))
+        with self._lock:
+            self._subscribers.add(subscriber)
+            missed = [event for event in self._history if last_id is not None and event[0] > last_id]
+        try:
+            yield None
+            for event in missed:
+                yield event
+            while True:
+                try:
+                    yield await asyncio.wait_for(subscriber[1].get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield None
+        finally:
+            with self._lock:
+                self._subscribers.discard(subscriber)
+
+
+class CacheBroker:
+    """
+    Shares events between processes through the configured cache, so every
+    process's subscribers see every event. Needs a cache shared by all
+    processes whose ``incr`` can't hand two publishers the same id: the file
+    backend, whose publishers take turns under a file lock, or a network
+    cache such as Redis. Subscribers poll the cache, never the database.
+    """
+    def __init__(self, poll_interval=1, retention=300):
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self._sequence_key = f'{PREFIX}:events:sequence'
+
+    def _event_key(self, event_id):
+        return f'{PREFIX}:events:{event_id}'
+
+    @contextmanager
+    def _sequence_lock(self):
+        # The file backend's incr is a separate read and write, so without a
+        # lock two processes could both take the same id.
+        backend = caches[DEFAULT_CACHE_ALIAS]
+        if not isinstance(backend, FileBasedCache):
+            yield
+            return
+        import fcntl
+        os.makedirs(backend._dir, exist_ok=True)
+        with open(os.path.join(backend._dir, 'events.lock'), 'a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+
+    def publish(self, type, data):
+        with self._sequence_lock():
+            cache.add(self._sequence_key, 0, None)
+            event_id = cache.incr(self._sequence_key)
+        cache.set(self._event_key(event_id), (event_id, type, data), self.retention)
+
+    async def subscribe(self, last_id=None, keepalive=15):
+        sequence = await cache.aget(self._sequence_key, 0)
+        if last_id is None or last_id > sequence:
+            last_id = sequence
+        yield None
+        quiet_since = time.monotonic()
+        while True:
+            sequence = await cache.aget(self._sequence_key, 0)
+            if sequence < last_id:  # the sequence was evicted and restarted
+                last_id = 0
+            if sequence > last_id:
+                found = await cache.aget_many([self._event_key(event_id) for event_id in range(last_id + 1, sequence + 1)])
+                for event_id in range(last_id + 1, sequence + 1):
+                    if self._event_key(event_id) in found:
+                        yield found[self._event_key(event_id)]
+                last_id = sequence
+                quiet_since = time.monotonic()
+            elif time.monotonic() - quiet_since >= keepalive:
+                yield None
+                quiet_since = time.monotonic()
+            await asyncio.sleep(self.poll_interval)
+
+
+@memoize
+def get_broker():
+    return import_string(settings.EVENT_BROKER)()
+
+
+def publish(type, data):
+    """Publish once the current transaction commits, so nobody sees rolled back changes."""
+    transaction.on_commit(lambda: get_broker().publish(type, data))
+
+
+def stock_events(ingredient, previous_quantity):
+    """A ``stock`` event, plus ``low_stock`` if this change took it to its reorder point."""
+    data = {
+        'id': ingredient.pk,
+        'name': ingredient.name,
+        'quantity': str(ingredient.quantity),
+        'previous_quantity': None if previous_quantity is None else str(previous_quantity),
+        'unit': ingredient.unit,
+        'reorder_point': str(ingredient.reorder_point),
+    }
+    events = [('stock', data)]
+    if previous_quantity is not None and ingredient.quantity <= ingredient.reorder_point < previous_quantity:
+        events.append(('low_stock', data))
+    return events
+
+
+def sale_event(purchase):
+    return {
+        'id': purchase.pk,
+        'menu_item': purchase.menu_item_id,
+        'quantity': purchase.quantity,
+        'purchase_time': purchase.purchase_time.isoformat(),
+    }
+
+
+@receiver(post_save, sender=Purchase)
+def publish_sale(sender, instance, created, **kwargs):
+    if created:
+        publish('sale', sale_event(instance))
+
+
+@receiver(bulk_changed, sender=Purchase)
+def publish_bulk_sales(sender, purchases=(), **kwargs):
+    # bulk_changed is only sent after commit; archiving sends it without purchases.
+    for purchase in purchases:
+        get_broker().publish('sale', sale_event(purchase))
+
+
+@receiver(post_save, sender=Ingredient)
+def publish_ingredient_change(sender, instance, **kwargs):
+    previous_quantity = getattr(instance, '_loaded_quantity', None)
+    instance._loaded_quantity = instance.quantity
+    if instance.quantity != previous_quantity:
+        for type, data in stock_events(instance, previous_quantity):
+            publish(type, data)
+
+
+@receiver(stock_changed)
+def publish_stock_change(sender, ingredients=(), **kwargs):
+    # stock_changed is only sent after commit.
+    for ingredient in ingredients:
+        for type, data in stock_events(ingredient, ingredient.previous_quantity):
+            get_broker().publish(type, data)
@@ -0,0 +1,85 @@
+import csv
+import json
+from itertools import chain
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import ExpressionWrapper, F
+from . import archive
+from .models import DailySales, Ingredient, Purchase, RecipeRequirement
+from .reports import MONEY
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object whose write() hands the row back to the caller."""
+    def write(self, value):
+        return value
+
+
+def _rows(queryset, using):
+    return queryset.using(using).iterator(chunk_size=CHUNK_SIZE)
+
+
+def purchases(start=None, end=None, using=None):
+    # Archived months come first: they are all older than the purchase table.
+    archived = (
+        (pk, purchase_time, menu_item_id, menu_item, quantity, logged_by)
+        for pk, purchase_time, menu_item_id, menu_item, quantity, _, logged_by in archive.purchases(start, end)
+    )
+    queryset = Purchase.objects.between(start, end).order_by('purchase_time', 'id')
+    return chain(archived, _rows(
+        queryset.values_list('id', 'purchase_time', 'menu_item_id', 'menu_item__name', 'quantity', 'logged_by__username'), using,
+    ))
+
+
+def ingredients(start=None, end=None, using=None):
+    return _rows(Ingredient.objects.order_by('id').values_list('id', 'name', 'quantity', 'unit', 'unit_price'), using)
+
+
+def recipe_requirements(start=None, end=None, using=None):
+    return _rows(RecipeRequirement.objects.order_by('id').values_list(
+        'id', 'menu_item_id', 'menu_item__name', 'ingredient_id', 'ingredient__name', 'quantity', 'unit'
+    ), using)
+
+
+def profit(start=None, end=None, using=None):
+    queryset = DailySales.objects.order_by('day', 'menu_item_id')
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lte=end)
+    return _rows(queryset.annotate(profit=ExpressionWrapper(F('revenue') - F('cost'), output_field=MONEY)).values_list(
+        'day', 'menu_item_id', 'menu_item__name', 'units_sold', 'revenue', 'cost', 'profit'
+    ), using)
+
+
+DATASETS = {
+    'purchases': (purchases, ['id', 'purchase_time', 'menu_item_id', 'menu_item', 'quantity', 'logged_by']),
+    'ingredients': (ingredients, ['id', 'name', 'quantity', 'unit', 'unit_price']),
+    'recipe-requirements': (recipe_requirements, ['id', 'menu_item_id', 'menu_item', 'ingredient_id', 'ingredient', 'quantity', 'unit']),
+    'profit': (profit, ['day', 'menu_item_id', 'menu_item', 'units_sold', 'revenue', 'cost', 'profit']),
+}
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def stream(dataset, fmt, start=None, end=None, using=None):
+    """
+    Yield ``dataset`` encoded as ``fmt`` one row at a time, reading the
+    database in chunks so memory stays flat however many rows there are.
+    ``using`` names the database to read; the rows are only read once the
+    response is being sent, after the request's replica routing has ended.
+    """
+    query, columns = DATASETS[dataset]
+    rows = query(start=start, end=end, using=using)
+    if fmt == 'csv':
+        writer = csv.writer(Echo())
+        yield writer.writerow(columns)
+        for row in rows:
+            yield writer.writerow(row)
+    else:
+        for row in rows:
+            yield json.dumps(dict(zip(columns, row)), cls=DjangoJSONEncoder) + '\n'
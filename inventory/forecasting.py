@@ -0,0 +1,157 @@
+from datetime import timedelta
+import numpy as np
+from django.utils import timezone
+from .caching import CATALOGUE, cached
+from .models import DailySales, Ingredient, MenuItem, RecipeRequirement
+from .units import can_convert, factor
+
+# Forecasts only use sales up to yesterday, so one a day per window would do;
+# the timeout picks up rollups for yesterday still being applied after midnight.
+TIMEOUT = 60 * 60
+
+
+def sales_history(menu_item_ids, first_day, days):
+    """
+    ``(menu items, days)`` array of units sold on each day from ``first_day``,
+    read from the daily sales rollups in one query. Days without a rollup
+    row had no sales.
+    """
+    index = {pk: i for i, pk in enumerate(menu_item_ids)}
+    rows = (
+        DailySales.objects.filter(day__gte=first_day, day__lt=first_day + timedelta(days=days))
+        .order_by()
+        .values_list('menu_item_id', 'day', 'units_sold')
+    )
+    cells = [(index[menu_item_id], (day - first_day).days, units) for menu_item_id, day, units in rows.iterator(chunk_size=10000) if menu_item_id in index]
+    sales = np.zeros((len(menu_item_ids), days))
+    if cells:
+        items, offsets, units = np.array(cells).T
+        sales[items, offsets] = units
+    return sales
+
+
+def weekday_baselines(sales, first_day, half_life_weeks=4):
+    """
+    ``(menu items, 7)`` array of each item's expected sales on each weekday,
+    Monday first: the mean of its past sales on that weekday, with weights
+    halving every ``half_life_weeks``. ``sales`` covers whole weeks from
+    ``first_day``. Days before an item first sold are left out, so a new
+    item isn't averaged down by the months it wasn't on the menu.
+    """
+    items, days = sales.shape
+    weeks = days // 7
+    on_menu = np.logical_or.accumulate(sales > 0, axis=1).reshape(items, weeks, 7)
+    weights = on_menu * (0.5 ** (np.arange(weeks)[::-1] / half_life_weeks))[:, None]
+    totals = (sales.reshape(items, weeks, 7) * weights).sum(axis=1)
+    norms = weights.sum(axis=1)
+    baselines = np.divide(totals, norms, out=np.zeros_like(totals), where=norms > 0)
+    # Column j holds the weekday of first_day + j days.
+    return np.roll(baselines, first_day.weekday(), axis=1)
+
+
+def recipe_matrix(menu_item_ids, ingredient_ids, skipped=None):
+    """
+    ``(menu items, ingredients)`` array of the stock, in each ingredient's
+    own unit, one serving uses. Recipe lines whose unit can't be converted
+    to their ingredient's are left out, and appended to ``skipped`` if given.
+    """
+    items = {pk: i for i, pk in enumerate(menu_item_ids)}
+    ingredients = {pk: j for j, pk in enumerate(ingredient_ids)}
+    matrix = np.zeros((len(items), len(ingredients)))
+    requirements = RecipeRequirement.objects.order_by().values_list(
+        'menu_item_id', 'ingredient_id', 'quantity', 'unit', 'ingredient__unit', 'menu_item__name', 'ingredient__name',
+    )
+    for menu_item_id, ingredient_id, quantity, unit, stock_unit, menu_item, ingredient in requirements:
+        if menu_item_id not in items or ingredient_id not in ingredients:
+            continue
+        if not can_convert(unit, stock_unit):
+            if skipped is not None:
+                skipped.append({'menu_item': menu_item, 'ingredient': ingredient, 'unit': unit, 'stock_unit': stock_unit})
+            continue
+        matrix[items[menu_item_id], ingredients[ingredient_id]] += float(quantity * factor(unit, stock_unit))
+    return matrix
+
+
+def _project(today, start, days, history_weeks, half_life_weeks):
+    menu_items = list(MenuItem.objects.order_by('name').values_list('pk', 'name'))
+    ingredients = list(Ingredient.objects.order_by('name').values_list('pk', 'name', 'unit'))
+    menu_item_ids = [pk for pk, _ in menu_items]
+    first_day = today - timedelta(weeks=history_weeks)
+    baselines = weekday_baselines(sales_history(menu_item_ids, first_day, history_weeks * 7), first_day, half_life_weeks)
+    dates = [start + timedelta(days=offset) for offset in range(days)]
+    servings = baselines[:, [day.weekday() for day in dates]].T
+    skipped = []
+    return {
+        'dates': dates,
+        'menu_items': menu_items,
+        'ingredients': ingredients,
+        'servings': servings,
+        'usage': servings @ recipe_matrix(menu_item_ids, [pk for pk, _, _ in ingredients], skipped),
+        'skipped': skipped,
+    }
+
+
+def project(start=None, days=7, history_weeks=52, half_life_weeks=4):
+    """
+    Forecast the servings of every menu item (``servings``, days × menu
+    items) and the stock they use (``usage``, days × ingredients) on each of
+    ``days`` days from ``start``, tomorrow by default. Baselines come from
+    the last ``history_weeks`` weeks of sales up to yesterday. Recipe lines
+    that can't be converted are listed in ``skipped`` and left out of the
+    usage. Cached until the catalogue changes or the day ends.
+    """
+    today = timezone.localdate()
+    start = start or today + timedelta(days=1)
+    return cached(
+        'forecast', CATALOGUE, lambda: _project(today, start, days, history_weeks, half_life_weeks),
+        today, start, days, history_weeks, half_life_weeks, timeout=TIMEOUT,
+    )
+
+
+def prep_list(projection, day=0):
+    """Forecast servings of each menu item, and the stock of each ingredient they use, on one day of a projection."""
+    servings = projection['servings'][day]
+    usage = projection['usage'][day]
+    return {
+        'date': projection['dates'][day],
+        'menu_items': sorted(
+            (
+                {'id': pk, 'name': name, 'servings': round(float(amount), 1)}
+                for (pk, name), amount in zip(projection['menu_items'], servings) if amount >= 0.05
+            ),
+            key=lambda row: -row['servings'],
+        ),
+        'ingredients': [
+            {'id': pk, 'name': name, 'unit': unit, 'quantity': round(float(amount), 3)}
+            for (pk, name, unit), amount in zip(projection['ingredients'], usage) if amount >= 0.0005
+        ],
+    }
+
+
+def shortfalls(projection):
+    """
+    Ingredients whose current stock won't last the projection, with the day
+    they run out and how much more is needed, soonest first.
+    """
+    ingredients = projection['ingredients']
+    if not projection['dates'] or not ingredients:
+        return []
+    in_stock = dict(Ingredient.objects.values_list('pk', 'quantity'))
+    stock = np.array([float(in_stock.get(pk, 0)) for pk, _, _ in ingredients])
+    used = projection['usage'].cumsum(axis=0)
+    short = (used > stock + 0.0005) & (used > 0)
+    runs_out = short.argmax(axis=0)
+    rows = [
+        {
+            'id': ingredients[j][0],
+            'name': ingredients[j][1],
+            'unit': ingredients[j][2],
+            'in_stock': round(float(stock[j]), 3),
+            'needed': round(float(used[-1, j]), 3),
+            'short_by': round(float(used[-1, j] - stock[j]), 3),
+            'runs_out': projection['dates'][runs_out[j]],
+        }
+        for j in np.flatnonzero(short[-1])
+        if ingredients[j][0] in in_stock
+    ]
+    return sorted(rows, key=lambda row: (row['runs_out'], row['name']))
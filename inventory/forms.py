@@ -1,7 +1,7 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm, UserChangeForm, PasswordChangeForm
 from django.contrib.auth.models import User
-from .models import Ingredient, MenuItem, RecipeRequirement, Purchase
+from .models import Ingredient, MenuItem, RecipeRequirement, Purchase, StockMovement
 
 class CustomUserCreationForm(UserCreationForm):
     first_name = forms.CharField(max_length=30, required=True, help_text='Required.')
@@ -27,7 +27,7 @@ class CustomPasswordChangeForm(PasswordChangeForm):
 class IngredientForm(forms.ModelForm):
     class Meta:
         model = Ingredient
-        fields = ['name', 'quantity', 'unit', 'unit_price']
+        fields = ['name', 'quantity', 'unit', 'unit_price', 'lead_time_days']
 
 class MenuItemForm(forms.ModelForm):
     class Meta:
@@ -37,9 +37,48 @@ class MenuItemForm(forms.ModelForm):
 class RecipeRequirementForm(forms.ModelForm):
     class Meta:
         model = RecipeRequirement
-        fields = ['menu_item', 'ingredient', 'quantity']
+        fields = ['menu_item', 'ingredient', 'quantity', 'unit']
 
 class PurchaseForm(forms.ModelForm):
     class Meta:
         model = Purchase
-        fields = ['menu_item', 'quantity']
\ No newline at end of file
+        fields = ['menu_item', 'quantity']
+
+class StockMovementForm(forms.ModelForm):
+    class Meta:
+        model = StockMovement
+        fields = ['ingredient', 'kind', 'quantity', 'note']
+        help_texts = {
+            'quantity': 'Amount received or thrown away, in the ingredient\'s unit. Adjustments can be negative.',
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Sales are only ever recorded by purchases.
+        self.fields['kind'].choices = [choice for choice in self.fields['kind'].choices if choice[0] != StockMovement.SALE]
+
+    def clean(self):
+        cleaned_data = super().clean()
+        kind, quantity = cleaned_data.get('kind'), cleaned_data.get('quantity')
+        if kind in (StockMovement.RESTOCK, StockMovement.WASTE) and quantity is not None and quantity <= 0:
+            self.add_error('quantity', 'Enter a positive amount.')
+        return cleaned_data
+
+    def signed_quantity(self):
+        quantity = self.cleaned_data['quantity']
+        return -quantity if self.cleaned_data['kind'] == StockMovement.WASTE else quantity
+
+class ImportForm(forms.Form):
+    FORMATS = ('csv', 'json', 'ndjson')
+
+    file = forms.FileField(help_text='A .csv, .json or .ndjson file.')
+    dry_run = forms.BooleanField(required=False, help_text='Validate the file without saving anything.')
+
+    def clean_file(self):
+        upload = self.cleaned_data['file']
+        if upload.name.rsplit('.', 1)[-1].lower() not in self.FORMATS:
+            raise forms.ValidationError('Upload a .csv, .json or .ndjson file.')
+        return upload
+
+    def get_format(self):
+        return self.cleaned_data['file'].name.rsplit('.', 1)[-1].lower()
@@ -0,0 +1,211 @@
+import csv
+import json
+import time
+from decimal import Decimal, InvalidOperation
+from django.db import transaction
+from django.utils import timezone
+from .models import Ingredient, MenuItem, RecipeRequirement, StockMovement, bulk_changed
+from .units import can_convert
+
+UNITS = [choice[0] for choice in Ingredient.UNIT_CHOICES]
+
+
+class ImportResult:
+    def __init__(self):
+        self.rows = 0
+        self.created = 0
+        self.updated = 0
+        self.errors = []
+        self.elapsed = 0.0
+
+    @property
+    def rows_per_second(self):
+        return self.rows / self.elapsed if self.elapsed else 0.0
+
+    def __str__(self):
+        return (
+            f'{self.rows} rows read, {self.created} created, {self.updated} updated, '
+            f'{len(self.errors)} errors in {self.elapsed:.2f}s ({self.rows_per_second:.0f} rows/s)'
+        )
+
+
+def read_rows(stream, fmt):
+    """
+    Yield ``(line, row)`` pairs from a text stream. CSV and NDJSON are
+    read lazily; JSON must hold a single list and is loaded whole. An NDJSON
+    line that isn't valid JSON is yielded as its ValueError, to be reported
+    with the other row errors.
+    """
+    if fmt == 'csv':
+        for line, row in enumerate(csv.DictReader(stream), start=2):
+            yield line, row
+    elif fmt == 'ndjson':
+        for line, text in enumerate(stream, start=1):
+            if text.strip():
+                try:
+                    row = json.loads(text)
+                except ValueError as e:
+                    row = ValueError(f'invalid JSON: {e}')
+                yield line, row
+    elif fmt == 'json':
+        for line, row in enumerate(json.load(stream), start=1):
+            yield line, row
+    else:
+        raise ValueError(f'Unsupported format: {fmt}')
+
+
+def _batches(iterable, size):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _text(row, field):
+    value = str(row.get(field) or '').strip()
+    if not value:
+        raise ValueError(f'{field} is required')
+    return value
+
+
+def _decimal(row, field, minimum=None):
+    try:
+        value = Decimal(_text(row, field))
+    except InvalidOperation:
+        raise ValueError(f'{field} must be a number')
+    if minimum is not None and value < minimum:
+        raise ValueError(f'{field} cannot be less than {minimum}')
+    return value
+
+
+def _parsed(rows, parse, result):
+    for line, row in rows:
+        result.rows += 1
+        try:
+            if isinstance(row, ValueError):
+                raise row
+            if not isinstance(row, dict):
+                raise ValueError('row must be an object')
+            yield parse(row)
+        except ValueError as e:
+            result.errors.append((line, str(e)))
+
+
+def _upsert(model, items, lookup, fields, batch_size, result):
+    """
+    Insert or update ``(key, instance)`` pairs in batches. ``lookup`` maps
+    keys to existing primary keys and is extended with the created rows.
+    """
+    now = timezone.now()
+    for batch in _batches(items, batch_size):
+        to_create, to_update = {}, []
+        for key, instance in dict(batch).items():
+            if key in lookup:
+                instance.pk = lookup[key]
+                if hasattr(instance, 'updated_at'):
+                    instance.updated_at = now
+                to_update.append(instance)
+            else:
+                to_create[key] = instance
+        model.objects.bulk_update(to_update, fields, batch_size=batch_size)
+        model.objects.bulk_create(to_create.values(), batch_size=batch_size)
+        for key, instance in to_create.items():
+            lookup[key] = instance.pk
+        result.created += len(to_create)
+        result.updated += len(to_update)
+
+
+def import_ingredients(rows, result, batch_size):
+    def parse(row):
+        unit = _text(row, 'unit')
+        if unit not in UNITS:
+            raise ValueError(f'unit must be one of {", ".join(UNITS)}')
+        name = _text(row, 'name')
+        stranded = sorted(recipe_unit for recipe_unit in recipe_units.get(lookup.get(name), ()) if not can_convert(recipe_unit, unit))
+        if stranded:
+            raise ValueError(f'recipes use {", ".join(stranded)} of {name!r}, which cannot be converted to {unit}')
+        return name, Ingredient(
+            name=name,
+            quantity=_decimal(row, 'quantity', minimum=0),
+            unit=unit,
+            unit_price=_decimal(row, 'unit_price', minimum=0),
+        )
+
+    # Locked until the import commits, so the ledger entries match the stock.
+    previous = dict(Ingredient.objects.select_for_update().values_list('pk', 'quantity'))
+    lookup = dict(Ingredient.objects.values_list('name', 'pk'))
+    recipe_units = Ingredient.objects.recipe_units()
+    fields = ['quantity', 'unit', 'unit_price', 'updated_at']
+    _upsert(Ingredient, _parsed(rows, parse, result), lookup, fields, batch_size, result)
+    changes = (
+        StockMovement.objects.difference(pk, previous.get(pk), quantity, note='Import')
+        for pk, quantity in Ingredient.objects.values_list('pk', 'quantity').iterator()
+    )
+    StockMovement.objects.bulk_create(filter(None, changes), batch_size=batch_size)
+
+
+def import_menu_items(rows, result, batch_size):
+    def parse(row):
+        name = _text(row, 'name')
+        return name, MenuItem(name=name, price=_decimal(row, 'price', minimum=0), image_url=row.get('image_url') or None)
+
+    lookup = dict(MenuItem.objects.values_list('name', 'pk'))
+    _upsert(MenuItem, _parsed(rows, parse, result), lookup, ['price', 'image_url', 'updated_at'], batch_size, result)
+
+
+def import_recipe_requirements(rows, result, batch_size):
+    menu_items = dict(MenuItem.objects.values_list('name', 'pk'))
+    ingredients = dict(Ingredient.objects.values_list('name', 'pk'))
+    ingredient_units = dict(Ingredient.objects.values_list('pk', 'unit'))
+
+    def parse(row):
+        menu_item, ingredient = _text(row, 'menu_item'), _text(row, 'ingredient')
+        if menu_item not in menu_items:
+            raise ValueError(f'unknown menu item {menu_item!r}')
+        if ingredient not in ingredients:
+            raise ValueError(f'unknown ingredient {ingredient!r}')
+        unit = str(row.get('unit') or '').strip()
+        if not can_convert(unit, ingredient_units[ingredients[ingredient]]):
+            raise ValueError(f'unit {unit!r} cannot be converted to the unit {ingredient!r} is stocked in')
+        key = (menu_items[menu_item], ingredients[ingredient])
+        return key, RecipeRequirement(
+            menu_item_id=key[0], ingredient_id=key[1], quantity=_decimal(row, 'quantity', minimum=0), unit=unit
+        )
+
+    lookup = {
+        (menu_item_id, ingredient_id): pk
+        for pk, menu_item_id, ingredient_id in RecipeRequirement.objects.values_list('pk', 'menu_item_id', 'ingredient_id')
+    }
+    _upsert(RecipeRequirement, _parsed(rows, parse, result), lookup, ['quantity', 'unit'], batch_size, result)
+
+
+IMPORTERS = {
+    'ingredients': (Ingredient, import_ingredients),
+    'menu-items': (MenuItem, import_menu_items),
+    'recipe-requirements': (RecipeRequirement, import_recipe_requirements),
+}
+
+
+def run_import(kind, stream, fmt, batch_size=1000, dry_run=False):
+    """
+    Upsert rows of ``kind`` from ``stream`` in one transaction, keyed on names.
+    Invalid rows are skipped and reported; a dry run rolls everything back.
+    """
+    result = ImportResult()
+    started = time.perf_counter()
+    model, importer = IMPORTERS[kind]
+    with transaction.atomic():
+        importer(read_rows(stream, fmt), result, batch_size)
+        # bulk writes skip the signals that keep recipe costs and caches current
+        MenuItem.objects.refresh_unit_costs()
+        if dry_run:
+            transaction.set_rollback(True)
+        else:
+            transaction.on_commit(lambda: bulk_changed.send(sender=model))
+            transaction.on_commit(lambda: bulk_changed.send(sender=MenuItem))
+    result.elapsed = time.perf_counter() - started
+    return result
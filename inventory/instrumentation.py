@@ -0,0 +1,221 @@
+import json
+import logging
+import math
+import os
+import socket
+import threading
+import time
+from collections import Counter, defaultdict, deque
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from .caching import PREFIX
+
+logger = logging.getLogger('inventory.performance')
+
+# Metrics of the request being handled. Context variables follow the request
+# into sync_to_async threads, so async views' queries are counted too.
+current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+    __slots__ = ('started', 'queries', 'db_time', 'render_time', 'statements')
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.render_time = 0.0
+        self.statements = Counter()
+
+    def duplicates(self):
+        """Queries that repeated an earlier one with the same SQL and parameters."""
+        return sum(count - 1 for count in self.statements.values())
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.db_time += time.perf_counter() - started
+        metrics.queries += 1
+        if not many:
+            try:
+                metrics.statements[(sql, tuple(params or ()))] += 1
+            except TypeError:  # unhashable parameters are never compared
+                pass
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+class Recorder:
+    """
+    Keeps the last ``window`` samples per view in this process and copies
+    them to the cache every ``flush_interval`` seconds, so the report can
+    combine every process's samples.
+    """
+    def __init__(self, window=1000, flush_interval=10):
+        self.window = window
+        self.flush_interval = flush_interval
+        self.samples = defaultdict(lambda: deque(maxlen=self.window))
+        self.lock = threading.Lock()
+        self.flushed_at = time.monotonic()
+        self.key = f'{PREFIX}:performance:{socket.gethostname()}:{os.getpid()}'
+        self.registry_key = f'{PREFIX}:performance:processes'
+
+    def add(self, view, sample):
+        """Record a sample; returns a snapshot to pass to flush() when one is due."""
+        with self.lock:
+            self.samples[view].append(sample)
+            if time.monotonic() - self.flushed_at < self.flush_interval:
+                return None
+            self.flushed_at = time.monotonic()
+            return {view: list(samples) for view, samples in self.samples.items()}
+
+    def flush(self, snapshot=None):
+        if snapshot is None:
+            with self.lock:
+                snapshot = {view: list(samples) for view, samples in self.samples.items()}
+        cache.set(self.key, snapshot, 3600)
+        processes = cache.get(self.registry_key, set())
+        if self.key not in processes:
+            cache.set(self.registry_key, processes | {self.key}, None)
+
+    def collect(self):
+        """Samples per view from every process that flushed in the last hour."""
+        self.flush()
+        processes = cache.get(self.registry_key, set())
+        merged = defaultdict(list)
+        for snapshot in cache.get_many(processes).values():
+            for view, samples in snapshot.items():
+                merged[view].extend(samples)
+        return merged
+
+    def clear(self):
+        with self.lock:
+            self.samples.clear()
+        cache.delete_many(cache.get(self.registry_key, set()) | {self.registry_key})
+
+
+recorder = Recorder()
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(len(ordered) * fraction) - 1)] if ordered else None
+
+
+def summarize(samples):
+    """One row per view: request count, duration percentiles and query averages, slowest p95 first."""
+    rows = []
+    for view, view_samples in samples.items():
+        durations = sorted(sample[0] for sample in view_samples)
+        count = len(view_samples)
+        rows.append({
+            'view': view,
+            'count': count,
+            'p50': percentile(durations, 0.50),
+            'p95': percentile(durations, 0.95),
+            'p99': percentile(durations, 0.99),
+            'queries': sum(sample[1] for sample in view_samples) / count,
+            'max_queries': max(sample[1] for sample in view_samples),
+            'db_time': sum(sample[2] for sample in view_samples) / count,
+            'render_time': sum(sample[3] for sample in view_samples) / count,
+            'duplicates': sum(sample[4] for sample in view_samples) / count,
+        })
+    return sorted(rows, key=lambda row: row['p95'], reverse=True)
+
+
+class InstrumentationMiddleware:
+    """
+    Times every request, its SQL and its template rendering, and reports
+    them as a Server-Timing header, one structured log line and a sample for
+    the performance report. Put it first in MIDDLEWARE.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        snapshot = self.finish(request, response, metrics)
+        if snapshot is not None:
+            recorder.flush(snapshot)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        snapshot = self.finish(request, response, metrics)
+        if snapshot is not None:
+            await sync_to_async(recorder.flush)(snapshot)
+        return response
+
+    def process_template_response(self, request, response):
+        metrics = current.get()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    def finish(self, request, response, metrics):
+        """Record, log and annotate the response; returns a recorder snapshot if one is due to be flushed."""
+        duration = time.perf_counter() - metrics.started
+        match = request.resolver_match
+        if match is None:
+            view = '<unresolved>'
+        else:
+            # The API router reuses the page URL names (ingredient-list and so on).
+            view = f'api:{match.view_name}' if match.route.startswith('api/') else match.view_name
+        duplicates = metrics.duplicates()
+        snapshot = recorder.add(view, (duration * 1000, metrics.queries, metrics.db_time * 1000, metrics.render_time * 1000, duplicates))
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = ', '.join([
+                f'db;dur={metrics.db_time * 1000:.1f};desc="{metrics.queries} queries, {duplicates} duplicates"',
+                f'render;dur={metrics.render_time * 1000:.1f}',
+                f'total;dur={duration * 1000:.1f}',
+            ])
+        if logger.isEnabledFor(logging.INFO):
+            logger.info(json.dumps({
+                'view': view,
+                'method': request.method,
+                'path': request.path,
+                'status': response.status_code,
+                'duration_ms': round(duration * 1000, 2),
+                'queries': metrics.queries,
+                'db_ms': round(metrics.db_time * 1000, 2),
+                'duplicate_queries': duplicates,
+                'render_ms': round(metrics.render_time * 1000, 2),
+            }))
+        return snapshot
@@ -0,0 +1,57 @@
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from inventory import archive
+from inventory.models import Purchase, PurchaseArchive, start_of_day
+
+
+class Command(BaseCommand):
+    help = (
+        'Move whole months of old purchases out of the purchase table into gzipped CSV files under '
+        'ARCHIVE_ROOT. Reports, exports and rollup rebuilds keep reading them; the purchase pages and '
+        'API only list purchases still in the table.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--keep-months', type=int, default=12, help='Full months to keep besides the current one.')
+        parser.add_argument('--before', type=date.fromisoformat, help='Archive months before this date instead (YYYY-MM-DD).')
+        parser.add_argument('--restore', metavar='YYYY-MM', help='Move an archived month back into the purchase table.')
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            return self.restore(options['restore'], options['batch_size'])
+        if options['before']:
+            cutoff = start_of_day(options['before'].replace(day=1))
+        else:
+            month = timezone.localdate().replace(day=1)
+            for _ in range(options['keep_months']):
+                month = (month - timedelta(days=1)).replace(day=1)
+            cutoff = start_of_day(month)
+        months = Purchase.objects.filter(purchase_time__lt=cutoff).datetimes('purchase_time', 'month')
+        archived = 0
+        for month in months:
+            moved = archive.archive_month(month, batch_size=options['batch_size'])
+            if moved is not None:
+                archived += moved.rows
+                self.stdout.write(f'{month:%Y-%m}: {moved.rows} purchases to {moved.file}')
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} purchases made before {timezone.localdate(cutoff)}.'))
+
+    def restore(self, period, batch_size):
+        try:
+            month = date.fromisoformat(f'{period}-01')
+        except ValueError:
+            raise CommandError('Give the month to restore as YYYY-MM.')
+        archives = list(PurchaseArchive.objects.filter(period=month))
+        if not archives:
+            raise CommandError(f'No archive for {period}.')
+        restored = skipped = 0
+        for item in archives:
+            counts = archive.restore(item, batch_size=batch_size)
+            restored += counts[0]
+            skipped += counts[1]
+        self.stdout.write(self.style.SUCCESS(f'Restored {restored} purchases from {period}.'))
+        if skipped:
+            self.stdout.write(self.style.WARNING(
+                f'{skipped} purchases of deleted menu items or users were left in the archive.'
+            ))
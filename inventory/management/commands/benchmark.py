@@ -0,0 +1,84 @@
+import json
+import platform
+import django
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from django.utils import timezone
+from inventory import benchmarks
+
+
+class Command(BaseCommand):
+    help = (
+        'Time every page and API endpoint in inventory/urls.py and the concurrent purchase path '
+        'against the current database, and write the results as JSON. Load data with generate_data first.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', default='benchmark.json', help='JSON file to write the results to.')
+        parser.add_argument('--label', default='', help='Stored with the results, e.g. a version or commit.')
+        parser.add_argument('--repeat', type=int, default=20, help='Timed requests per URL after the first.')
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent registers for the purchase benchmark.')
+        parser.add_argument('--purchases', type=int, default=100, help='Purchases written by each register.')
+        parser.add_argument('--skip-writes', action='store_true', help='Leave out the purchase benchmark.')
+        parser.add_argument('--compare', help='Earlier results file to compare against.')
+        parser.add_argument('--threshold', type=float, default=0.2, help='Relative slowdown reported as a regression.')
+
+    def handle(self, *args, **options):
+        results = {
+            'label': options['label'],
+            'timestamp': timezone.now().isoformat(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': benchmarks.database_profile(),
+            'data': benchmarks.data_volume(),
+        }
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'], SERVER_TIMING=False):
+            results['urls'] = benchmarks.benchmark_urls(options['repeat'])
+        for name, row in results['urls'].items():
+            if row.get('failed'):
+                self.stdout.write(self.style.ERROR(f"{name:<32} {row['status']}  not timed: {row['url']} failed"))
+                continue
+            self.stdout.write(
+                f"{name:<32} {row['status']}  p50 {row['p50_ms']:>8.2f} ms  p95 {row['p95_ms']:>8.2f} ms  "
+                f"cold {row['cold_ms']:>8.2f} ms  {row['queries']:>3} queries"
+            )
+        if not options['skip_writes']:
+            results['purchases'] = benchmarks.concurrent_purchases(options['threads'], options['purchases'])
+            self.stdout.write(
+                f"purchases: {results['purchases']['purchases_per_second']} /s with {options['threads']} threads, "
+                f"p95 {results['purchases']['p95_ms']} ms, {results['purchases']['errors']} errors"
+            )
+        with open(options['output'], 'w') as f:
+            json.dump(results, f, indent=2)
+        self.stdout.write(self.style.SUCCESS(f"Wrote {options['output']}"))
+        if options['compare']:
+            with open(options['compare']) as f:
+                self.compare(json.load(f), results, options['threshold'])
+
+    def compare(self, before, after, threshold):
+        regressions = 0
+        for name, row in after['urls'].items():
+            previous = before.get('urls', {}).get(name)
+            if previous is None or previous.get('failed'):
+                continue
+            if row.get('failed'):
+                regressions += 1
+                self.stdout.write(self.style.WARNING(f"{name}: now fails with status {row['status']}"))
+                continue
+            slower = row['p95_ms'] > previous['p95_ms'] * (1 + threshold)
+            more_queries = row['queries'] > previous['queries']
+            if slower or more_queries:
+                regressions += 1
+                self.stdout.write(self.style.WARNING(
+                    f"{name}: p95 {previous['p95_ms']} -> {row['p95_ms']} ms, queries {previous['queries']} -> {row['queries']}"
+                ))
+        if 'purchases' in before and 'purchases' in after:
+            rate_before, rate_after = before['purchases']['purchases_per_second'], after['purchases']['purchases_per_second']
+            if rate_after < rate_before * (1 - threshold):
+                regressions += 1
+                self.stdout.write(self.style.WARNING(f'purchases: {rate_before} -> {rate_after} /s'))
+        if regressions:
+            self.stdout.write(self.style.WARNING(f"{regressions} regressions against {before.get('label') or 'the earlier run'}."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"No regressions against {before.get('label') or 'the earlier run'}."))
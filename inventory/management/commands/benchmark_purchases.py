@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+from inventory.benchmarks import concurrent_purchases, database_profile
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure purchase-write throughput with several registers writing at once. '
+        'Run it under each DATABASE_* profile to compare them; it seeds its own '
+        'menu and removes it afterwards.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=8, help='Concurrent registers.')
+        parser.add_argument('--purchases', type=int, default=200, help='Purchases written by each register.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--keep', action='store_true', help='Keep the seeded menu and purchases.')
+
+    def handle(self, *args, **options):
+        self.stdout.write(f'Profile: {database_profile()}')
+        results = concurrent_purchases(options['threads'], options['purchases'], options['seed'], options['keep'])
+        self.stdout.write(self.style.MIGRATE_HEADING(
+            f"{results['purchases']} purchases in {results['seconds']:.2f} s: {results['purchases_per_second']} purchases/s"
+        ))
+        if results['purchases']:
+            self.stdout.write(f"Latency median {results['p50_ms']} ms, p95 {results['p95_ms']} ms, max {results['max_ms']} ms")
+        if results['errors']:
+            self.stdout.write(self.style.WARNING(f"{results['errors']} failed writes: {results['error_types']}"))
@@ -0,0 +1,64 @@
+import statistics
+import time
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.utils import timezone
+from inventory.models import Ingredient, MenuItem, Purchase, RecipeRequirement
+from inventory.reorder import needs_reorder
+from inventory.synthetic import generate
+
+
+class Rollback(Exception):
+    pass
+
+
+def hot_queries():
+    today = timezone.localdate()
+    menu_item = MenuItem.objects.order_by('pk').first()
+    requirement = RecipeRequirement.objects.order_by('pk').first()
+    queries = {
+        'dashboard purchases (legacy __date lookup)': Purchase.objects.filter(purchase_time__date=today),
+        'dashboard purchases (range lookup)': Purchase.objects.between(today, today),
+        'latest purchases page': Purchase.objects.order_by('-purchase_time', '-id')[:100],
+        'menu item sales for a month': Purchase.objects.filter(menu_item=menu_item).between(today.replace(day=1), today),
+        'ingredients to reorder': needs_reorder()[:5],
+        'ingredient list': Ingredient.objects.order_by('name')[:100],
+        'menu list': MenuItem.objects.order_by('name')[:100],
+    }
+    if requirement:
+        queries['recipe line lookup'] = RecipeRequirement.objects.filter(
+            menu_item_id=requirement.menu_item_id, ingredient_id=requirement.ingredient_id,
+        )
+    return queries
+
+
+class Command(BaseCommand):
+    help = (
+        'Print the query plan and timing of the hot query paths. Run it before and after '
+        '`migrate inventory 0006` to compare plans with and without the indexes.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=0, help='Insert this many synthetic purchases first; rolled back afterwards.')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per query for the timing.')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                if options['seed']:
+                    counts = generate(purchases=options['seed'])
+                    self.stdout.write(f'Seeded {counts}')
+                self.report(options['repeat'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def report(self, repeat):
+        for name, queryset in hot_queries().items():
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                list(queryset.all())
+                timings.append((time.perf_counter() - started) * 1000)
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: median {statistics.median(timings):.2f} ms'))
+            self.stdout.write(queryset.explain())
@@ -0,0 +1,40 @@
+import time
+from django.core.management.base import BaseCommand
+from inventory.reorder import refresh_reorder_points
+from inventory.synthetic import generate
+
+
+class Command(BaseCommand):
+    help = (
+        'Bulk insert a synthetic restaurant: ingredients, menu items with recipes and purchases '
+        'spread over time, then rebuild the sales rollups and reorder points.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ingredients', type=int, default=2000)
+        parser.add_argument('--menu-items', type=int, default=300)
+        parser.add_argument('--purchases', type=int, default=1000000)
+        parser.add_argument('--days', type=int, default=365, help='Spread purchases over this many days up to today.')
+        parser.add_argument('--recipe-size', type=int, nargs=2, default=(3, 8), metavar=('MIN', 'MAX'), help='Ingredients per recipe.')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+
+        def progress(inserted):
+            self.stdout.write(f'{inserted} / {options["purchases"]} purchases ({time.perf_counter() - started:.0f} s)')
+
+        counts = generate(
+            ingredients=options['ingredients'],
+            menu_items=options['menu_items'],
+            purchases=options['purchases'],
+            days=options['days'],
+            recipe_size=tuple(options['recipe_size']),
+            seed=options['seed'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+        refresh_reorder_points()
+        summary = ', '.join(f"{count} {name.replace('_', ' ')}" for name, count in counts.items())
+        self.stdout.write(self.style.SUCCESS(f'Created {summary} in {time.perf_counter() - started:.1f} s.'))
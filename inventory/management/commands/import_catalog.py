@@ -0,0 +1,32 @@
+from pathlib import Path
+from django.core.management.base import BaseCommand, CommandError
+from inventory.importers import IMPORTERS, run_import
+
+
+class Command(BaseCommand):
+    help = 'Create or update ingredients, menu items or recipe requirements from a CSV, JSON or NDJSON file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=['csv', 'json', 'ndjson'], help='Defaults to the file extension.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Validate and report without saving anything.')
+
+    def handle(self, *args, **options):
+        path = Path(options['path'])
+        fmt = options['format'] or path.suffix.lstrip('.').lower()
+        if fmt not in ('csv', 'json', 'ndjson'):
+            raise CommandError(f'Cannot tell the format of {path}, pass --format.')
+        try:
+            with path.open(newline='', encoding='utf-8-sig') as stream:
+                result = run_import(options['kind'], stream, fmt, options['batch_size'], options['dry_run'])
+        except OSError as e:
+            raise CommandError(e)
+        except ValueError as e:
+            # Malformed JSON or text that isn't UTF-8.
+            raise CommandError(f'Cannot read {path}: {e}')
+        for line, message in result.errors:
+            self.stderr.write(f'Line {line}: {message}')
+        prefix = 'Dry run: ' if options['dry_run'] else ''
+        self.stdout.write(self.style.SUCCESS(f'{prefix}{result}'))
@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+from inventory.reorder import refresh_reorder_points, suggestions
+
+
+class Command(BaseCommand):
+    help = 'List ingredients at or below their reorder point with suggested order quantities.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days-of-cover', type=int, default=7, help='Days of stock to order beyond the lead time.')
+        parser.add_argument('--refresh', action='store_true', help='Re-estimate daily usage and reorder points first.')
+        parser.add_argument('--window', type=int, default=28, help='Days of sales history used by --refresh.')
+
+    def handle(self, *args, **options):
+        if options['refresh']:
+            count = refresh_reorder_points(options['window'])
+            self.stdout.write(f'Refreshed reorder points for {count} ingredients.')
+        total = 0
+        rows = suggestions(options['days_of_cover'])
+        self.stdout.write(f'{"Ingredient":<30} {"In stock":>12} {"Reorder at":>12} {"Order":>12} {"Unit":<6} {"Cost":>10}')
+        for ingredient in rows.iterator():
+            total += ingredient.order_cost
+            self.stdout.write(
+                f'{ingredient.name:<30} {ingredient.quantity:>12} {ingredient.reorder_point:>12} '
+                f'{ingredient.order_quantity:>12.3f} {ingredient.unit:<6} {ingredient.order_cost:>10.2f}'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Estimated order cost: ${total:.2f}'))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+from inventory.models import DailySales
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the daily sales rollups from the purchase log for a range of days.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', help='First day to rebuild (YYYY-MM-DD). Defaults to the earliest purchase.')
+        parser.add_argument('--end', help='Last day to rebuild (YYYY-MM-DD). Defaults to the latest purchase.')
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        start, end = (self._parse(options[name]) for name in ('start', 'end'))
+        created = DailySales.objects.rebuild(start, end, batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {created} daily sales rows.'))
+
+    def _parse(self, value):
+        if value is None:
+            return None
+        day = parse_date(value)
+        if day is None:
+            raise CommandError(f'Invalid date: {value}')
+        return day
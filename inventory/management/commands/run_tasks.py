@@ -0,0 +1,58 @@
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connections
+from inventory.models import Task
+from inventory.tasks import housekeeping, run_task
+
+
+def _init_process():
+    import django
+    django.setup()
+    # Connections inherited from the parent must not be shared.
+    connections.close_all()
+
+
+def _run(pk):
+    close_old_connections()
+    try:
+        return run_task(pk)
+    finally:
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = 'Run queued background tasks (sales rollups, reorder points, stock snapshots, exports) until interrupted.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Tasks run at the same time.')
+        parser.add_argument('--pool', choices=['thread', 'process'], default='thread')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty.')
+        parser.add_argument('--once', action='store_true', help='Exit once no tasks are due.')
+        parser.add_argument('--stale-after', type=int, default=600, help='Requeue tasks running longer than this many seconds.')
+        parser.add_argument('--purge-days', type=int, default=7, help='Delete finished and failed tasks older than this many days.')
+
+    def handle(self, *args, **options):
+        if options['pool'] == 'process':
+            connections.close_all()
+            executor = ProcessPoolExecutor(options['workers'], initializer=_init_process)
+        else:
+            executor = ThreadPoolExecutor(options['workers'])
+        housekeeping_at = 0
+        with executor:
+            try:
+                while True:
+                    if time.monotonic() >= housekeeping_at:
+                        housekeeping(options['stale_after'], options['purge_days'])
+                        housekeeping_at = time.monotonic() + 300
+                    due = list(Task.objects.due().values_list('pk', flat=True)[:options['workers'] * 10])
+                    if due:
+                        succeeded = sum(executor.map(_run, due))
+                        self.stdout.write(f'Ran {len(due)} tasks, {len(due) - succeeded} failed or skipped.')
+                    elif options['once']:
+                        break
+                    else:
+                        time.sleep(options['poll'])
+                    close_old_connections()
+            except KeyboardInterrupt:
+                pass
@@ -0,0 +1,30 @@
+import sqlite3
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS, connections
+from inventory.routers import replicas
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy the SQLite primary database into each DATABASE_REPLICAS file, standing in for '
+        'replication when trying replica reads locally. PostgreSQL replicas are kept up to date by '
+        'the server.'
+    )
+
+    def handle(self, *args, **options):
+        if not replicas():
+            raise CommandError('No replicas configured; set DATABASE_REPLICAS.')
+        primary = connections[DEFAULT_DB_ALIAS]
+        if primary.vendor != 'sqlite':
+            raise CommandError('Only SQLite replicas can be copied; use streaming replication for PostgreSQL.')
+        primary.ensure_connection()
+        for alias in replicas():
+            name = connections[alias].settings_dict['NAME']
+            # Replica connections are read-only, so copy through a connection of our own.
+            connections[alias].close()
+            target = sqlite3.connect(name)
+            try:
+                primary.connection.backup(target)
+            finally:
+                target.close()
+            self.stdout.write(self.style.SUCCESS(f'Copied the primary database to {alias} ({name}).'))
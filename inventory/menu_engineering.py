@@ -0,0 +1,97 @@
+from datetime import timedelta
+import numpy as np
+from django.db.models import Sum
+from django.utils import timezone
+from .caching import CATALOGUE, cached
+from .models import MenuItem, RecipeRequirement
+from .reports import daily_sales
+from .units import can_convert
+
+# Windows reaching today change with every sale; the timeout also covers
+# sales whose rollups were still queued when the report was cached.
+TIMEOUT = 5 * 60
+
+# An item is popular when it sells at least this share of what an equal
+# split of all sales across the menu would give it.
+POPULARITY = 0.7
+
+
+def classify(margins, units):
+    """
+    Menu engineering class of each item from arrays of contribution margins
+    and units sold: popular and above the average margin per unit sold is a
+    star, popular and below a plowhorse, unpopular and above a puzzle, and
+    unpopular and below a dog. Returns the classes, the average margin and
+    the popular share of sales.
+    """
+    total = units.sum()
+    average_margin = (margins * units).sum() / total if total else margins.mean()
+    popularity = POPULARITY / len(units)
+    popular = units >= popularity * total if total else np.zeros(len(units), dtype=bool)
+    profitable = margins >= average_margin
+    classes = np.where(popular, np.where(profitable, 'star', 'plowhorse'), np.where(profitable, 'puzzle', 'dog'))
+    return classes, float(average_margin), popularity
+
+
+def _skipped():
+    requirements = RecipeRequirement.objects.exclude(unit='').order_by('menu_item__name', 'ingredient__name').values_list(
+        'menu_item__name', 'ingredient__name', 'unit', 'ingredient__unit',
+    )
+    return [
+        {'menu_item': menu_item, 'ingredient': ingredient, 'unit': unit, 'stock_unit': stock_unit}
+        for menu_item, ingredient, unit, stock_unit in requirements
+        if not can_convert(unit, stock_unit)
+    ]
+
+
+def _analyse(start, end):
+    menu_items = list(MenuItem.objects.order_by('name').values_list('pk', 'name', 'price', 'unit_cost'))
+    if not menu_items:
+        return {'start': start, 'end': end, 'average_margin': 0, 'popularity': 0, 'counts': {}, 'menu_items': [], 'skipped': []}
+    sold = dict(
+        daily_sales(start, end).values('menu_item').annotate(units=Sum('units_sold')).values_list('menu_item', 'units')
+    )
+    units = np.array([sold.get(pk, 0) for pk, _, _, _ in menu_items], dtype=float)
+    prices = np.array([float(price) for _, _, price, _ in menu_items])
+    costs = np.array([float(unit_cost) for _, _, _, unit_cost in menu_items])
+    margins = prices - costs
+    classes, average_margin, popularity = classify(margins, units)
+    shares = units / units.sum() if units.sum() else units
+    names, counts = np.unique(classes, return_counts=True)
+    return {
+        'start': start,
+        'end': end,
+        'average_margin': round(average_margin, 2),
+        'popularity': round(popularity * 100, 2),
+        'counts': dict(zip(names.tolist(), counts.tolist())),
+        'menu_items': [
+            {
+                'id': pk,
+                'name': name,
+                'price': float(price),
+                'cost': round(float(costs[i]), 2),
+                'margin': round(float(margins[i]), 2),
+                'units_sold': int(units[i]),
+                'share': round(float(shares[i]) * 100, 2),
+                'contribution': round(float(margins[i] * units[i]), 2),
+                'class': str(classes[i]),
+            }
+            for i, (pk, name, price, _) in enumerate(menu_items)
+        ],
+        'skipped': _skipped(),
+    }
+
+
+def report(start=None, end=None):
+    """
+    Price, recipe cost, margin, units sold and class of every menu item over
+    the inclusive ``start``/``end`` window, the last 28 days by default.
+    Recipe costs are the menu items' stored unit costs, at current
+    ingredient prices; lines whose unit can't be converted are left out of
+    them and listed in ``skipped``. Cached per window.
+    """
+    today = timezone.localdate()
+    end = end or today
+    start = start or end - timedelta(days=27)
+    labels = CATALOGUE + ('purchase',) if end >= today else CATALOGUE
+    return cached('menu_engineering', labels, lambda: _analyse(start, end), start, end, timeout=TIMEOUT)
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:52
+
+from django.db import migrations, models
+from django.db.models import F, OuterRef, Subquery, Sum
+from django.db.models.functions import Coalesce
+
+
+def populate_unit_costs(apps, schema_editor):
+    MenuItem = apps.get_model('inventory', 'MenuItem')
+    RecipeRequirement = apps.get_model('inventory', 'RecipeRequirement')
+    costs = (
+        RecipeRequirement.objects.filter(menu_item=OuterRef('pk'))
+        .order_by()
+        .values('menu_item')
+        .annotate(total=Sum(F('quantity') * F('ingredient__unit_price')))
+        .values('total')
+    )
+    MenuItem.objects.update(unit_cost=Coalesce(Subquery(costs), 0, output_field=MenuItem._meta.get_field('unit_cost')))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='menuitem',
+            name='unit_cost',
+            field=models.DecimalField(decimal_places=5, default=0, editable=False, max_digits=15),
+        ),
+        migrations.RunPython(populate_unit_costs, migrations.RunPython.noop),
+    ]
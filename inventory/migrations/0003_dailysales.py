@@ -0,0 +1,53 @@
+# Generated by Django 5.1.1 on 2026-10-18 08:53
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Sum
+from django.db.models.functions import TruncDate
+
+
+def backfill_daily_sales(apps, schema_editor):
+    DailySales = apps.get_model('inventory', 'DailySales')
+    Purchase = apps.get_model('inventory', 'Purchase')
+    rows = (
+        Purchase.objects.order_by()
+        .annotate(day=TruncDate('purchase_time'))
+        .values('day', 'menu_item')
+        .annotate(units_sold=Sum('quantity'))
+        .values_list('day', 'menu_item', 'units_sold', 'menu_item__price', 'menu_item__unit_cost')
+    )
+    DailySales.objects.bulk_create(
+        (
+            DailySales(day=day, menu_item_id=menu_item, units_sold=units, revenue=price * units, cost=unit_cost * units)
+            for day, menu_item, units, price, unit_cost in rows.iterator()
+        ),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0002_menuitem_unit_cost'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySales',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('units_sold', models.IntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('cost', models.DecimalField(decimal_places=5, default=0, max_digits=19)),
+                ('menu_item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='inventory.menuitem')),
+            ],
+            options={
+                'verbose_name': 'Daily Sales',
+                'verbose_name_plural': 'Daily Sales',
+                'ordering': ['-day', 'menu_item'],
+                'constraints': [models.UniqueConstraint(fields=('day', 'menu_item'), name='unique_daily_sales_per_menu_item')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_sales, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0003_dailysales'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reciperequirement',
+            name='unit',
+            field=models.CharField(blank=True, choices=[('kg', 'kilograms'), ('g', 'grams'), ('l', 'liters'), ('ml', 'milliliters'), ('pcs', 'pieces'), ('tbsp', 'tablespoons'), ('tsp', 'teaspoons'), ('cup', 'cups'), ('oz', 'ounces'), ('lb', 'pounds'), ('pt', 'pints'), ('qt', 'quarts'), ('gal', 'gallons'), ('fl oz', 'fluid ounces'), ('egg', 'large eggs'), ('pinch', 'pinches')], help_text="Leave blank to use the ingredient's unit.", max_length=10),
+        ),
+    ]
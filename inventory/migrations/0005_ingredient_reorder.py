@@ -0,0 +1,37 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:05
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0004_reciperequirement_unit'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ingredient',
+            name='daily_usage',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='lead_time_days',
+            field=models.PositiveSmallIntegerField(default=3, help_text='Days it takes for a new order to arrive.'),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='reorder_point',
+            field=models.DecimalField(decimal_places=3, default=0, editable=False, max_digits=12),
+        ),
+        migrations.AddField(
+            model_name='ingredient',
+            name='needs_reorder',
+            field=models.GeneratedField(db_persist=True, expression=models.ExpressionWrapper(models.Q(('quantity__lte', models.F('reorder_point'))), output_field=models.BooleanField()), output_field=models.BooleanField()),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['needs_reorder', 'name'], name='ingredient_reorder_idx'),
+        ),
+    ]
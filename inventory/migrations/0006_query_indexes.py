@@ -0,0 +1,91 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:06
+
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count
+
+# Units as they stood when this migration was written, each as its size in
+# its dimension's base unit, so later changes to inventory.units can't alter
+# what the migration does.
+BASE_QUANTITIES = {
+    'kg': ('mass', Decimal('1000')),
+    'g': ('mass', Decimal('1')),
+    'lb': ('mass', Decimal('453.59237')),
+    'oz': ('mass', Decimal('28.349523125')),
+    'l': ('volume', Decimal('1000')),
+    'ml': ('volume', Decimal('1')),
+    'gal': ('volume', Decimal('3785.411784')),
+    'qt': ('volume', Decimal('946.352946')),
+    'pt': ('volume', Decimal('473.176473')),
+    'cup': ('volume', Decimal('236.5882365')),
+    'fl oz': ('volume', Decimal('29.5735295625')),
+    'tbsp': ('volume', Decimal('14.78676478125')),
+    'tsp': ('volume', Decimal('4.92892159375')),
+}
+
+
+def factor(from_unit, to_unit):
+    # Lines that can't be converted are added as they are.
+    if not from_unit or from_unit == to_unit or from_unit not in BASE_QUANTITIES or to_unit not in BASE_QUANTITIES:
+        return Decimal('1')
+    (from_dimension, from_base), (to_dimension, to_base) = BASE_QUANTITIES[from_unit], BASE_QUANTITIES[to_unit]
+    if from_dimension != to_dimension:
+        return Decimal('1')
+    return (from_base / to_base).quantize(Decimal('1e-12'))
+
+
+def merge_duplicate_recipe_requirements(apps, schema_editor):
+    # Fold repeated (menu item, ingredient) lines into one, in the
+    # ingredient's unit, so the unique constraint can be added.
+    RecipeRequirement = apps.get_model('inventory', 'RecipeRequirement')
+    duplicates = (
+        RecipeRequirement.objects.order_by()
+        .values('menu_item', 'ingredient')
+        .annotate(lines=Count('id'))
+        .filter(lines__gt=1)
+    )
+    for duplicate in duplicates:
+        lines = list(
+            RecipeRequirement.objects.filter(menu_item=duplicate['menu_item'], ingredient=duplicate['ingredient'])
+            .select_related('ingredient')
+            .order_by('id')
+        )
+        kept = lines[0]
+        kept.quantity = sum(line.quantity * factor(line.unit, line.ingredient.unit) for line in lines)
+        kept.unit = ''
+        kept.save(update_fields=['quantity', 'unit'])
+        RecipeRequirement.objects.filter(pk__in=[line.pk for line in lines[1:]]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0005_ingredient_reorder'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='menuitem',
+            index=models.Index(fields=['name'], name='menuitem_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['-purchase_time', '-id'], name='purchase_time_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchase',
+            index=models.Index(fields=['menu_item', 'purchase_time'], name='purchase_menu_item_time_idx'),
+        ),
+        migrations.RunPython(merge_duplicate_recipe_requirements, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='reciperequirement',
+            constraint=models.UniqueConstraint(fields=('menu_item', 'ingredient'), name='unique_recipe_requirement'),
+        ),
+    ]
@@ -0,0 +1,63 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:34
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def snapshot_current_stock(apps, schema_editor):
+    # The ledger starts here: history before it can't be reconstructed.
+    Ingredient = apps.get_model('inventory', 'Ingredient')
+    StockSnapshot = apps.get_model('inventory', 'StockSnapshot')
+    taken_at = timezone.now()
+    StockSnapshot.objects.bulk_create(
+        (StockSnapshot(ingredient_id=pk, quantity=quantity, taken_at=taken_at) for pk, quantity in Ingredient.objects.values_list('pk', 'quantity').iterator()),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0007_task'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('sale', 'Sale'), ('restock', 'Restock'), ('adjustment', 'Adjustment'), ('waste', 'Waste')], max_length=10)),
+                ('quantity', models.DecimalField(decimal_places=3, help_text="Change in stock, in the ingredient's unit.", max_digits=12)),
+                ('note', models.CharField(blank=True, max_length=200)),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now)),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='movements', to='inventory.ingredient')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='stock_movements', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'verbose_name': 'Stock Movement',
+                'verbose_name_plural': 'Stock Movements',
+                'ordering': ['-created_at', '-id'],
+                'indexes': [models.Index(fields=['ingredient', 'created_at'], name='movement_ingredient_time_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.DecimalField(decimal_places=3, max_digits=10)),
+                ('taken_at', models.DateTimeField()),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='snapshots', to='inventory.ingredient')),
+            ],
+            options={
+                'verbose_name': 'Stock Snapshot',
+                'verbose_name_plural': 'Stock Snapshots',
+                'ordering': ['-taken_at'],
+                'constraints': [models.UniqueConstraint(fields=('ingredient', 'taken_at'), name='unique_stock_snapshot')],
+            },
+        ),
+        migrations.RunPython(snapshot_current_stock, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 09:38
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('inventory', '0008_stock_ledger'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseArchive',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.DateField(help_text='First day of the month archived.')),
+                ('file', models.CharField(max_length=200, unique=True)),
+                ('rows', models.PositiveIntegerField()),
+                ('first_purchase_time', models.DateTimeField()),
+                ('last_purchase_time', models.DateTimeField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'verbose_name': 'Purchase Archive',
+                'verbose_name_plural': 'Purchase Archives',
+                'ordering': ['first_purchase_time', 'pk'],
+            },
+        ),
+    ]
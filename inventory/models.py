@@ -1,15 +1,84 @@
-from django.db import models
+from datetime import datetime, time, timedelta
+from decimal import Decimal
+from itertools import islice
+from django.db import IntegrityError, connections, models, transaction
+from django.db.models import BooleanField, Case, DecimalField, ExpressionWrapper, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce, TruncDate
 from django.core.exceptions import ValidationError
 from django.utils.translation import gettext_lazy as _
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
-from django.dispatch import receiver
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import Signal, receiver
 from django.utils import timezone
+from .units import can_convert, conversion_factor, factor
+
+# Sent once a transaction has committed bulk writes that skip post_save:
+# stock_changed for IngredientManager.consume and StockMovementManager.record, with the ingredients
+# carrying their new ``quantity`` and ``previous_quantity``; bulk_changed
+# (with the model as sender) for bulk inserts and updates, with the new
+# ``purchases`` for PurchaseManager.bulk_record.
+stock_changed = Signal()
+bulk_changed = Signal()
+
+def start_of_day(day):
+    return timezone.make_aware(datetime.combine(day, time.min))
 
 class IngredientManager(models.Manager):
     def available(self):
         return self.filter(quantity__gt=0)
 
+    def recipe_units(self, ingredient_ids=None):
+        """``{ingredient_id: {unit, ...}}`` of the units recipe lines give explicitly for each ingredient."""
+        requirements = RecipeRequirement.objects.exclude(unit='').order_by()
+        if ingredient_ids is not None:
+            requirements = requirements.filter(ingredient_id__in=ingredient_ids)
+        units = {}
+        for ingredient_id, unit in requirements.values_list('ingredient_id', 'unit').distinct():
+            units.setdefault(ingredient_id, set()).add(unit)
+        return units
+
+    def consume(self, quantities):
+        """
+        Deduct ``{ingredient_id: amount}`` from stock in a single conditional
+        UPDATE. Raises ValidationError, leaving stock untouched, if any
+        ingredient is short.
+        """
+        quantities = {pk: amount for pk, amount in quantities.items() if amount}
+        if not quantities:
+            return
+        with transaction.atomic():
+            locked = list(
+                self.select_for_update().filter(pk__in=quantities).order_by('pk').only('name', 'quantity', 'unit', 'reorder_point')
+            )
+            shortages = [ingredient.name for ingredient in locked if ingredient.quantity < quantities[ingredient.pk]]
+            if shortages:
+                raise ValidationError(_('Not enough %(names)s in inventory.'), params={'names': ', '.join(shortages)})
+
+            amount = Case(
+                *[When(pk=pk, then=Value(value)) for pk, value in quantities.items()],
+                output_field=DecimalField(max_digits=10, decimal_places=3),
+            )
+            updated = self.filter(pk__in=quantities, quantity__gte=amount).update(
+                quantity=F('quantity') - amount,
+                updated_at=timezone.now(),
+            )
+            if updated != len(quantities):
+                raise ValidationError(_('Inventory changed while recording the purchase, please try again.'))
+            for ingredient in locked:
+                ingredient.previous_quantity = ingredient.quantity
+                ingredient.quantity = (ingredient.quantity - quantities[ingredient.pk]).quantize(Decimal('0.001'))
+            StockMovement.objects.bulk_create(
+                StockMovement(
+                    ingredient_id=ingredient.pk,
+                    kind=StockMovement.SALE,
+                    quantity=ingredient.quantity - ingredient.previous_quantity,
+                )
+                for ingredient in locked
+            )
+            transaction.on_commit(
+                lambda: stock_changed.send(sender=self.model, ingredient_ids=list(quantities), ingredients=locked)
+            )
+
 class Ingredient(models.Model):
     UNIT_CHOICES = [
         ('kg', _('kilogram'), _('kilograms')),
@@ -34,6 +103,14 @@ class Ingredient(models.Model):
     quantity = models.DecimalField(max_digits=10, decimal_places=3)
     unit = models.CharField(max_length=10, choices=[(choice[0], choice[2]) for choice in UNIT_CHOICES])
     unit_price = models.DecimalField(max_digits=10, decimal_places=2)
+    lead_time_days = models.PositiveSmallIntegerField(default=3, help_text=_('Days it takes for a new order to arrive.'))
+    daily_usage = models.DecimalField(max_digits=12, decimal_places=3, default=0, editable=False)
+    reorder_point = models.DecimalField(max_digits=12, decimal_places=3, default=0, editable=False)
+    needs_reorder = models.GeneratedField(
+        expression=ExpressionWrapper(Q(quantity__lte=F('reorder_point')), output_field=BooleanField()),
+        output_field=BooleanField(),
+        db_persist=True,
+    )
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
@@ -42,29 +119,88 @@ class Ingredient(models.Model):
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_unit_price = instance.__dict__.get('unit_price')
+        instance._loaded_unit = instance.__dict__.get('unit')
+        instance._loaded_quantity = instance.__dict__.get('quantity')
+        return instance
+
+    def save(self, *args, **kwargs):
+        # Record changes to stock in the ledger, measured against the locked
+        # row so that sales made since this instance was loaded still count.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'quantity' not in update_fields:
+            return super().save(*args, **kwargs)
+        with transaction.atomic():
+            previous = None
+            if not self._state.adding:
+                previous = Ingredient.objects.select_for_update().filter(pk=self.pk).values_list('quantity', flat=True).first()
+            super().save(*args, **kwargs)
+            movement = StockMovement.objects.difference(self.pk, previous, self.quantity)
+            if movement is not None:
+                movement.save()
+
     def get_unit_display(self):
         for choice in self.UNIT_CHOICES:
             if self.unit == choice[0]:
                 return choice[2] if self.quantity > 1 else choice[1]
         return self.unit
 
+    def stranded_recipe_units(self, unit):
+        """Units this ingredient's recipe lines use that could not be converted to ``unit``."""
+        if self._state.adding:
+            return []
+        return sorted(recipe_unit for recipe_unit in Ingredient.objects.recipe_units([self.pk]).get(self.pk, ()) if not can_convert(recipe_unit, unit))
+
     def clean(self):
         if self.quantity is not None:
             if self.quantity < 0:
                 raise ValidationError(_('Quantity cannot be negative'))
+        if self.unit:
+            stranded = self.stranded_recipe_units(self.unit)
+            if stranded:
+                raise ValidationError({'unit': ValidationError(
+                    _('Recipes use %(units)s of %(ingredient)s, which cannot be converted to %(unit)s.'),
+                    params={'units': ', '.join(stranded), 'ingredient': self.name, 'unit': self.unit},
+                )})
 
     class Meta:
         verbose_name = _("Ingredient")
         verbose_name_plural = _("Ingredients")
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='ingredient_name_idx'),
+            models.Index(fields=['needs_reorder', 'name'], name='ingredient_reorder_idx'),
+        ]
+
+class MenuItemManager(models.Manager):
+    def refresh_unit_costs(self, menu_items=None):
+        """
+        Recompute the stored ``unit_cost`` for the given menu items (all of
+        them when None) with one UPDATE over their recipe requirements.
+        """
+        costs = (
+            RecipeRequirement.objects.filter(menu_item=OuterRef('pk'))
+            .order_by()
+            .values('menu_item')
+            .annotate(total=Sum(F('quantity') * conversion_factor() * F('ingredient__unit_price')))
+            .values('total')
+        )
+        queryset = self.all() if menu_items is None else self.filter(pk__in=menu_items)
+        return queryset.update(unit_cost=Coalesce(Subquery(costs), 0, output_field=self.model._meta.get_field('unit_cost')))
 
 class MenuItem(models.Model):
     name = models.CharField(max_length=100)
     price = models.DecimalField(max_digits=10, decimal_places=2)
+    unit_cost = models.DecimalField(max_digits=15, decimal_places=5, default=0, editable=False)
     image_url = models.URLField(max_length=200, blank=True, null=True)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    objects = MenuItemManager()
+
     def __str__(self):
         return self.name
 
@@ -72,30 +208,133 @@ class MenuItem(models.Model):
         verbose_name = _("Menu Item")
         verbose_name_plural = _("Menu Items")
         ordering = ['name']
+        indexes = [
+            models.Index(fields=['name'], name='menuitem_name_idx'),
+        ]
 
 class RecipeRequirement(models.Model):
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='recipe_requirements')
     ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='recipe_requirements')
     quantity = models.DecimalField(max_digits=10, decimal_places=3)
+    unit = models.CharField(
+        max_length=10,
+        choices=[(choice[0], choice[2]) for choice in Ingredient.UNIT_CHOICES],
+        blank=True,
+        help_text=_("Leave blank to use the ingredient's unit."),
+    )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_menu_item_id = instance.__dict__.get('menu_item_id')
+        return instance
 
     def __str__(self):
         quantity_str = '{:g}'.format(float(self.quantity))
         unit_display = self.get_unit_display()
-        if self.ingredient.unit == 'egg':
+        if self.get_unit() == 'egg':
             return f'{quantity_str} {unit_display} for {self.menu_item.name}'
         else:
             return f'{quantity_str} {unit_display} of {self.ingredient.name} for {self.menu_item.name}'
     
+    def get_unit(self):
+        return self.unit or self.ingredient.unit
+
     def get_unit_display(self):
+        unit = self.get_unit()
         for choice in self.ingredient.UNIT_CHOICES:
-            if self.ingredient.unit == choice[0]:
+            if unit == choice[0]:
                 return choice[1] if self.quantity == 1 else choice[2]
-        return self.ingredient.unit
+        return unit
+
+    def clean(self):
+        if self.unit and self.ingredient_id and not can_convert(self.unit, self.ingredient.unit):
+            raise ValidationError({'unit': ValidationError(
+                _('%(ingredient)s is stocked in %(unit)s, which %(recipe_unit)s cannot be converted to.'),
+                params={'ingredient': self.ingredient.name, 'unit': self.ingredient.unit, 'recipe_unit': self.unit},
+            )})
 
     class Meta:
         verbose_name = _("Recipe Requirement")
         verbose_name_plural = _("Recipe Requirements")
         ordering = ['menu_item']
+        constraints = [
+            models.UniqueConstraint(fields=['menu_item', 'ingredient'], name='unique_recipe_requirement'),
+        ]
+
+class PurchaseQuerySet(models.QuerySet):
+    def between(self, start=None, end=None):
+        """
+        Purchases made on local days ``start`` to ``end`` inclusive, as a range
+        on purchase_time so the index can be used.
+        """
+        if start:
+            self = self.filter(purchase_time__gte=start_of_day(start))
+        if end:
+            self = self.filter(purchase_time__lt=start_of_day(end + timedelta(days=1)))
+        return self
+
+class PurchaseManager(models.Manager.from_queryset(PurchaseQuerySet)):
+    def required_ingredients(self, purchases):
+        """Total ``{ingredient_id: amount}`` consumed by the given purchases."""
+        servings = {}
+        for purchase in purchases:
+            servings[purchase.menu_item_id] = servings.get(purchase.menu_item_id, 0) + purchase.quantity
+        required = {}
+        # Converted here rather than with conversion_factor(): compiling its Case
+        # costs more than the rest of a purchase put together.
+        requirements = RecipeRequirement.objects.filter(menu_item_id__in=servings).order_by().values_list(
+            'menu_item_id', 'ingredient_id', 'quantity', 'unit', 'ingredient__unit', 'ingredient__name',
+        )
+        for menu_item_id, ingredient_id, quantity, unit, stock_unit, name in requirements:
+            if not can_convert(unit, stock_unit):
+                raise ValidationError(
+                    _('The recipe uses %(recipe_unit)s of %(ingredient)s, which is stocked in %(unit)s and cannot be converted.'),
+                    params={'ingredient': name, 'unit': stock_unit, 'recipe_unit': unit},
+                )
+            amount = quantity * factor(unit, stock_unit) * servings[menu_item_id]
+            required[ingredient_id] = required.get(ingredient_id, 0) + amount
+        return required
+
+    def bulk_record(self, purchases, batch_size=1000):
+        """
+        Record a batch of purchases in one transaction: one stock deduction for
+        the whole batch, a bulk insert and one rollup pass. Nothing is saved if
+        any ingredient is short.
+        """
+        purchases = list(purchases)
+        with transaction.atomic():
+            Ingredient.objects.consume(self.required_ingredients(purchases))
+            purchases = self.bulk_create(purchases, batch_size=batch_size)
+            DailySales.objects.record(purchases)
+            transaction.on_commit(lambda: bulk_changed.send(sender=self.model, purchases=purchases))
+        return purchases
+
+    def insert_backdated(self, purchases, batch_size=5000):
+        """
+        Insert purchases with the ``purchase_time`` they carry, which
+        bulk_create would replace with now(). Their ids are kept if the first
+        one has an id. Like bulk_create, skips post_save: stock and rollups
+        are left as they are. Returns the number of rows inserted.
+        """
+        purchases = iter(purchases)
+        batch = list(islice(purchases, batch_size))
+        if not batch:
+            return 0
+        connection = connections[self.db]
+        fields = [field for field in self.model._meta.concrete_fields if batch[0].pk is not None or not field.primary_key]
+        sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(self.model._meta.db_table),
+            ', '.join(connection.ops.quote_name(field.column) for field in fields),
+            ', '.join(['%s'] * len(fields)),
+        )
+        inserted = 0
+        with transaction.atomic(using=self.db), connection.cursor() as cursor:
+            while batch:
+                cursor.executemany(sql, [[field.get_db_prep_save(getattr(purchase, field.attname), connection) for field in fields] for purchase in batch])
+                inserted += len(batch)
+                batch = list(islice(purchases, batch_size))
+        return inserted
 
 class Purchase(models.Model):
     menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='purchases')
@@ -106,24 +345,342 @@ class Purchase(models.Model):
     def __str__(self):
         return f'{self.quantity} {self.menu_item.name} logged by {self.logged_by.username} at {self.purchase_time}'
 
-    def update_inventory(self):
-        requirements = self.menu_item.recipe_requirements.all()
-        for requirement in requirements:
-            ingredient = requirement.ingredient
-            required_quantity = requirement.quantity * self.quantity
-            if ingredient.quantity < required_quantity:
-                raise ValidationError(f'Not enough {ingredient.name} in inventory.')
-        
-        for requirement in requirements:
-            ingredient = requirement.ingredient
-            ingredient.quantity -= requirement.quantity * self.quantity
-            ingredient.save()
+    def save(self, *args, **kwargs):
+        # The post_save inventory deduction must roll the purchase back with it.
+        with transaction.atomic():
+            # An edit is applied as its difference from the row as saved,
+            # locked so that concurrent edits don't both start from it.
+            self._previous = None if self._state.adding else (
+                Purchase.objects.select_for_update().only('menu_item', 'quantity', 'purchase_time').filter(pk=self.pk).first()
+            )
+            super().save(*args, **kwargs)
+
+    objects = PurchaseManager()
+
+    def update_inventory(self, previous=None):
+        """Deduct the stock this purchase uses, less what ``previous``, its saved state before an edit, used."""
+        required = Purchase.objects.required_ingredients([self])
+        if previous is not None:
+            for ingredient_id, amount in Purchase.objects.required_ingredients([previous]).items():
+                required[ingredient_id] = required.get(ingredient_id, 0) - amount
+        Ingredient.objects.consume(required)
 
     class Meta:
         verbose_name = _("Purchase")
         verbose_name_plural = _("Purchases")
         ordering = ['-purchase_time']
+        indexes = [
+            models.Index(fields=['-purchase_time', '-id'], name='purchase_time_idx'),
+            models.Index(fields=['menu_item', 'purchase_time'], name='purchase_menu_item_time_idx'),
+        ]
+
+class DailySalesManager(models.Manager):
+    def record(self, purchases, sign=1):
+        """
+        Fold purchases into their days' rollup rows, one write per day and
+        menu item. Pass ``sign=-1`` to take deleted purchases back out.
+        """
+        units_by_key = {}
+        for purchase in purchases:
+            key = (timezone.localdate(purchase.purchase_time), purchase.menu_item_id)
+            units_by_key[key] = units_by_key.get(key, 0) + purchase.quantity * sign
+        menu_items = MenuItem.objects.only('price', 'unit_cost').in_bulk({menu_item_id for _, menu_item_id in units_by_key})
+        for (day, menu_item_id), units in sorted(units_by_key.items()):
+            menu_item = menu_items.get(menu_item_id)
+            if menu_item is None:
+                continue
+            revenue = menu_item.price * units
+            cost = menu_item.unit_cost * units
+            if self._add(day, menu_item_id, units, revenue, cost) or sign < 0:
+                continue
+            try:
+                with transaction.atomic():
+                    self.create(day=day, menu_item_id=menu_item_id, units_sold=units, revenue=revenue, cost=cost)
+            except IntegrityError:
+                # Another transaction created the row since the update.
+                self._add(day, menu_item_id, units, revenue, cost)
+
+    def _add(self, day, menu_item_id, units, revenue, cost):
+        return self.filter(day=day, menu_item_id=menu_item_id).update(
+            units_sold=F('units_sold') + units,
+            revenue=F('revenue') + revenue,
+            cost=F('cost') + cost,
+        )
+
+    def rebuild(self, start=None, end=None, batch_size=1000):
+        """
+        Recompute rollup rows for an inclusive day range from the purchase log and
+        its archives, priced at the current menu price and unit cost.
+        """
+        purchases = Purchase.objects.between(start, end).order_by()
+        rollups = self.all()
+        if start:
+            rollups = rollups.filter(day__gte=start)
+        if end:
+            rollups = rollups.filter(day__lte=end)
+        rows = (
+            purchases.annotate(day=TruncDate('purchase_time'))
+            .values('day', 'menu_item')
+            .annotate(units_sold=Sum('quantity'))
+            .values_list('day', 'menu_item', 'units_sold')
+        )
+        from .archive import daily_units  # the archive module imports these models
+        units_by_key = daily_units(start, end)
+        for day, menu_item, units in rows.iterator():
+            units_by_key[day, menu_item] = units_by_key.get((day, menu_item), 0) + units
+        menu_items = MenuItem.objects.only('price', 'unit_cost').in_bulk({menu_item for _, menu_item in units_by_key})
+        with transaction.atomic():
+            rollups.delete()
+            created = self.bulk_create(
+                (
+                    self.model(
+                        day=day,
+                        menu_item_id=menu_item,
+                        units_sold=units,
+                        revenue=menu_items[menu_item].price * units,
+                        cost=menu_items[menu_item].unit_cost * units,
+                    )
+                    for (day, menu_item), units in sorted(units_by_key.items())
+                    if menu_item in menu_items
+                ),
+                batch_size=batch_size,
+            )
+        return len(created)
+
+class DailySales(models.Model):
+    day = models.DateField()
+    menu_item = models.ForeignKey(MenuItem, on_delete=models.CASCADE, related_name='daily_sales')
+    units_sold = models.IntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    cost = models.DecimalField(max_digits=19, decimal_places=5, default=0)
+
+    objects = DailySalesManager()
+
+    def __str__(self):
+        return f'{self.units_sold} {self.menu_item.name} sold on {self.day}'
+
+    class Meta:
+        verbose_name = _("Daily Sales")
+        verbose_name_plural = _("Daily Sales")
+        ordering = ['-day', 'menu_item']
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'menu_item'], name='unique_daily_sales_per_menu_item'),
+        ]
+
+class PurchaseArchive(models.Model):
+    """A gzipped CSV file under ARCHIVE_ROOT holding one month's purchases, moved out of the purchase table."""
+    period = models.DateField(help_text=_('First day of the month archived.'))
+    file = models.CharField(max_length=200, unique=True)
+    rows = models.PositiveIntegerField()
+    first_purchase_time = models.DateTimeField()
+    last_purchase_time = models.DateTimeField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f'{self.rows} purchases from {self.period:%B %Y}'
+
+    class Meta:
+        verbose_name = _("Purchase Archive")
+        verbose_name_plural = _("Purchase Archives")
+        ordering = ['first_purchase_time', 'pk']
+
+class StockMovementManager(models.Manager):
+    def record(self, ingredient_id, kind, quantity, note='', recorded_by=None):
+        """
+        Change an ingredient's stock by ``quantity`` (negative to take stock
+        away) and append the movement. Raises ValidationError, leaving stock
+        untouched, if it would go below zero.
+        """
+        with transaction.atomic():
+            ingredient = Ingredient.objects.select_for_update().only('name', 'quantity', 'unit', 'reorder_point').get(pk=ingredient_id)
+            if ingredient.quantity + quantity < 0:
+                raise ValidationError(_('Not enough %(names)s in inventory.'), params={'names': ingredient.name})
+            ingredient.previous_quantity = ingredient.quantity
+            ingredient.quantity = (ingredient.quantity + quantity).quantize(Decimal('0.001'))
+            Ingredient.objects.filter(pk=ingredient_id).update(quantity=ingredient.quantity, updated_at=timezone.now())
+            movement = self.create(
+                ingredient_id=ingredient_id,
+                kind=kind,
+                quantity=ingredient.quantity - ingredient.previous_quantity,
+                note=note,
+                recorded_by=recorded_by,
+            )
+            transaction.on_commit(
+                lambda: stock_changed.send(sender=Ingredient, ingredient_ids=[ingredient_id], ingredients=[ingredient])
+            )
+        return movement
+
+    def difference(self, ingredient_id, previous, quantity, note=''):
+        """
+        The unsaved movement for stock set directly to ``quantity``: opening
+        stock when ``previous`` is None, an adjustment if it changed, else None.
+        """
+        quantity = Decimal(quantity).quantize(Decimal('0.001'))
+        if previous is None:
+            return self.model(ingredient_id=ingredient_id, kind=StockMovement.RESTOCK, quantity=quantity, note='Opening stock')
+        if quantity != previous:
+            return self.model(ingredient_id=ingredient_id, kind=StockMovement.ADJUSTMENT, quantity=quantity - previous, note=note)
+        return None
+
+    def stock_at(self, when, ingredient_ids=None):
+        """
+        ``{ingredient_id: quantity}`` at ``when``, from each ingredient's last
+        snapshot taken by then plus the movements after it. Ingredients with
+        no ledger history by then are left out.
+        """
+        ingredients = Ingredient.objects.filter(created_at__lte=when)
+        if ingredient_ids is not None:
+            ingredients = ingredients.filter(pk__in=ingredient_ids)
+        snapshots = StockSnapshot.objects.filter(ingredient=OuterRef('pk'), taken_at__lte=when).order_by('-taken_at')
+        rows = ingredients.order_by().annotate(
+            snapshot_at=Subquery(snapshots.values('taken_at')[:1]),
+            snapshot_quantity=Subquery(snapshots.values('quantity')[:1]),
+        ).values_list('pk', 'snapshot_at', 'snapshot_quantity')
+        stock, since = {}, {}
+        for pk, snapshot_at, snapshot_quantity in rows:
+            if snapshot_at is not None:
+                stock[pk] = snapshot_quantity
+            since.setdefault(snapshot_at, []).append(pk)
+        # Snapshots are taken in batches, so this is one query per batch time.
+        for snapshot_at, pks in since.items():
+            movements = self.filter(ingredient_id__in=pks, created_at__lte=when)
+            if snapshot_at is not None:
+                movements = movements.filter(created_at__gt=snapshot_at)
+            for pk, total in movements.order_by().values('ingredient_id').annotate(total=Sum('quantity')).values_list('ingredient_id', 'total'):
+                stock[pk] = stock.get(pk, 0) + total
+        return {pk: Decimal(quantity).quantize(Decimal('0.001')) for pk, quantity in stock.items()}
+
+class StockMovement(models.Model):
+    SALE, RESTOCK, ADJUSTMENT, WASTE = 'sale', 'restock', 'adjustment', 'waste'
+    KIND_CHOICES = [
+        (SALE, _('Sale')),
+        (RESTOCK, _('Restock')),
+        (ADJUSTMENT, _('Adjustment')),
+        (WASTE, _('Waste')),
+    ]
+
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='movements')
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    quantity = models.DecimalField(max_digits=12, decimal_places=3, help_text=_('Change in stock, in the ingredient\'s unit.'))
+    note = models.CharField(max_length=200, blank=True)
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='stock_movements')
+    created_at = models.DateTimeField(default=timezone.now)
+
+    objects = StockMovementManager()
+
+    def __str__(self):
+        return f'{self.get_kind_display()} of {self.quantity} {self.ingredient.unit} {self.ingredient.name} at {self.created_at}'
+
+    class Meta:
+        verbose_name = _("Stock Movement")
+        verbose_name_plural = _("Stock Movements")
+        ordering = ['-created_at', '-id']
+        indexes = [
+            models.Index(fields=['ingredient', 'created_at'], name='movement_ingredient_time_idx'),
+        ]
+
+class StockSnapshotManager(models.Manager):
+    def take(self):
+        """
+        Snapshot the stock of every ingredient that has moved since its last
+        snapshot. The rows are locked, so no movement is half-way written.
+        """
+        with transaction.atomic():
+            last = self.order_by('-taken_at').values_list('taken_at', flat=True).first()
+            moved = StockMovement.objects.all() if last is None else StockMovement.objects.filter(created_at__gt=last)
+            ingredients = Ingredient.objects.select_for_update().filter(pk__in=moved.values('ingredient_id')).order_by('pk')
+            rows = list(ingredients.values_list('pk', 'quantity'))
+            # Taken after the locks, so movements written since are all later.
+            taken_at = timezone.now()
+            return self.bulk_create(self.model(ingredient_id=pk, quantity=quantity, taken_at=taken_at) for pk, quantity in rows)
+
+class StockSnapshot(models.Model):
+    ingredient = models.ForeignKey(Ingredient, on_delete=models.CASCADE, related_name='snapshots')
+    quantity = models.DecimalField(max_digits=10, decimal_places=3)
+    taken_at = models.DateTimeField()
+
+    objects = StockSnapshotManager()
+
+    def __str__(self):
+        return f'{self.quantity} {self.ingredient.unit} {self.ingredient.name} at {self.taken_at}'
+
+    class Meta:
+        verbose_name = _("Stock Snapshot")
+        verbose_name_plural = _("Stock Snapshots")
+        ordering = ['-taken_at']
+        constraints = [
+            models.UniqueConstraint(fields=['ingredient', 'taken_at'], name='unique_stock_snapshot'),
+        ]
+
+class TaskManager(models.Manager):
+    def enqueue(self, name, kwargs=None, key=None, run_after=None):
+        """
+        Queue ``name`` to run with ``kwargs``. When ``key`` is given, a task
+        already queued (or run) under that key is returned instead.
+        """
+        defaults = {'name': name, 'kwargs': kwargs or {}, 'run_after': run_after or timezone.now()}
+        if key is None:
+            return self.create(**defaults)
+        return self.get_or_create(idempotency_key=key, defaults=defaults)[0]
+
+    def due(self):
+        return self.filter(status=Task.QUEUED, run_after__lte=timezone.now()).order_by('run_after', 'pk')
+
+class Task(models.Model):
+    QUEUED, RUNNING, DONE, FAILED = 'queued', 'running', 'done', 'failed'
+    STATUS_CHOICES = [
+        (QUEUED, _('Queued')),
+        (RUNNING, _('Running')),
+        (DONE, _('Done')),
+        (FAILED, _('Failed')),
+    ]
+
+    name = models.CharField(max_length=200)
+    kwargs = models.JSONField(default=dict, blank=True)
+    idempotency_key = models.CharField(max_length=200, unique=True, null=True, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    run_after = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    result = models.JSONField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = TaskManager()
+
+    def __str__(self):
+        return f'{self.name} ({self.get_status_display()})'
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'run_after'], name='task_due_idx'),
+        ]
 
 @receiver(post_save, sender=Purchase)
-def update_inventory_on_purchase(sender, instance, **kwargs):
-    instance.update_inventory()
\ No newline at end of file
+def update_inventory_on_purchase(sender, instance, created, **kwargs):
+    if created:
+        instance.update_inventory()
+    elif getattr(instance, '_previous', None) is not None:
+        instance.update_inventory(instance._previous)
+
+@receiver(post_save, sender=RecipeRequirement)
+@receiver(post_delete, sender=RecipeRequirement)
+def refresh_unit_cost_on_recipe_change(sender, instance, **kwargs):
+    menu_items = {instance.menu_item_id, getattr(instance, '_loaded_menu_item_id', None)} - {None}
+    MenuItem.objects.refresh_unit_costs(menu_items)
+    instance._loaded_menu_item_id = instance.menu_item_id
+
+@receiver(post_save, sender=Ingredient)
+def refresh_unit_cost_on_price_change(sender, instance, created, **kwargs):
+    changed = (
+        instance.unit_price != getattr(instance, '_loaded_unit_price', None)
+        or instance.unit != getattr(instance, '_loaded_unit', None)
+    )
+    if not created and changed:
+        MenuItem.objects.refresh_unit_costs(
+            RecipeRequirement.objects.filter(ingredient=instance).values('menu_item_id')
+        )
+    instance._loaded_unit_price = instance.unit_price
+    instance._loaded_unit = instance.unit
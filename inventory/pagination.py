@@ -0,0 +1,20 @@
+from rest_framework.pagination import CursorPagination
+
+
+class NameCursorPagination(CursorPagination):
+    ordering = ('name', 'id')
+    page_size = 100
+    page_size_query_param = 'page_size'
+    max_page_size = 1000
+
+
+class IdCursorPagination(NameCursorPagination):
+    ordering = ('id',)
+
+
+class PurchaseCursorPagination(NameCursorPagination):
+    """
+    Newest purchases first. Keyset paging on purchase_time stays stable while
+    new sales are being logged.
+    """
+    ordering = ('-purchase_time', '-id')
@@ -0,0 +1,60 @@
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Greatest
+from django.utils import timezone
+from .models import Ingredient, RecipeRequirement, bulk_changed
+from .units import conversion_factor
+
+QUANTITY = DecimalField(max_digits=12, decimal_places=3)
+
+
+def refresh_reorder_points(window_days=28, today=None):
+    """
+    Re-estimate every ingredient's daily usage from the last ``window_days``
+    of daily sales rollups and its recipes, then set its reorder point to
+    the stock used over its lead time. Two UPDATE statements in total.
+    """
+    today = today or timezone.localdate()
+    usage = (
+        RecipeRequirement.objects.filter(
+            ingredient=OuterRef('pk'),
+            menu_item__daily_sales__day__gt=today - timedelta(days=window_days),
+            menu_item__daily_sales__day__lte=today,
+        )
+        .order_by()
+        .values('ingredient')
+        .annotate(used=Sum(F('menu_item__daily_sales__units_sold') * F('quantity') * conversion_factor()))
+        .values('used')
+    )
+    with transaction.atomic():
+        # Whole-number sums are integers on SQLite, where dividing them by an
+        # integer (or casting them to decimal) would truncate.
+        used = Cast(Coalesce(Subquery(usage), Value(Decimal('0')), output_field=QUANTITY), FloatField())
+        updated = Ingredient.objects.update(daily_usage=used / window_days)
+        Ingredient.objects.update(
+            reorder_point=ExpressionWrapper(F('daily_usage') * F('lead_time_days'), output_field=QUANTITY),
+        )
+        transaction.on_commit(lambda: bulk_changed.send(sender=Ingredient))
+    return updated
+
+
+def needs_reorder():
+    return Ingredient.objects.filter(needs_reorder=True).order_by('name')
+
+
+def suggestions(days_of_cover=7):
+    """
+    Ingredients at or below their reorder point, annotated with how much to
+    order to last ``days_of_cover`` days beyond the lead time, and its cost.
+    """
+    order_quantity = Greatest(
+        F('daily_usage') * (F('lead_time_days') + days_of_cover) - F('quantity'),
+        Value(Decimal('0')),
+        output_field=QUANTITY,
+    )
+    return needs_reorder().annotate(
+        order_quantity=order_quantity,
+        order_cost=ExpressionWrapper(order_quantity * F('unit_price'), output_field=DecimalField(max_digits=14, decimal_places=2)),
+    )
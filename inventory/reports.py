@@ -0,0 +1,60 @@
+from decimal import Decimal
+from django.db.models import DecimalField, Sum, Value
+from django.db.models.functions import Coalesce
+from .models import DailySales
+
+MONEY = DecimalField(max_digits=20, decimal_places=2)
+ZERO = Value(Decimal('0'), output_field=MONEY)
+
+
+def daily_sales(start=None, end=None, menu_item=None):
+    """
+    Daily sales rollups filtered by an inclusive ``start``/``end`` date range
+    and an optional menu item (instance or pk).
+    """
+    queryset = DailySales.objects.order_by()
+    if start:
+        queryset = queryset.filter(day__gte=start)
+    if end:
+        queryset = queryset.filter(day__lte=end)
+    if menu_item:
+        queryset = queryset.filter(menu_item=menu_item)
+    return queryset
+
+
+def _aggregates():
+    return {
+        'units_sold': Coalesce(Sum('units_sold'), 0),
+        'total_revenue': Coalesce(Sum('revenue'), ZERO, output_field=MONEY),
+        'total_cost': Coalesce(Sum('cost'), ZERO, output_field=MONEY),
+    }
+
+
+def _with_profit(row):
+    row['profit'] = row['total_revenue'] - row['total_cost']
+    return row
+
+
+def totals(**filters):
+    """Revenue, cost and profit over the filtered sales in one query."""
+    return _with_profit(daily_sales(**filters).aggregate(**_aggregates()))
+
+
+def by_menu_item(**filters):
+    rows = (
+        daily_sales(**filters)
+        .values('menu_item', 'menu_item__name')
+        .annotate(**_aggregates())
+        .order_by('menu_item__name')
+    )
+    return [_with_profit(row) for row in rows]
+
+
+def by_day(**filters):
+    rows = (
+        daily_sales(**filters)
+        .values('day')
+        .annotate(**_aggregates())
+        .order_by('day')
+    )
+    return [_with_profit(row) for row in rows]
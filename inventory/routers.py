@@ -0,0 +1,146 @@
+import hashlib
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+
+# Replica alias the current request or task reads from; None reads from the primary.
+current = ContextVar('replica', default=None)
+
+# Models read from replicas. Tasks are a work queue and must always see the
+# primary; the cache table, sessions and users stay there as well.
+REPLICATED_APPS = {'inventory'}
+PRIMARY_ONLY = {'inventory.task'}
+
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+PIN_COOKIE = 'primary_pin'
+
+
+def replicas():
+    return [alias for alias in settings.DATABASES if alias != DEFAULT_DB_ALIAS]
+
+
+@contextmanager
+def replica():
+    """Read from a randomly chosen replica, if there are any, inside the block."""
+    token = current.set(random.choice(replicas()) if replicas() else None)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+
+@contextmanager
+def primary():
+    """Read from the primary inside the block, e.g. to fill a shared cache."""
+    token = current.set(None)
+    try:
+        yield
+    finally:
+        current.reset(token)
+
+
+class ReplicaRouter:
+    """
+    Sends reads of inventory models to the replica chosen for the current
+    request, and every write, migration and other read to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        alias = current.get()
+        if alias and model._meta.app_label in REPLICATED_APPS and model._meta.label_lower not in PRIMARY_ONLY:
+            return alias
+        return None
+
+    def db_for_write(self, model, **hints):
+        # Objects read from a replica would otherwise be saved back to it.
+        return DEFAULT_DB_ALIAS if replicas() else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        aliases = {DEFAULT_DB_ALIAS, *replicas()}
+        if obj1._state.db in aliases and obj2._state.db in aliases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return False if db in replicas() else None
+
+
+def _pin_key(request):
+    # Token clients don't keep cookies, so their pin is kept in the cache
+    # under their Authorization header (hashed) or user.
+    authorization = request.headers.get('Authorization')
+    if authorization:
+        return 'inventory:primary-pin:' + hashlib.sha256(authorization.encode()).hexdigest()
+    if request.user.is_authenticated:
+        return f'inventory:primary-pin:user:{request.user.pk}'
+    return None
+
+
+def pinned(request):
+    if PIN_COOKIE in request.COOKIES:
+        return True
+    key = _pin_key(request)
+    return key is not None and cache.get(key) is not None
+
+
+def pin(request, response):
+    seconds = settings.DATABASE_REPLICA_PIN
+    response.set_cookie(PIN_COOKIE, '1', max_age=seconds, httponly=True, samesite='Lax')
+    key = _pin_key(request)
+    if key is not None:
+        cache.set(key, True, seconds)
+
+
+class ReplicaMiddleware:
+    """
+    Lets GET requests to the API and to views with ``replica_reads = True``
+    read from a replica. A client that has just written is pinned to the
+    primary for DATABASE_REPLICA_PIN seconds so it reads its own writes.
+    Does nothing without replicas. Put it after AuthenticationMiddleware.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        token = current.set(None)
+        try:
+            response = self.get_response(request)
+        finally:
+            current.reset(token)
+        if self.wrote(request, response):
+            pin(request, response)
+        return response
+
+    async def __acall__(self, request):
+        token = current.set(None)
+        try:
+            response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        if self.wrote(request, response):
+            await sync_to_async(pin)(request, response)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not replicas() or request.method not in SAFE_METHODS:
+            return None
+        view = getattr(view_func, 'view_class', None) or getattr(view_func, 'cls', None)
+        if request.resolver_match.route.startswith('api/') or getattr(view, 'replica_reads', False):
+            if not pinned(request):
+                current.set(random.choice(replicas()))
+        return None
+
+    def wrote(self, request, response):
+        return bool(replicas()) and request.method not in SAFE_METHODS and response.status_code < 400
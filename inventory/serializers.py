@@ -1,22 +1,74 @@
 from rest_framework import serializers
 from .models import Ingredient, MenuItem, RecipeRequirement, Purchase
+from .units import can_convert
 
-class IngredientSerializer(serializers.HyperlinkedModelSerializer):
+class SparseFieldsMixin:
+    """
+    Limits the serialized fields to those named in a comma separated
+    ``?fields=`` query parameter.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or not request.query_params.get('fields'):
+            return
+        requested = set(request.query_params['fields'].split(','))
+        for name in set(self.fields) - requested:
+            self.fields.pop(name)
+
+class IngredientSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Ingredient
-        fields = ['url', 'name', 'quantity', 'unit', 'unit_price']
+        fields = ['url', 'name', 'quantity', 'unit', 'unit_price', 'lead_time_days', 'daily_usage', 'reorder_point', 'needs_reorder']
+
+    def validate(self, attrs):
+        unit = attrs.get('unit')
+        if self.instance is not None and unit and unit != self.instance.unit:
+            stranded = self.instance.stranded_recipe_units(unit)
+            if stranded:
+                raise serializers.ValidationError({'unit': f'Recipes use {", ".join(stranded)} of {self.instance.name}, which cannot be converted to {unit}.'})
+        return attrs
 
-class MenuItemSerializer(serializers.HyperlinkedModelSerializer):
+class MenuItemSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = MenuItem
-        fields = ['url', 'name', 'price', 'image_url']
+        fields = ['url', 'name', 'price', 'unit_cost', 'image_url']
 
-class RecipeRequirementSerializer(serializers.HyperlinkedModelSerializer):
+class RecipeRequirementSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
     class Meta:
         model = RecipeRequirement
-        fields = ['url', 'menu_item', 'ingredient', 'quantity']
+        fields = ['url', 'menu_item', 'ingredient', 'quantity', 'unit']
+
+    def validate(self, attrs):
+        ingredient = attrs.get('ingredient', getattr(self.instance, 'ingredient', None))
+        unit = attrs.get('unit', getattr(self.instance, 'unit', ''))
+        if ingredient is not None and not can_convert(unit, ingredient.unit):
+            raise serializers.ValidationError({'unit': f'{ingredient.name} is stocked in {ingredient.unit}, which {unit} cannot be converted to.'})
+        return attrs
+
+class CachedMenuItemField(serializers.HyperlinkedRelatedField):
+    """
+    Resolves menu items from a ``menu_items`` dict in the serializer context
+    when one is given, so bulk payloads don't query once per row.
+    """
+    def get_object(self, view_name, view_args, view_kwargs):
+        menu_items = self.context.get('menu_items')
+        if menu_items is None:
+            return super().get_object(view_name, view_args, view_kwargs)
+        try:
+            return menu_items[int(view_kwargs[self.lookup_url_kwarg])]
+        except KeyError:
+            raise MenuItem.DoesNotExist
+
+class BulkPurchaseListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        return Purchase.objects.bulk_record(Purchase(**attrs) for attrs in validated_data)
+
+class PurchaseSerializer(SparseFieldsMixin, serializers.HyperlinkedModelSerializer):
+    menu_item = CachedMenuItemField(view_name='menuitem-detail', queryset=MenuItem.objects.all())
 
-class PurchaseSerializer(serializers.HyperlinkedModelSerializer):
     class Meta:
         model = Purchase
-        fields = ['url', 'menu_item', 'quantity']
\ No newline at end of file
+        fields = ['url', 'menu_item', 'quantity']
+        extra_kwargs = {'quantity': {'min_value': 1}}
+        list_serializer_class = BulkPurchaseListSerializer
\ No newline at end of file
@@ -0,0 +1,84 @@
+import random
+from datetime import timedelta
+from decimal import Decimal
+from django.contrib.auth.models import User
+from django.utils import timezone
+from .importers import UNITS
+from .models import DailySales, Ingredient, MenuItem, Purchase, RecipeRequirement, StockMovement
+
+
+def _chunks(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def generate(ingredients=200, menu_items=50, purchases=10000, days=365, recipe_size=(3, 8), seed=0, batch_size=5000, progress=None):
+    """
+    Bulk insert a synthetic restaurant: ingredients, menu items with recipes
+    and ``purchases`` sales spread over the last ``days`` days, busier at
+    lunch and dinner and for a few popular items. ``progress`` is called
+    with the number of purchases inserted so far after each batch. Returns
+    the row counts.
+    """
+    rng = random.Random(seed)
+    user, _ = User.objects.get_or_create(username='synthetic')
+    suffix = rng.randrange(10 ** 6)
+
+    new_ingredients = Ingredient.objects.bulk_create(
+        [
+            Ingredient(
+                name=f'Ingredient {suffix}-{number}',
+                quantity=Decimal(rng.randrange(10 ** 5, 10 ** 7)),
+                unit=rng.choice(UNITS),
+                unit_price=Decimal(rng.randrange(5, 5000)) / 100,
+                lead_time_days=rng.randint(1, 7),
+            )
+            for number in range(ingredients)
+        ],
+        batch_size=batch_size,
+    )
+    StockMovement.objects.bulk_create(
+        [StockMovement.objects.difference(ingredient.pk, None, ingredient.quantity) for ingredient in new_ingredients],
+        batch_size=batch_size,
+    )
+    new_menu_items = MenuItem.objects.bulk_create(
+        [MenuItem(name=f'Menu Item {suffix}-{number}', price=Decimal(rng.randrange(300, 4000)) / 100) for number in range(menu_items)],
+        batch_size=batch_size,
+    )
+    requirements = [
+        RecipeRequirement(menu_item=menu_item, ingredient=ingredient, quantity=Decimal(rng.randrange(1, 500)) / 100)
+        for menu_item in new_menu_items
+        for ingredient in rng.sample(new_ingredients, min(len(new_ingredients), rng.randint(*recipe_size)))
+    ]
+    RecipeRequirement.objects.bulk_create(requirements, batch_size=batch_size)
+    MenuItem.objects.refresh_unit_costs([menu_item.pk for menu_item in new_menu_items])
+
+    weights = [1 / (rank + 1) for rank in range(len(new_menu_items))]
+    hours = list(range(8, 22))
+    hour_weights = [1, 1, 2, 3, 6, 6, 3, 2, 2, 3, 6, 6, 3, 1]
+    now = timezone.now()
+    start = now - timedelta(days=days)
+    for chunk in _chunks(range(purchases), batch_size):
+        Purchase.objects.insert_backdated(
+            [
+                Purchase(
+                    menu_item=rng.choices(new_menu_items, weights)[0],
+                    quantity=rng.choices([1, 2, 3, 4], [70, 20, 7, 3])[0],
+                    logged_by=user,
+                    purchase_time=min(now, (start + timedelta(days=rng.randrange(days + 1))).replace(
+                        hour=rng.choices(hours, hour_weights)[0], minute=rng.randrange(60), second=rng.randrange(60),
+                    )),
+                )
+                for _ in chunk
+            ],
+            batch_size=batch_size,
+        )
+        if progress:
+            progress(chunk.stop)
+    DailySales.objects.rebuild(timezone.localdate(start), timezone.localdate(now))
+    return {
+        'ingredients': len(new_ingredients),
+        'menu_items': len(new_menu_items),
+        'recipe_requirements': len(requirements),
+        'purchases': purchases,
+    }
@@ -0,0 +1,277 @@
+import logging
+import secrets
+import time
+import traceback
+from datetime import date, timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.contrib.auth.models import User
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+from . import exports, reorder, routers
+from .models import DailySales, MenuItem, Purchase, StockMovement, StockSnapshot, Task, stock_changed
+
+logger = logging.getLogger(__name__)
+
+REGISTRY = {}
+
+# Without a worker, committing requests do its housekeeping at most this often.
+HOUSEKEEPING_INTERVAL = 300
+_next_housekeeping = 0
+
+
+def task(atomic=True, max_attempts=3, retry_delay=30, tracked=True):
+    """
+    Register a function as a task and give it ``defer(key=None, delay=None,
+    **kwargs)``. Atomic tasks run in the same transaction that marks them
+    done, so a retried task never applies its writes twice; long tasks that
+    only read should pass ``atomic=False``. Failures are retried with
+    exponential backoff starting at ``retry_delay`` seconds. With
+    TASKS_EAGER, a task with ``tracked=False`` runs on commit without a Task
+    row, and is only queued if it fails.
+    """
+    def decorator(fn):
+        fn.task_name = f'{fn.__module__}.{fn.__name__}'
+        fn.atomic = atomic
+        fn.max_attempts = max_attempts
+        fn.retry_delay = retry_delay
+        fn.tracked = tracked
+        fn.defer = lambda key=None, delay=None, **kwargs: defer(fn, kwargs, key, delay)
+        REGISTRY[fn.task_name] = fn
+        return fn
+    return decorator
+
+
+def defer(fn, kwargs, key=None, delay=None):
+    """
+    Queue ``fn(**kwargs)``; ``kwargs`` must be JSON serializable. Returns the
+    Task, or None for an untracked task run eagerly. Eager mode only runs
+    tasks that are due; later ones wait for housekeeping to find them due.
+    """
+    if settings.TASKS_EAGER and not fn.tracked and not delay:
+        transaction.on_commit(lambda: _run_untracked(fn, kwargs, key))
+        transaction.on_commit(eager_housekeeping)
+        return None
+    run_after = timezone.now() + delay if delay else None
+    queued = Task.objects.enqueue(fn.task_name, kwargs, key=key, run_after=run_after)
+    if settings.TASKS_EAGER:
+        if queued.status == Task.QUEUED and queued.run_after <= timezone.now():
+            transaction.on_commit(lambda: run_task(queued.pk))
+        transaction.on_commit(eager_housekeeping)
+    return queued
+
+
+def _run_untracked(fn, kwargs, key):
+    try:
+        if fn.atomic:
+            with transaction.atomic():
+                fn(**kwargs)
+        else:
+            fn(**kwargs)
+    except Exception:
+        logger.exception('Task %s failed', fn.task_name)
+        # Queued from here on, so it is retried like any other task.
+        queued = Task.objects.enqueue(fn.task_name, kwargs, key=key, run_after=timezone.now() + timedelta(seconds=fn.retry_delay))
+        Task.objects.filter(pk=queued.pk).update(
+            status=Task.QUEUED if fn.max_attempts > 1 else Task.FAILED, attempts=1, last_error=traceback.format_exc(),
+        )
+
+
+def _claim(pk):
+    return Task.objects.filter(pk=pk, status=Task.QUEUED).update(status=Task.RUNNING, locked_at=timezone.now())
+
+
+def _finish(pk, result):
+    Task.objects.filter(pk=pk).update(
+        status=Task.DONE, attempts=F('attempts') + 1, result=result, locked_at=None, updated_at=timezone.now(),
+    )
+
+
+def run_task(pk):
+    """Run one queued task, unless another worker got to it first. Returns whether it succeeded."""
+    task = Task.objects.filter(pk=pk, status=Task.QUEUED).first()
+    if task is None:
+        return False
+    fn = REGISTRY.get(task.name)
+    try:
+        if fn is None:
+            raise LookupError(f'Unknown task {task.name}')
+        if fn.atomic:
+            with transaction.atomic():
+                if not _claim(pk):
+                    return False
+                _finish(pk, fn(**task.kwargs))
+        else:
+            if not _claim(pk):
+                return False
+            _finish(pk, fn(**task.kwargs))
+    except Exception:
+        logger.exception('Task %s (%s) failed', task.pk, task.name)
+        attempts = task.attempts + 1
+        retry = fn is not None and attempts < fn.max_attempts
+        Task.objects.filter(pk=pk).update(
+            status=Task.QUEUED if retry else Task.FAILED,
+            attempts=attempts,
+            last_error=traceback.format_exc(),
+            run_after=timezone.now() + timedelta(seconds=fn.retry_delay * 2 ** (attempts - 1)) if retry else F('run_after'),
+            locked_at=None,
+            updated_at=timezone.now(),
+        )
+        return False
+    return True
+
+
+def requeue_stale(seconds):
+    """Put non-atomic tasks whose worker died mid-run back on the queue."""
+    return Task.objects.filter(status=Task.RUNNING, locked_at__lt=timezone.now() - timedelta(seconds=seconds)).update(
+        status=Task.QUEUED, locked_at=None,
+    )
+
+
+def purge(days):
+    """Delete finished and failed tasks older than ``days``; their idempotency keys can be reused afterwards."""
+    return Task.objects.filter(status__in=[Task.DONE, Task.FAILED], updated_at__lt=timezone.now() - timedelta(days=days)).delete()[0]
+
+
+@task(tracked=False)
+def record_daily_sales(purchase_ids):
+    DailySales.objects.record(Purchase.objects.filter(pk__in=purchase_ids).only('menu_item', 'quantity', 'purchase_time'))
+    # Re-estimate reorder points at most once an hour, after the hour's sales.
+    next_hour = timezone.localtime().replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+    refresh_reorder_points.defer(key=f'reorder-points:{next_hour.isoformat()}', delay=next_hour - timezone.now())
+
+
+@task()
+def refresh_reorder_points(window_days=28):
+    return {'ingredients': reorder.refresh_reorder_points(window_days)}
+
+
+@task()
+def take_stock_snapshots():
+    return {'snapshots': len(StockSnapshot.objects.take())}
+
+
+def schedule_hourly():
+    """Queue the hourly stock snapshot; the key makes it once an hour however many workers ask."""
+    hour = timezone.localtime().replace(minute=0, second=0, microsecond=0)
+    take_stock_snapshots.defer(key=f'stock-snapshots:{hour.isoformat()}')
+
+
+def housekeeping(stale_after=600, purge_days=7):
+    """Requeue stale tasks, delete old ones and queue the hourly stock snapshot."""
+    requeue_stale(stale_after)
+    purge(purge_days)
+    schedule_hourly()
+
+
+def eager_housekeeping(limit=10):
+    """
+    Stand in for the worker when TASKS_EAGER is on: every HOUSEKEEPING_INTERVAL
+    seconds, do its housekeeping and run up to ``limit`` tasks that have come
+    due (delayed tasks and retries).
+    """
+    global _next_housekeeping
+    if time.monotonic() < _next_housekeeping:
+        return
+    _next_housekeeping = time.monotonic() + HOUSEKEEPING_INTERVAL
+    housekeeping()
+    for pk in list(Task.objects.due().values_list('pk', flat=True)[:limit]):
+        run_task(pk)
+
+
+@task(atomic=False, max_attempts=2)
+def generate_export(dataset, fmt, start=None, end=None):
+    """Write an export to EXPORT_ROOT and return its file name."""
+    start = date.fromisoformat(start) if start else None
+    end = date.fromisoformat(end) if end else None
+    settings.EXPORT_ROOT.mkdir(parents=True, exist_ok=True)
+    filename = f'{dataset}-{timezone.now():%Y%m%d%H%M%S}-{secrets.token_hex(4)}.{fmt}'
+    with open(settings.EXPORT_ROOT / filename, 'w', newline='') as f, routers.replica():
+        f.writelines(exports.stream(dataset, fmt, start, end))
+    return {'file': filename}
+
+
+@receiver(stock_changed)
+@receiver(post_save, sender=StockMovement)
+def housekeeping_on_stock_change(sender, **kwargs):
+    # Without a worker, stock changes keep the hourly snapshots coming, so
+    # stock_at() only adds up the movements since the last one.
+    if settings.TASKS_EAGER:
+        transaction.on_commit(eager_housekeeping)
+
+
+def _daily_sales_key(purchase_pk):
+    return f'daily-sales:{purchase_pk}'
+
+
+def _rollup_pending(purchase_pk):
+    # A running task holds its row until it commits, so this waits for it.
+    return Task.objects.select_for_update().filter(
+        idempotency_key=_daily_sales_key(purchase_pk), status__in=[Task.QUEUED, Task.FAILED],
+    ).exists()
+
+
+@receiver(post_save, sender=Purchase)
+def update_daily_sales_on_purchase(sender, instance, created, **kwargs):
+    if created:
+        record_daily_sales.defer(key=_daily_sales_key(instance.pk), purchase_ids=[instance.pk])
+        return
+    previous = getattr(instance, '_previous', None)
+    if previous is None or (
+        (timezone.localdate(previous.purchase_time), previous.menu_item_id, previous.quantity)
+        == (timezone.localdate(instance.purchase_time), instance.menu_item_id, instance.quantity)
+    ):
+        return
+    # A queued task reads the edited row when it runs, and a failed one never
+    # added the sale, so only a sale already rolled up is moved.
+    if not _rollup_pending(instance.pk):
+        DailySales.objects.record([previous], sign=-1)
+        DailySales.objects.record([instance])
+
+
+def _drop_pending_rollups(purchase_ids, batch_size=500):
+    """Delete the queued or failed rollup tasks of these purchases; returns their purchase ids."""
+    purchase_ids = list(purchase_ids)
+    pending = set()
+    with transaction.atomic():
+        for start in range(0, len(purchase_ids), batch_size):
+            keys = {_daily_sales_key(pk): pk for pk in purchase_ids[start:start + batch_size]}
+            # A running task holds its row until it commits, so this waits for it.
+            rows = list(
+                Task.objects.select_for_update()
+                .filter(idempotency_key__in=keys, status__in=[Task.QUEUED, Task.FAILED])
+                .values_list('pk', 'idempotency_key')
+            )
+            if rows:
+                Task.objects.filter(pk__in=[pk for pk, _ in rows]).delete()
+                pending.update(keys[key] for _, key in rows)
+    return pending
+
+
+def take_out_of_rollups(purchases):
+    """Take deleted purchases back out of the daily sales rollups, in one pass."""
+    purchases = list(purchases)
+    # A sale whose rollup task has not run yet, or failed for good, was never
+    # added, so only the task needs dropping.
+    pending = _drop_pending_rollups(purchase.pk for purchase in purchases)
+    DailySales.objects.record([purchase for purchase in purchases if purchase.pk not in pending], sign=-1)
+
+
+@receiver(post_delete, sender=Purchase)
+def update_daily_sales_on_purchase_delete(sender, instance, origin=None, **kwargs):
+    # Cascades are handled once, before the delete, by the receivers below.
+    if isinstance(origin, Purchase) or getattr(origin, 'model', None) is Purchase:
+        take_out_of_rollups([instance])
+
+
+@receiver(pre_delete, sender=MenuItem)
+def drop_rollups_on_menu_item_delete(sender, instance, **kwargs):
+    # Its rollup rows go with it, so only its pending rollup tasks need dropping.
+    _drop_pending_rollups(Purchase.objects.filter(menu_item=instance).values_list('pk', flat=True))
+
+
+@receiver(pre_delete, sender=User)
+def update_daily_sales_on_user_delete(sender, instance, **kwargs):
+    take_out_of_rollups(Purchase.objects.filter(logged_by=instance).only('menu_item', 'quantity', 'purchase_time'))
@@ -1,3 +1,857 @@
-from django.test import TestCase
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.management import CommandError, call_command
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from .events import CacheBroker, get_broker
+from .caching import cached
+from .importers import run_import
+from .models import DailySales, Ingredient, MenuItem, RecipeRequirement, Purchase, PurchaseArchive, StockMovement, StockSnapshot, Task
+from . import archive, availability, benchmarks, exports, forecasting, menu_engineering, reorder, routers, tasks
 
-# Create your tests here.
+
+class QueryBudgetTests(TestCase):
+    """
+    Every list page must run the same number of queries no matter how many
+    rows it renders.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='staff', password='password', is_staff=True, is_superuser=True)
+        self.client.force_login(self.user)
+        self.rows = 0
+
+    def add_rows(self, count):
+        # Run on_commit hooks so cached pages are invalidated and re-queried.
+        with self.captureOnCommitCallbacks(execute=True):
+            for _ in range(count):
+                self.rows += 1
+                ingredient = Ingredient.objects.create(
+                    name=f'Ingredient {self.rows}', quantity=1000, unit='g', unit_price=Decimal('0.10')
+                )
+                menu_item = MenuItem.objects.create(name=f'Item {self.rows}', price=Decimal('5.00'))
+                RecipeRequirement.objects.create(menu_item=menu_item, ingredient=ingredient, quantity=10)
+                Purchase.objects.create(menu_item=menu_item, quantity=1, logged_by=self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context.captured_queries)
+
+    def assertConstantQueries(self, url):
+        self.add_rows(2)
+        baseline = self.count_queries(url)
+        self.add_rows(5)
+        self.assertEqual(self.count_queries(url), baseline, f'{url} issues a query per row')
+
+    def test_home(self):
+        self.assertConstantQueries(reverse('home'))
+
+    def test_ingredient_list(self):
+        self.assertConstantQueries(reverse('ingredient-list'))
+
+    def test_menu_list(self):
+        self.assertConstantQueries(reverse('menu-list'))
+
+    def test_purchase_list(self):
+        self.assertConstantQueries(reverse('purchase-list'))
+
+    def test_profit_and_revenue(self):
+        self.assertConstantQueries(reverse('profit-and-revenue'))
+
+    def test_forecast(self):
+        self.assertConstantQueries(reverse('forecast'))
+
+    def test_menu_engineering(self):
+        self.assertConstantQueries(reverse('menu-engineering'))
+        self.assertConstantQueries('/api/menu-items/engineering/?format=json')
+
+    def test_api_lists(self):
+        for endpoint in ('ingredients', 'menu-items', 'recipe-requirements', 'purchases'):
+            with self.subTest(endpoint=endpoint):
+                self.assertConstantQueries(f'/api/{endpoint}/?format=json')
+
+    def test_live_api(self):
+        for name in ('live-menu-items', 'live-ingredients', 'live-availability', 'live-dashboard'):
+            with self.subTest(name=name):
+                self.assertConstantQueries(reverse(name))
+
+    def test_admin_changelists(self):
+        for model in ('ingredient', 'menuitem', 'reciperequirement', 'purchase', 'dailysales'):
+            with self.subTest(model=model):
+                self.assertConstantQueries(reverse(f'admin:inventory_{model}_changelist'))
+
+
+class BenchmarkTests(TestCase):
+    def test_every_target_answers(self):
+        user = User.objects.create_user(username='staff', password='password', is_staff=True, is_superuser=True)
+        flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        RecipeRequirement.objects.create(menu_item=cake, ingredient=flour, quantity=500, unit='g')
+        Purchase.objects.create(menu_item=cake, quantity=1, logged_by=user)
+        Task.objects.create(name='inventory.tasks.refresh_reorder_points')
+        self.client.force_login(user)
+        failed = {}
+        for name, url in benchmarks.targets():
+            status = self.client.get(url).status_code
+            if status >= 400:
+                failed[name] = (url, status)
+        self.assertEqual(failed, {})
+
+
+class InstrumentationTests(TestCase):
+    def test_server_timing_header_is_opt_in(self):
+        url = '/api/menu-items/?format=json'
+        self.assertNotIn('Server-Timing', self.client.get(url))
+        with override_settings(SERVER_TIMING=True):
+            self.assertIn('db;dur=', self.client.get(url)['Server-Timing'])
+
+
+class ApiTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(self.user)
+
+    def get(self, url):
+        response = self.client.get(url, HTTP_ACCEPT='application/json')
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_cursor_pagination(self):
+        for name in ('Eggs', 'Butter', 'Flour', 'Apples', 'Dates'):
+            Ingredient.objects.create(name=name, quantity=1, unit='kg', unit_price=Decimal('1.00'))
+        names, url, pages = [], '/api/ingredients/?page_size=2', []
+        while url:
+            page = self.get(url)
+            pages.append(page)
+            names += [row['name'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(names, ['Apples', 'Butter', 'Dates', 'Eggs', 'Flour'])
+        self.assertEqual([len(page['results']) for page in pages], [2, 2, 1])
+        self.assertIsNone(pages[0]['previous'])
+        self.assertEqual([row['name'] for row in self.get(pages[-1]['previous'])['results']], ['Dates', 'Eggs'])
+
+    def test_sparse_fields(self):
+        Ingredient.objects.create(name='Flour', quantity=1, unit='kg', unit_price=Decimal('1.00'))
+        [row] = self.get('/api/ingredients/?fields=name,unit')['results']
+        self.assertEqual(row, {'name': 'Flour', 'unit': 'kg'})
+
+    def test_purchase_filters(self):
+        coffee = MenuItem.objects.create(name='Coffee', price=Decimal('3.00'))
+        tea = MenuItem.objects.create(name='Tea', price=Decimal('2.00'))
+        today = timezone.localdate()
+        for days_ago, menu_item, quantity in [(0, coffee, 1), (1, tea, 2), (3, coffee, 3)]:
+            purchase = Purchase.objects.create(menu_item=menu_item, quantity=quantity, logged_by=self.user)
+            Purchase.objects.filter(pk=purchase.pk).update(purchase_time=purchase.purchase_time - timedelta(days=days_ago))
+        quantities = lambda query: sorted(row['quantity'] for row in self.get(f'/api/purchases/?{query}')['results'])
+        self.assertEqual(quantities(f'start={today - timedelta(days=1)}'), [1, 2])
+        self.assertEqual(quantities(f'end={today - timedelta(days=1)}'), [2, 3])
+        self.assertEqual(quantities(f'menu_item={coffee.pk}'), [1, 3])
+        self.assertEqual(quantities(f'menu_item={coffee.pk},{tea.pk}&start={today - timedelta(days=2)}'), [1, 2])
+        for query in ('start=yesterday', 'end=2024-02-30', 'menu_item=coffee'):
+            with self.subTest(query=query):
+                self.assertEqual(self.client.get(f'/api/purchases/?{query}', HTTP_ACCEPT='application/json').status_code, 400)
+
+
+class PurchaseTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='password')
+        self.client.force_login(self.user)
+        self.flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        self.eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        self.cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        RecipeRequirement.objects.create(menu_item=self.cake, ingredient=self.flour, quantity=500, unit='g')
+        RecipeRequirement.objects.create(menu_item=self.cake, ingredient=self.eggs, quantity=4)
+
+    def assertStock(self, flour, eggs):
+        self.flour.refresh_from_db()
+        self.eggs.refresh_from_db()
+        self.assertEqual((self.flour.quantity, self.eggs.quantity), (Decimal(flour), Decimal(eggs)))
+
+    def test_purchase_deducts_stock(self):
+        Purchase.objects.create(menu_item=self.cake, quantity=2, logged_by=self.user)
+        # 2 x 500 g of flour stocked in kg, and 2 x 4 eggs.
+        self.assertStock('9', '4')
+
+    def test_deduction_uses_current_stock(self):
+        # A stale instance must not overwrite stock changed elsewhere since.
+        Ingredient.objects.filter(pk=self.flour.pk).update(quantity=5)
+        Purchase.objects.create(menu_item=self.cake, quantity=1, logged_by=self.user)
+        self.assertStock('4.5', '8')
+
+    def test_editing_purchase_deducts_difference(self):
+        purchase = Purchase.objects.create(menu_item=self.cake, quantity=1, logged_by=self.user)
+        url = f'/api/purchases/{purchase.pk}/'
+        response = self.client.patch(url, {'quantity': 2}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertStock('9', '4')
+        self.client.patch(url, {'quantity': 1}, content_type='application/json')
+        self.assertStock('9.5', '8')
+        # Too few eggs for 4 cakes: the edit is refused and nothing changes.
+        response = self.client.patch(url, {'quantity': 4}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertStock('9.5', '8')
+        purchase.refresh_from_db()
+        self.assertEqual(purchase.quantity, 1)
+
+    def test_purchase_list_is_paginated(self):
+        Purchase.objects.insert_backdated(
+            Purchase(menu_item=self.cake, quantity=1, logged_by=self.user, purchase_time=timezone.now() - timedelta(minutes=n))
+            for n in range(150)
+        )
+        response = self.client.get(reverse('purchase-list'))
+        self.assertEqual(len(response.context['purchases']), 100)
+        self.assertContains(response, 'Page 1 of 2')
+        response = self.client.get(reverse('purchase-list'), {'page': 2})
+        self.assertEqual(len(response.context['purchases']), 50)
+
+    def test_shortage_rolls_back(self):
+        with self.assertRaises(ValidationError):
+            Purchase.objects.create(menu_item=self.cake, quantity=4, logged_by=self.user)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertStock('10', '12')
+
+    def test_shortage_reported_by_form(self):
+        response = self.client.post(reverse('purchase-add'), {'menu_item': self.cake.pk, 'quantity': 4})
+        self.assertContains(response, 'Not enough Eggs in inventory.')
+        self.assertFalse(Purchase.objects.exists())
+        self.assertStock('10', '12')
+
+    def post_bulk(self, *quantities):
+        menu_item = reverse('menuitem-detail', args=[self.cake.pk])
+        return self.client.post(
+            '/api/purchases/bulk/', [{'menu_item': menu_item, 'quantity': quantity} for quantity in quantities], content_type='application/json',
+        )
+
+    def test_bulk_record(self):
+        response = self.post_bulk(1, 1)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json(), {'created': 2})
+        self.assertEqual(Purchase.objects.count(), 2)
+        self.assertStock('9', '4')
+        # One deduction for the whole batch: a single ledger entry per ingredient.
+        self.assertEqual(
+            sorted(StockMovement.objects.filter(kind=StockMovement.SALE).values_list('quantity', flat=True)),
+            [Decimal('-8'), Decimal('-1')],
+        )
+        rollup = DailySales.objects.get(menu_item=self.cake, day=timezone.localdate())
+        self.assertEqual((rollup.units_sold, rollup.revenue), (2, Decimal('40.00')))
+
+    def test_bulk_record_shortage_rolls_back_batch(self):
+        # Each row fits on its own, but together they need 16 eggs.
+        response = self.post_bulk(2, 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('Not enough Eggs in inventory.', response.json()[0])
+        self.assertFalse(Purchase.objects.exists())
+        self.assertFalse(DailySales.objects.exists())
+        self.assertFalse(StockMovement.objects.filter(kind=StockMovement.SALE).exists())
+        self.assertStock('10', '12')
+
+    def test_rollup_row_created_concurrently_is_added_to(self):
+        add = DailySales.objects._add
+
+        def racing_add(day, menu_item_id, *args):
+            updated = add(day, menu_item_id, *args)
+            # Another transaction creates the row between the update and the insert.
+            if not DailySales.objects.exists():
+                DailySales.objects.bulk_create([DailySales(day=day, menu_item_id=menu_item_id, units_sold=1, revenue=Decimal('20.00'))])
+            return updated
+
+        with mock.patch.object(DailySales.objects, '_add', side_effect=racing_add):
+            DailySales.objects.record([Purchase(menu_item=self.cake, quantity=2, purchase_time=timezone.now())])
+        rollup = DailySales.objects.get(menu_item=self.cake)
+        self.assertEqual((rollup.units_sold, rollup.revenue), (3, Decimal('60.00')))
+
+    def break_flour_unit(self):
+        # A direct database edit, so Ingredient.clean() doesn't get a say.
+        Ingredient.objects.filter(pk=self.flour.pk).update(unit='pcs')
+
+    def test_inconvertible_recipe_rejects_form_purchase(self):
+        self.break_flour_unit()
+        response = self.client.post(reverse('purchase-add'), {'menu_item': self.cake.pk, 'quantity': 1})
+        self.assertContains(response, 'cannot be converted')
+        self.assertFalse(Purchase.objects.exists())
+        self.assertStock('10', '12')
+
+    def test_inconvertible_recipe_rejects_api_purchase(self):
+        self.break_flour_unit()
+        response = self.client.post(
+            '/api/purchases/', {'menu_item': reverse('menuitem-detail', args=[self.cake.pk]), 'quantity': 1}, content_type='application/json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('cannot be converted', response.json()[0])
+        self.assertFalse(Purchase.objects.exists())
+        self.assertStock('10', '12')
+
+
+class IngredientUnitTests(TestCase):
+    """An ingredient's unit can't change to one its recipe lines can't be converted to."""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(self.user)
+        self.flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        self.cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        RecipeRequirement.objects.create(menu_item=self.cake, ingredient=self.flour, quantity=500, unit='g')
+
+    def assertUnit(self, unit):
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.unit, unit)
+
+    def test_model_clean(self):
+        self.flour.unit = 'pcs'
+        with self.assertRaises(ValidationError) as context:
+            self.flour.full_clean()
+        self.assertIn('unit', context.exception.message_dict)
+        self.flour.unit = 'lb'
+        self.flour.full_clean()
+
+    def test_form(self):
+        data = {'name': 'Flour', 'quantity': 10, 'unit': 'pcs', 'unit_price': '2.00', 'lead_time_days': 3}
+        response = self.client.post(reverse('ingredient-update', args=[self.flour.pk]), data)
+        self.assertContains(response, 'cannot be converted')
+        self.assertUnit('kg')
+
+    def test_api(self):
+        url = reverse('ingredient-detail', args=[self.flour.pk])
+        response = self.client.patch(url, {'unit': 'pcs'}, content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('unit', response.json())
+        self.assertUnit('kg')
+        response = self.client.patch(url, {'unit': 'lb'}, content_type='application/json')
+        self.assertEqual(response.status_code, 200)
+        self.assertUnit('lb')
+
+    def test_import(self):
+        rows = StringIO('name,quantity,unit,unit_price\nFlour,10,pcs,2.00\nSugar,5,kg,1.00\n')
+        result = run_import('ingredients', rows, 'csv')
+        self.assertEqual([line for line, _ in result.errors], [2])
+        self.assertEqual(result.created, 1)
+        self.assertUnit('kg')
+
+    def test_inconvertible_line_left_out_everywhere(self):
+        cache.clear()
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        RecipeRequirement.objects.create(menu_item=self.cake, ingredient=eggs, quantity=2)
+        # A direct database edit, so RecipeRequirement.clean() doesn't get a say.
+        RecipeRequirement.objects.filter(ingredient=eggs).update(unit='g')
+        MenuItem.objects.refresh_unit_costs()
+        DailySales.objects.create(day=timezone.localdate(), menu_item=self.cake, units_sold=28)
+        reorder.refresh_reorder_points()
+        self.cake.refresh_from_db()
+        eggs.refresh_from_db()
+        self.assertEqual(self.cake.unit_cost, Decimal('1.00'))
+        self.assertEqual(availability.compute()[self.cake.pk], 20)
+        self.assertEqual(menu_engineering.report()['menu_items'][0]['cost'], 1.0)
+        self.assertEqual(eggs.daily_usage, 0)
+
+
+class UnitCostTests(TestCase):
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        self.cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        self.bread = MenuItem.objects.create(name='Bread', price=Decimal('5.00'))
+
+    def assertCosts(self, cake, bread):
+        costs = dict(MenuItem.objects.values_list('name', 'unit_cost'))
+        self.assertEqual((costs['Cake'], costs['Bread']), (Decimal(cake), Decimal(bread)))
+
+    def test_recipe_line_added_moved_and_deleted(self):
+        line = RecipeRequirement.objects.create(menu_item=self.cake, ingredient=self.flour, quantity=500, unit='g')
+        self.assertCosts('1', '0')
+        line.menu_item = self.bread
+        line.save()
+        self.assertCosts('0', '1')
+        line.delete()
+        self.assertCosts('0', '0')
+
+    def test_ingredient_price_and_unit_changes(self):
+        RecipeRequirement.objects.create(menu_item=self.cake, ingredient=self.flour, quantity=500, unit='g')
+        self.flour.unit_price = Decimal('4.00')
+        self.flour.save()
+        self.assertCosts('2', '0')
+        # Now $4 a pound: 500 g is 1.10231 lb.
+        self.flour.unit = 'lb'
+        self.flour.save()
+        self.assertCosts('4.40925', '0')
+
+
+class StockLedgerTests(TestCase):
+    def setUp(self):
+        self.flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+
+    def movements(self):
+        return list(StockMovement.objects.filter(ingredient=self.flour).order_by('id').values_list('kind', 'quantity'))
+
+    def test_record_changes_stock_and_appends_movement(self):
+        StockMovement.objects.record(self.flour.pk, StockMovement.RESTOCK, Decimal('5'))
+        with self.assertRaises(ValidationError):
+            StockMovement.objects.record(self.flour.pk, StockMovement.WASTE, Decimal('-20'))
+        self.flour.refresh_from_db()
+        self.assertEqual(self.flour.quantity, 15)
+        self.assertEqual(self.movements(), [(StockMovement.RESTOCK, 10), (StockMovement.RESTOCK, 5)])
+
+    def test_save_records_adjustment_against_current_stock(self):
+        stale = Ingredient.objects.get(pk=self.flour.pk)
+        Ingredient.objects.consume({self.flour.pk: Decimal('2')})
+        stale.quantity = 6
+        stale.save()
+        stale.save()
+        self.assertEqual(
+            self.movements(),
+            [(StockMovement.RESTOCK, 10), (StockMovement.SALE, -2), (StockMovement.ADJUSTMENT, -2)],
+        )
+
+    def test_stock_at_adds_movements_since_snapshot(self):
+        base = timezone.now()
+        StockMovement.objects.filter(ingredient=self.flour).update(created_at=base)
+        restock = StockMovement.objects.record(self.flour.pk, StockMovement.RESTOCK, Decimal('5'))
+        StockMovement.objects.filter(pk=restock.pk).update(created_at=base + timedelta(hours=1))
+        StockSnapshot.objects.create(ingredient=self.flour, quantity=15, taken_at=base + timedelta(hours=2))
+        waste = StockMovement.objects.record(self.flour.pk, StockMovement.WASTE, Decimal('-3'))
+        StockMovement.objects.filter(pk=waste.pk).update(created_at=base + timedelta(hours=3))
+        at = lambda hours: StockMovement.objects.stock_at(base + timedelta(hours=hours)).get(self.flour.pk)
+        self.assertEqual([at(0.5), at(1.5), at(2.5), at(4)], [10, 15, 15, 12])
+        # Movements before the snapshot are no longer read.
+        StockMovement.objects.filter(created_at__lt=base + timedelta(hours=2)).delete()
+        self.assertEqual(at(4), 12)
+
+    def test_take_snapshots_only_moved_ingredients(self):
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        self.assertEqual(sorted(snapshot.quantity for snapshot in StockSnapshot.objects.take()), [10, 12])
+        self.assertEqual(StockSnapshot.objects.take(), [])
+        StockMovement.objects.record(eggs.pk, StockMovement.WASTE, Decimal('-2'))
+        self.assertEqual([(snapshot.ingredient_id, snapshot.quantity) for snapshot in StockSnapshot.objects.take()], [(eggs.pk, 10)])
+
+    @override_settings(TASKS_EAGER=True)
+    def test_snapshots_taken_without_worker(self):
+        tasks._next_housekeeping = 0
+        with self.captureOnCommitCallbacks(execute=True):
+            StockMovement.objects.record(self.flour.pk, StockMovement.RESTOCK, Decimal('5'))
+        self.assertEqual(StockSnapshot.objects.get().quantity, 15)
+
+
+class AvailabilityTests(TestCase):
+    def test_servings_from_scarcest_ingredient(self):
+        flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        milk = Ingredient.objects.create(name='Milk', quantity=0, unit='l', unit_price=Decimal('1.00'))
+        cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        bread = MenuItem.objects.create(name='Bread', price=Decimal('5.00'))
+        latte = MenuItem.objects.create(name='Latte', price=Decimal('4.00'))
+        water = MenuItem.objects.create(name='Water', price=Decimal('1.00'))
+        RecipeRequirement.objects.create(menu_item=cake, ingredient=flour, quantity=500, unit='g')
+        RecipeRequirement.objects.create(menu_item=cake, ingredient=eggs, quantity=5)
+        sugar = Ingredient.objects.create(name='Sugar', quantity=Decimal('0.3'), unit='kg', unit_price=Decimal('1.00'))
+        # 0.3 / 0.1 is 2.9999999999999996 in floats; it is still 3 loaves.
+        RecipeRequirement.objects.create(menu_item=bread, ingredient=sugar, quantity=Decimal('0.1'))
+        RecipeRequirement.objects.create(menu_item=latte, ingredient=milk, quantity=200, unit='ml')
+        self.assertEqual(
+            availability.compute(),
+            {cake.pk: 2, bread.pk: 3, latte.pk: 0, water.pk: None},
+        )
+
+
+class ReorderTests(TestCase):
+    def test_daily_usage_and_reorder_point(self):
+        today = timezone.localdate()
+        salt = Ingredient.objects.create(name='Salt', quantity=1, unit='g', unit_price=Decimal('0.01'), lead_time_days=3)
+        flour = Ingredient.objects.create(name='Flour', quantity=1, unit='kg', unit_price=Decimal('2.00'), lead_time_days=1)
+        bread = MenuItem.objects.create(name='Bread', price=Decimal('4.00'))
+        RecipeRequirement.objects.create(menu_item=bread, ingredient=salt, quantity=10)
+        RecipeRequirement.objects.create(menu_item=bread, ingredient=flour, quantity=1000, unit='g')
+        DailySales.objects.create(day=today, menu_item=bread, units_sold=1)
+        # Outside the window.
+        DailySales.objects.create(day=today - timedelta(days=28), menu_item=bread, units_sold=50)
+        reorder.refresh_reorder_points(window_days=28, today=today)
+        salt.refresh_from_db()
+        flour.refresh_from_db()
+        # 10 g and 1 kg over 28 days, with 3 and 1 days' lead time.
+        self.assertEqual((salt.daily_usage, salt.reorder_point), (Decimal('0.357'), Decimal('1.071')))
+        self.assertEqual((flour.daily_usage, flour.reorder_point), (Decimal('0.036'), Decimal('0.036')))
+
+
+class ForecastTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(self.user)
+        self.flour = Ingredient.objects.create(name='Flour', quantity=3, unit='kg', unit_price=Decimal('2.00'))
+        self.bread = MenuItem.objects.create(name='Bread', price=Decimal('4.00'))
+        RecipeRequirement.objects.create(menu_item=self.bread, ingredient=self.flour, quantity=200, unit='g')
+        # Four weeks of 10 loaves on Mondays and 2 on every other day.
+        today = timezone.localdate()
+        for offset in range(1, 29):
+            day = today - timedelta(days=offset)
+            DailySales.objects.create(day=day, menu_item=self.bread, units_sold=10 if day.weekday() == 0 else 2)
+        self.monday = today + timedelta(days=7 - today.weekday())
+
+    def test_projection(self):
+        projection = forecasting.project(self.monday, days=7)
+        self.assertEqual(projection['dates'][0], self.monday)
+        self.assertEqual(projection['servings'][:, 0].round(6).tolist(), [10, 2, 2, 2, 2, 2, 2])
+        flour = [pk for pk, _, _ in projection['ingredients']].index(self.flour.pk)
+        self.assertEqual(projection['usage'][:, flour].round(6).tolist(), [2, 0.4, 0.4, 0.4, 0.4, 0.4, 0.4])
+        prep = forecasting.prep_list(projection)
+        self.assertEqual(prep['menu_items'], [{'id': self.bread.pk, 'name': 'Bread', 'servings': 10.0}])
+        self.assertEqual(prep['ingredients'], [{'id': self.flour.pk, 'name': 'Flour', 'unit': 'kg', 'quantity': 2.0}])
+        # 2 + 0.4 + 0.4 + 0.4 kg passes the 3 kg in stock on Thursday.
+        [shortfall] = forecasting.shortfalls(projection)
+        self.assertEqual(shortfall['runs_out'], self.monday + timedelta(days=3))
+        self.assertEqual((shortfall['needed'], shortfall['short_by']), (4.4, 1.4))
+
+    def test_inconvertible_recipe_line_is_skipped(self):
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        RecipeRequirement.objects.create(menu_item=self.bread, ingredient=eggs, quantity=1)
+        RecipeRequirement.objects.filter(ingredient=eggs).update(unit='g')
+        response = self.client.get(reverse('forecast'), {'start': self.monday.isoformat(), 'format': 'json'})
+        self.assertEqual(response.status_code, 200)
+        report = response.json()
+        self.assertEqual(report['skipped'], [{'menu_item': 'Bread', 'ingredient': 'Eggs', 'unit': 'g', 'stock_unit': 'egg'}])
+        self.assertEqual(report['prep_list']['ingredients'][0]['quantity'], 2.0)
+        self.assertEqual(self.client.get(reverse('forecast')).status_code, 200)
+
+
+class MenuEngineeringTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(self.user)
+        self.dough = Ingredient.objects.create(name='Dough', quantity=1000, unit='g', unit_price=Decimal('0.01'))
+        today = timezone.localdate()
+        # Each recipe costs $1. Margins are 9 or 4, and the average margin per
+        # unit sold is 1430 / 220 = 6.5. An item is popular from 220 * 0.7 / 4 = 38.5 units.
+        for name, price, units in [('Star', '10.00', 100), ('Plowhorse', '5.00', 100), ('Puzzle', '10.00', 10), ('Dog', '5.00', 10)]:
+            menu_item = MenuItem.objects.create(name=name, price=Decimal(price))
+            RecipeRequirement.objects.create(menu_item=menu_item, ingredient=self.dough, quantity=100)
+            DailySales.objects.create(day=today, menu_item=menu_item, units_sold=units)
+
+    def test_classes(self):
+        report = menu_engineering.report()
+        self.assertEqual(report['average_margin'], 6.5)
+        self.assertEqual(report['popularity'], 17.5)
+        self.assertEqual(report['counts'], {'star': 1, 'plowhorse': 1, 'puzzle': 1, 'dog': 1})
+        rows = {row['name']: row for row in report['menu_items']}
+        for name in ('Star', 'Plowhorse', 'Puzzle', 'Dog'):
+            self.assertEqual(rows[name]['class'], name.lower())
+        self.assertEqual((rows['Star']['cost'], rows['Star']['margin'], rows['Star']['contribution']), (1.0, 9.0, 900.0))
+
+    def test_inconvertible_recipe_line_is_skipped(self):
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        dog = MenuItem.objects.get(name='Dog')
+        RecipeRequirement.objects.create(menu_item=dog, ingredient=eggs, quantity=1)
+        RecipeRequirement.objects.filter(ingredient=eggs).update(unit='g')
+        self.assertEqual(self.client.get(reverse('menu-engineering')).status_code, 200)
+        response = self.client.get('/api/menu-items/engineering/?format=json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['skipped'], [{'menu_item': 'Dog', 'ingredient': 'Eggs', 'unit': 'g', 'stock_unit': 'egg'}])
+
+
+@override_settings(TASKS_EAGER=False)
+class TaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='password')
+        self.coffee = MenuItem.objects.create(name='Coffee', price=Decimal('3.00'))
+
+    def purchase(self):
+        purchase = Purchase.objects.create(menu_item=self.coffee, quantity=1, logged_by=self.user)
+        return purchase, Task.objects.get(idempotency_key=f'daily-sales:{purchase.pk}')
+
+    def units_sold(self):
+        return DailySales.objects.get(menu_item=self.coffee).units_sold
+
+    def test_deleting_purchase_with_failed_rollup(self):
+        rolled_up, task = self.purchase()
+        self.assertTrue(tasks.run_task(task.pk))
+        failed, task = self.purchase()
+        Task.objects.filter(pk=task.pk).update(status=Task.FAILED)
+        failed.delete()
+        self.assertEqual(self.units_sold(), 1)
+        self.assertFalse(Task.objects.filter(pk=task.pk).exists())
+        rolled_up.delete()
+        self.assertEqual(self.units_sold(), 0)
+
+    def delete_counting_queries(self, instance):
+        with CaptureQueriesContext(connection) as context:
+            instance.delete()
+        return len(context.captured_queries)
+
+    def test_editing_purchase_updates_rollup(self):
+        tea = MenuItem.objects.create(name='Tea', price=Decimal('2.00'))
+        purchase, task = self.purchase()
+        self.client.force_login(self.user)
+        url = f'/api/purchases/{purchase.pk}/'
+        # Still queued: the task reads the edited row when it runs.
+        self.client.patch(url, {'quantity': 3}, content_type='application/json')
+        tasks.run_task(task.pk)
+        self.assertEqual(self.units_sold(), 3)
+        self.client.patch(url, {'quantity': 2}, content_type='application/json')
+        self.assertEqual(self.units_sold(), 2)
+        self.client.patch(url, {'menu_item': f'http://testserver/api/menu-items/{tea.pk}/'}, content_type='application/json')
+        self.assertEqual(self.units_sold(), 0)
+        rollup = DailySales.objects.get(menu_item=tea)
+        self.assertEqual((rollup.units_sold, rollup.revenue), (2, Decimal('4.00')))
+
+    def test_menu_item_delete_queries_do_not_grow_with_purchases(self):
+        counts = []
+        for sales in (2, 8):
+            self.coffee = MenuItem.objects.create(name=f'Coffee {sales}', price=Decimal('3.00'))
+            for n in range(sales):
+                _, task = self.purchase()
+                if n % 2:
+                    tasks.run_task(task.pk)
+            counts.append(self.delete_counting_queries(self.coffee))
+        self.assertEqual(counts[0], counts[1])
+        self.assertFalse(DailySales.objects.exists())
+        self.assertFalse(Task.objects.filter(idempotency_key__startswith='daily-sales:', status=Task.QUEUED).exists())
+
+    def test_user_delete_takes_purchases_out_of_rollups(self):
+        baker = User.objects.create_user(username='baker', password='password')
+        for user, run in ((self.user, True), (baker, True), (baker, True), (baker, False)):
+            purchase, task = self.purchase()
+            Purchase.objects.filter(pk=purchase.pk).update(logged_by=user)
+            if run:
+                tasks.run_task(task.pk)
+        baker.delete()
+        self.assertEqual(self.units_sold(), 1)
+        self.assertFalse(Task.objects.filter(idempotency_key__startswith='daily-sales:', status=Task.QUEUED).exists())
+
+    def test_purge(self):
+        old = timezone.now() - timedelta(days=8)
+        for status in (Task.QUEUED, Task.DONE, Task.FAILED):
+            Task.objects.create(name=status, status=status)
+        Task.objects.update(updated_at=old)
+        Task.objects.create(name='recent', status=Task.DONE)
+        self.assertEqual(tasks.purge(7), 2)
+        self.assertEqual(sorted(Task.objects.values_list('name', flat=True)), ['queued', 'recent'])
+
+
+@override_settings(TASKS_EAGER=True)
+class EagerTaskTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='password')
+        self.coffee = MenuItem.objects.create(name='Coffee', price=Decimal('3.00'))
+        # Housekeeping is due on the first commit.
+        tasks._next_housekeeping = 0
+
+    def test_rollup_runs_without_task_row(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Purchase.objects.create(menu_item=self.coffee, quantity=2, logged_by=self.user)
+        self.assertEqual(DailySales.objects.get(menu_item=self.coffee).units_sold, 2)
+        self.assertFalse(Task.objects.filter(idempotency_key__startswith='daily-sales:').exists())
+        # The reorder point refresh waits for the next hour.
+        refresh = Task.objects.get(idempotency_key__startswith='reorder-points:')
+        self.assertEqual(refresh.status, Task.QUEUED)
+        self.assertGreater(refresh.run_after, timezone.now())
+
+    def test_housekeeping_runs_without_worker(self):
+        Ingredient.objects.create(name='Beans', quantity=5, unit='kg', unit_price=Decimal('9.00'))
+        stale = Task.objects.create(name='old', status=Task.DONE)
+        Task.objects.filter(pk=stale.pk).update(updated_at=timezone.now() - timedelta(days=8))
+        with self.captureOnCommitCallbacks(execute=True):
+            Purchase.objects.create(menu_item=self.coffee, quantity=1, logged_by=self.user)
+        self.assertFalse(Task.objects.filter(pk=stale.pk).exists())
+        self.assertEqual(Task.objects.get(idempotency_key__startswith='stock-snapshots:').status, Task.DONE)
+        self.assertEqual(StockSnapshot.objects.get().quantity, 5)
+
+
+class EventTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='password')
+        self.coffee = MenuItem.objects.create(name='Coffee', price=Decimal('3.00'))
+
+    def test_bulk_record_publishes_sales(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            purchases = Purchase.objects.bulk_record(
+                Purchase(menu_item=self.coffee, quantity=quantity, logged_by=self.user) for quantity in (1, 2)
+            )
+        sales = [data for _, type, data in get_broker()._history if type == 'sale'][-2:]
+        self.assertEqual([(sale['id'], sale['quantity']) for sale in sales], [(purchase.pk, purchase.quantity) for purchase in purchases])
+
+    def test_cache_broker_ids_are_unique_on_file_cache(self):
+        with tempfile.TemporaryDirectory() as location, override_settings(CACHES={
+            'default': {'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache', 'LOCATION': location},
+        }):
+            broker = CacheBroker()
+
+            def publish():
+                for n in range(25):
+                    broker.publish('test', n)
+
+            threads = [threading.Thread(target=publish) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(cache.get(broker._sequence_key), 200)
+            events = cache.get_many([broker._event_key(event_id) for event_id in range(1, 201)])
+            self.assertEqual(len(events), 200)
+
+    def test_event_stream_needs_asgi(self):
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(reverse('live-events')).status_code, 501)
+
+
+class ProfitAndRevenueTests(TestCase):
+    def test_malformed_filters_are_ignored(self):
+        user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(user)
+        coffee = MenuItem.objects.create(name='Coffee', price=Decimal('3.00'))
+        DailySales.objects.create(day=timezone.localdate(), menu_item=coffee, units_sold=2, revenue=Decimal('6.00'))
+        response = self.client.get(reverse('profit-and-revenue'), {'start': '2024-02-30', 'end': 'soon', 'menu_item': 'abc'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_revenue'], Decimal('6.00'))
+        self.assertEqual(response.context['filters'], {'start': None, 'end': None, 'menu_item': None})
+
+
+class ImportTests(TestCase):
+    def test_malformed_json_rows_are_reported(self):
+        ndjson = StringIO('{"name": "Coffee", "price": "3.00"}\n{"name": \n[1, 2]\n"Tea"\n{"name": "Cake", "price": "20.00"}\n')
+        result = run_import('menu-items', ndjson, 'ndjson')
+        self.assertEqual([line for line, _ in result.errors], [2, 3, 4])
+        self.assertIn('invalid JSON', result.errors[0][1])
+        self.assertEqual(result.created, 2)
+        result = run_import('menu-items', StringIO('[{"name": "Pie", "price": "6.00"}, [1, 2], "Tea"]'), 'json')
+        self.assertEqual([line for line, _ in result.errors], [2, 3])
+        self.assertEqual(sorted(MenuItem.objects.values_list('name', flat=True)), ['Cake', 'Coffee', 'Pie'])
+
+    def test_unreadable_file_is_a_command_error(self):
+        with tempfile.TemporaryDirectory() as directory:
+            for name, content in (('truncated.json', b'[{"name": "Pie", '), ('latin1.csv', 'name,price\nCr\xe8me,4.00\n'.encode('latin-1'))):
+                path = Path(directory) / name
+                path.write_bytes(content)
+                with self.subTest(name=name), self.assertRaisesMessage(CommandError, f'Cannot read {path}'):
+                    call_command('import_catalog', 'menu-items', str(path), stdout=StringIO(), stderr=StringIO())
+        self.assertFalse(MenuItem.objects.exists())
+
+
+class CachingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='manager', password='password')
+        self.client.force_login(self.user)
+
+    def test_etag_until_write(self):
+        flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        url = '/api/ingredients/?format=json'
+        response = self.client.get(url)
+        etag = response['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        # A queryset update sends no signals, so the cached list is still served.
+        Ingredient.objects.filter(pk=flour.pk).update(unit_price=Decimal('9.00'))
+        self.assertEqual(self.client.get(url).json(), response.json())
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.patch(f'/api/ingredients/{flour.pk}/', {'unit_price': '3.00'}, content_type='application/json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['results'][0]['unit_price'], '3.00')
+
+    def test_stock_change_invalidates_menu(self):
+        eggs = Ingredient.objects.create(name='Eggs', quantity=12, unit='egg', unit_price=Decimal('0.30'))
+        cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        RecipeRequirement.objects.create(menu_item=cake, ingredient=eggs, quantity=4)
+        self.assertEqual(availability.get_availability()[cake.pk], 3)
+        with self.captureOnCommitCallbacks(execute=True):
+            Purchase.objects.create(menu_item=cake, quantity=1, logged_by=self.user)
+        self.assertEqual(availability.get_availability()[cake.pk], 2)
+
+    def test_cascades_keep_fast_delete(self):
+        flour = Ingredient.objects.create(name='Flour', quantity=10, unit='kg', unit_price=Decimal('2.00'))
+        StockMovement.objects.record(flour.pk, StockMovement.RESTOCK, 5)
+        StockSnapshot.objects.take()
+        # Movements are deleted in one statement rather than loaded to send post_delete.
+        with CaptureQueriesContext(connection) as context, self.captureOnCommitCallbacks():
+            flour.delete()
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertFalse([query for query in context.captured_queries if query['sql'].startswith('SELECT') and 'stockmovement' in query['sql']])
+
+
+@override_settings(DATABASE_REPLICA_PIN=10)
+class ReplicaCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def compute(self):
+        self.computed_on = routers.current.get()
+        return 'value'
+
+    def expires_in(self, name):
+        [(key, expiry)] = [(key, expiry) for key, expiry in cache._expire_info.items() if f':{name}:' in key]
+        return expiry - time.time()
+
+    def test_replica_reads_are_cached_briefly(self):
+        # The default alias stands in for a replica: only the routing matters here.
+        token = routers.current.set('default')
+        try:
+            self.assertEqual(cached('replica', ('menuitem',), self.compute, timeout=3600), 'value')
+        finally:
+            routers.current.reset(token)
+        self.assertEqual(self.computed_on, 'default')
+        self.assertLessEqual(self.expires_in('replica'), 10)
+
+    def test_primary_reads_keep_their_timeout(self):
+        cached('primary', ('menuitem',), self.compute, timeout=3600)
+        self.assertIsNone(self.computed_on)
+        self.assertGreater(self.expires_in('primary'), 3000)
+
+
+class ArchiveTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='cashier', password='password')
+        self.cake = MenuItem.objects.create(name='Cake', price=Decimal('20.00'))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.enterContext(override_settings(ARCHIVE_ROOT=Path(directory.name)))
+        self.month = timezone.make_aware(datetime(2024, 1, 1))
+        self.baker = User.objects.create_user(username='baker', password='password')
+        self.pie = MenuItem.objects.create(name='Pie', price=Decimal('6.00'))
+        for day, menu_item, user in [(3, self.cake, self.user), (9, self.pie, self.baker), (20, self.cake, self.baker)]:
+            purchase = Purchase.objects.create(menu_item=menu_item, quantity=1, logged_by=user)
+            Purchase.objects.filter(pk=purchase.pk).update(purchase_time=self.month + timedelta(days=day))
+
+    def export(self):
+        return ''.join(exports.stream('purchases', 'csv'))
+
+    def test_archive_export_restore_round_trip(self):
+        before = self.export()
+        purchases = sorted(Purchase.objects.values_list('id', 'purchase_time', 'menu_item_id', 'quantity', 'logged_by_id'))
+        with self.captureOnCommitCallbacks(execute=True):
+            item = archive.archive_month(self.month)
+        self.assertFalse(Purchase.objects.exists())
+        self.assertEqual(self.export(), before)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.restore(item), (3, 0))
+        self.assertEqual(sorted(Purchase.objects.values_list('id', 'purchase_time', 'menu_item_id', 'quantity', 'logged_by_id')), purchases)
+        self.assertFalse(PurchaseArchive.objects.exists())
+        self.assertFalse((settings.ARCHIVE_ROOT / item.file).exists())
+        self.assertEqual(self.export(), before)
+
+    def test_restore_leaves_orphans_archived(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            item = archive.archive_month(self.month)
+        old_file = item.file
+        self.pie.delete()
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(archive.restore(item), (2, 1))
+        self.assertEqual(Purchase.objects.count(), 2)
+        item = PurchaseArchive.objects.get()
+        self.assertEqual((item.rows, item.first_purchase_time), (1, self.month + timedelta(days=9)))
+        self.assertFalse((settings.ARCHIVE_ROOT / old_file).exists())
+        self.assertEqual([row[3] for row in archive.purchases()], ['Pie'])
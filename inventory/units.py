@@ -0,0 +1,63 @@
+from decimal import Decimal
+from django.db.models import Case, DecimalField, F, Value, When
+
+# Size of each convertible unit in its dimension's base unit (grams or
+# milliliters, US customary volumes). Units missing here (pieces, eggs,
+# pinches) only convert to themselves.
+BASE_QUANTITIES = {
+    'kg': ('mass', Decimal('1000')),
+    'g': ('mass', Decimal('1')),
+    'lb': ('mass', Decimal('453.59237')),
+    'oz': ('mass', Decimal('28.349523125')),
+    'l': ('volume', Decimal('1000')),
+    'ml': ('volume', Decimal('1')),
+    'gal': ('volume', Decimal('3785.411784')),
+    'qt': ('volume', Decimal('946.352946')),
+    'pt': ('volume', Decimal('473.176473')),
+    'cup': ('volume', Decimal('236.5882365')),
+    'fl oz': ('volume', Decimal('29.5735295625')),
+    'tbsp': ('volume', Decimal('14.78676478125')),
+    'tsp': ('volume', Decimal('4.92892159375')),
+}
+
+FACTOR_PRECISION = Decimal('1e-12')
+FACTOR_FIELD = DecimalField(max_digits=24, decimal_places=12)
+
+# {(from_unit, to_unit): factor} for every pair of distinct units that share a
+# dimension, so ``quantity * CONVERSIONS[(from, to)]`` is in ``to`` units.
+CONVERSIONS = {
+    (from_unit, to_unit): (from_base / to_base).quantize(FACTOR_PRECISION)
+    for from_unit, (from_dimension, from_base) in BASE_QUANTITIES.items()
+    for to_unit, (to_dimension, to_base) in BASE_QUANTITIES.items()
+    if from_unit != to_unit and from_dimension == to_dimension
+}
+
+
+def can_convert(from_unit, to_unit):
+    return not from_unit or from_unit == to_unit or (from_unit, to_unit) in CONVERSIONS
+
+
+def factor(from_unit, to_unit):
+    """Multiplier taking a quantity in ``from_unit`` to ``to_unit``. A blank ``from_unit`` means no conversion."""
+    if not from_unit or from_unit == to_unit:
+        return Decimal('1')
+    return CONVERSIONS[(from_unit, to_unit)]
+
+
+def conversion_factor(from_field='unit', to_field='ingredient__unit'):
+    """
+    SQL expression evaluating ``factor(from_field, to_field)`` per row, so
+    conversions happen inside set-based queries. It is NULL where the units
+    can't be converted, so sums and minimums leave those lines out, as
+    purchases refuse them and forecasts skip them.
+    """
+    return Case(
+        When(**{from_field: ''}, then=Value(Decimal('1'))),
+        When(**{from_field: F(to_field)}, then=Value(Decimal('1'))),
+        *[
+            When(**{from_field: from_unit, to_field: to_unit}, then=Value(value))
+            for (from_unit, to_unit), value in CONVERSIONS.items()
+        ],
+        default=Value(None),
+        output_field=FACTOR_FIELD,
+    )
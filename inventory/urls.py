@@ -6,7 +6,12 @@ from .views import (
     MenuItemCreateView, RecipeRequirementCreateView, PurchaseCreateView,
     IngredientUpdateView, HomePageView, IngredientViewSet, MenuItemViewSet,
     RecipeRequirementViewSet, PurchaseViewSet, SignUpView, ProfileView,
-    EditProfileView, ChangePasswordView
+    EditProfileView, ChangePasswordView, ExportView, ExportDownloadView, TaskStatusView,
+    PerformanceReportView, StockMovementCreateView, ForecastView,
+    MenuEngineeringView
+)
+from .async_views import (
+    AsyncAvailabilityView, AsyncDashboardView, AsyncIngredientListView, AsyncMenuItemListView, EventStreamView
 )
 
 router = DefaultRouter()
@@ -16,6 +21,12 @@ router.register(r'recipe-requirements', RecipeRequirementViewSet)
 router.register(r'purchases', PurchaseViewSet)
 
 urlpatterns = [
+    path('api/live/menu-items/', AsyncMenuItemListView.as_view(), name='live-menu-items'),
+    path('api/live/ingredients/', AsyncIngredientListView.as_view(), name='live-ingredients'),
+    path('api/live/availability/', AsyncAvailabilityView.as_view(), name='live-availability'),
+    path('api/live/availability/<int:pk>/', AsyncAvailabilityView.as_view(), name='live-availability-detail'),
+    path('api/live/dashboard/', AsyncDashboardView.as_view(), name='live-dashboard'),
+    path('api/live/events/', EventStreamView.as_view(), name='live-events'),
     path('api/', include(router.urls)),
     path('', HomePageView.as_view(), name='home'),
     path('signup/', SignUpView.as_view(), name='signup'),
@@ -26,10 +37,17 @@ urlpatterns = [
     path('ingredients/delete/<int:pk>/', IngredientDeleteView.as_view(), name='ingredient-delete'),
     path('ingredients/add/', IngredientCreateView.as_view(), name='ingredient-add'),
     path('ingredients/update/<int:pk>/', IngredientUpdateView.as_view(), name='ingredient-update'),
+    path('ingredients/stock/', StockMovementCreateView.as_view(), name='stock-movement-add'),
     path('menu/', MenuItemListView.as_view(), name='menu-list'),
     path('menu/add/', MenuItemCreateView.as_view(), name='menu-add'),
+    path('menu/engineering/', MenuEngineeringView.as_view(), name='menu-engineering'),
     path('menu/recipe/add/', RecipeRequirementCreateView.as_view(), name='recipe-requirement-add'),
     path('purchases/', PurchaseListView.as_view(), name='purchase-list'),
     path('purchases/add/', PurchaseCreateView.as_view(), name='purchase-add'),
     path('profit-and-revenue/', ProfitAndRevenueView.as_view(), name='profit-and-revenue'),
+    path('forecast/', ForecastView.as_view(), name='forecast'),
+    path('export/<slug:dataset>/', ExportView.as_view(), name='export'),
+    path('exports/<str:filename>', ExportDownloadView.as_view(), name='export-download'),
+    path('tasks/<int:pk>/', TaskStatusView.as_view(), name='task-status'),
+    path('performance/', PerformanceReportView.as_view(), name='performance'),
 ]
\ No newline at end of file
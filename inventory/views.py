@@ -1,18 +1,29 @@
+from django.core.exceptions import ValidationError
+from django.conf import settings
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
 from django.shortcuts import render, redirect, get_object_or_404
 from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
 from django.urls import reverse_lazy
-from django.views.generic import ListView, TemplateView
+from django.db.models import Prefetch
+from django.views.generic import ListView, TemplateView, View
 from django.views.generic.edit import CreateView, DeleteView, UpdateView, FormView
-from .models import Ingredient, MenuItem, Purchase, RecipeRequirement
-from .forms import IngredientForm, MenuItemForm, RecipeRequirementForm, PurchaseForm, CustomUserCreationForm, UserProfileForm, CustomPasswordChangeForm
+from .models import Ingredient, MenuItem, Purchase, RecipeRequirement, StockMovement, Task
+from .forms import IngredientForm, MenuItemForm, RecipeRequirementForm, PurchaseForm, StockMovementForm, CustomUserCreationForm, UserProfileForm, CustomPasswordChangeForm
 from django.contrib.auth import login, update_session_auth_hash
 from django.contrib.auth.decorators import login_required
-from django.contrib.auth.mixins import LoginRequiredMixin
+from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
 from django.contrib.auth.models import User
-from rest_framework import viewsets
+from rest_framework import serializers, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.response import Response
+from rest_framework.reverse import reverse
 from rest_framework.permissions import IsAuthenticated
 from .serializers import IngredientSerializer, MenuItemSerializer, RecipeRequirementSerializer, PurchaseSerializer
 from .permissions import ReadOnlyOrAuthenticated
+from .pagination import NameCursorPagination, IdCursorPagination, PurchaseCursorPagination
+from . import availability, exports, forecasting, instrumentation, menu_engineering, reorder, reports, routers, tasks
+from .caching import CATALOGUE, ConditionalListMixin, cached
 
 class SignUpView(CreateView):
     model = User
@@ -31,10 +42,18 @@ class HomePageView(LoginRequiredMixin, TemplateView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        today = timezone.now().date()
-        context['today_purchases'] = Purchase.objects.filter(purchase_time__date=today)
-        context['low_ingredients'] = Ingredient.objects.order_by('quantity')[:5]
-        context['menu_items'] = MenuItem.objects.all()
+        today = timezone.localdate()
+        context['today_purchases'] = cached(
+            'today_purchases', ('purchase',),
+            lambda: list(Purchase.objects.between(today, today).select_related('menu_item', 'logged_by')),
+            today,
+        )
+        context['low_ingredients'] = cached(
+            'low_ingredients', ('ingredient', 'stock'), lambda: list(reorder.needs_reorder()[:5])
+        )
+        context['menu_items'] = availability.annotate(
+            cached('menu_items', ('menuitem',), lambda: list(MenuItem.objects.all()))
+        )
         return context
 
 class ProfileView(LoginRequiredMixin, TemplateView):
@@ -80,31 +99,149 @@ class IngredientDeleteView(LoginRequiredMixin, DeleteView):
 
 class MenuItemListView(LoginRequiredMixin, ListView):
     model = MenuItem
+    queryset = MenuItem.objects.prefetch_related(
+        Prefetch('recipe_requirements', queryset=RecipeRequirement.objects.select_related('ingredient').order_by('pk'))
+    )
     template_name = 'inventory/menu_list.html'
     context_object_name = 'menu_items'
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        return availability.annotate(cached('menu_list', CATALOGUE, lambda: list(queryset)))
+
 class PurchaseListView(LoginRequiredMixin, ListView):
     model = Purchase
+    # Ordered like purchase_time_idx, so each page is read from the index.
+    queryset = Purchase.objects.select_related('menu_item', 'logged_by').order_by('-purchase_time', '-id')
     template_name = 'inventory/purchase_list.html'
     context_object_name = 'purchases'
+    paginate_by = 100
+    replica_reads = True
 
 class ProfitAndRevenueView(LoginRequiredMixin, TemplateView):
     template_name = 'inventory/profit_and_revenue.html'
+    replica_reads = True
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        purchases = Purchase.objects.all()
-        total_revenue = sum(purchase.menu_item.price * purchase.quantity for purchase in purchases)
-        total_cost = sum(
-            requirement.ingredient.unit_price * requirement.quantity * purchase.quantity
-            for purchase in purchases
-            for requirement in purchase.menu_item.recipe_requirements.all()
-        )
-        context['total_revenue'] = total_revenue
-        context['total_cost'] = total_cost
-        context['profit'] = total_revenue - total_cost
+        # Malformed filters are ignored rather than failing the report.
+        filters = {}
+        for param in ('start', 'end'):
+            try:
+                filters[param] = parse_date(self.request.GET.get(param, ''))
+            except ValueError:
+                filters[param] = None
+        menu_item = self.request.GET.get('menu_item', '')
+        filters['menu_item'] = int(menu_item) if menu_item.isdigit() else None
+        context.update(reports.totals(**filters))
+        context['menu_item_breakdown'] = reports.by_menu_item(**filters)
+        context['daily_breakdown'] = reports.by_day(**filters)
+        context['filters'] = filters
+        return context
+
+class ForecastView(LoginRequiredMixin, TemplateView):
+    template_name = 'inventory/forecast.html'
+    replica_reads = True
+    horizons = (1, 3, 7, 14, 28)
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse(self.report())
+        return super().get(request, *args, **kwargs)
+
+    def report(self):
+        try:
+            start = parse_date(self.request.GET.get('start', ''))
+        except ValueError:
+            start = None
+        days = self.request.GET.get('days', '')
+        days = int(days) if days.isdigit() and int(days) in self.horizons else 7
+        projection = forecasting.project(start, days)
+        return {
+            'start': projection['dates'][0],
+            'days': days,
+            'prep_list': forecasting.prep_list(projection),
+            'shortfalls': forecasting.shortfalls(projection),
+            'skipped': projection['skipped'],
+        }
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context.update(self.report())
+        context['horizons'] = self.horizons
         return context
 
+class MenuEngineeringView(LoginRequiredMixin, TemplateView):
+    template_name = 'inventory/menu_engineering.html'
+    replica_reads = True
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        days = {}
+        for param in ('start', 'end'):
+            try:
+                days[param] = parse_date(self.request.GET.get(param, ''))
+            except ValueError:
+                days[param] = None
+        context['report'] = menu_engineering.report(**days)
+        return context
+
+class PerformanceReportView(LoginRequiredMixin, UserPassesTestMixin, TemplateView):
+    template_name = 'inventory/performance.html'
+
+    def test_func(self):
+        return self.request.user.is_staff
+
+    def get(self, request, *args, **kwargs):
+        if request.GET.get('format') == 'json':
+            return JsonResponse(instrumentation.summarize(instrumentation.recorder.collect()), safe=False)
+        return super().get(request, *args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        instrumentation.recorder.clear()
+        return redirect('performance')
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['views'] = instrumentation.summarize(instrumentation.recorder.collect())
+        return context
+
+class ExportView(LoginRequiredMixin, View):
+    replica_reads = True
+
+    def get(self, request, dataset):
+        fmt = request.GET.get('format', 'csv')
+        if dataset not in exports.DATASETS or fmt not in exports.FORMATS:
+            raise Http404
+        try:
+            start = parse_date(request.GET.get('start', ''))
+            end = parse_date(request.GET.get('end', ''))
+        except ValueError:
+            raise Http404
+        if request.GET.get('background'):
+            task = tasks.generate_export.defer(
+                dataset=dataset, fmt=fmt, start=start and start.isoformat(), end=end and end.isoformat(),
+            )
+            return JsonResponse({'status_url': request.build_absolute_uri(reverse('task-status', args=[task.pk]))}, status=202)
+        response = StreamingHttpResponse(exports.stream(dataset, fmt, start, end, using=routers.current.get()), content_type=exports.FORMATS[fmt])
+        response['Content-Disposition'] = f'attachment; filename="{dataset}.{fmt}"'
+        return response
+
+class TaskStatusView(LoginRequiredMixin, View):
+    def get(self, request, pk):
+        task = get_object_or_404(Task, pk=pk)
+        data = {'id': task.pk, 'name': task.name, 'status': task.status, 'attempts': task.attempts}
+        if task.status == Task.DONE and task.name == tasks.generate_export.task_name:
+            data['download_url'] = request.build_absolute_uri(reverse('export-download', args=[task.result['file']]))
+        return JsonResponse(data)
+
+class ExportDownloadView(LoginRequiredMixin, View):
+    def get(self, request, filename):
+        path = settings.EXPORT_ROOT / filename
+        if path.name != filename or not path.is_file():
+            raise Http404
+        return FileResponse(open(path, 'rb'), as_attachment=True)
+
 class IngredientCreateView(LoginRequiredMixin, CreateView):
     model = Ingredient
     form_class = IngredientForm
@@ -139,7 +276,38 @@ class PurchaseCreateView(LoginRequiredMixin, CreateView):
 
     def form_valid(self, form):
         form.instance.logged_by = self.request.user
-        return super().form_valid(form)
+        try:
+            return super().form_valid(form)
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+
+class StockMovementCreateView(LoginRequiredMixin, CreateView):
+    model = StockMovement
+    form_class = StockMovementForm
+    template_name = 'inventory/record_stock_movement.html'
+    success_url = reverse_lazy('ingredient-list')
+
+    def get_initial(self):
+        initial = super().get_initial()
+        ingredient_id = self.request.GET.get('ingredient')
+        if ingredient_id:
+            initial['ingredient'] = get_object_or_404(Ingredient, id=ingredient_id)
+        return initial
+
+    def form_valid(self, form):
+        try:
+            self.object = StockMovement.objects.record(
+                form.cleaned_data['ingredient'].pk,
+                form.cleaned_data['kind'],
+                form.signed_quantity(),
+                note=form.cleaned_data['note'],
+                recorded_by=self.request.user,
+            )
+        except ValidationError as e:
+            form.add_error(None, e)
+            return self.form_invalid(form)
+        return redirect(self.get_success_url())
 
 class IngredientUpdateView(LoginRequiredMixin, UpdateView):
     model = Ingredient
@@ -147,22 +315,127 @@ class IngredientUpdateView(LoginRequiredMixin, UpdateView):
     template_name = 'inventory/update_ingredient.html'
     success_url = reverse_lazy('ingredient-list')
 
-class IngredientViewSet(viewsets.ModelViewSet):
+class IngredientViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = [ReadOnlyOrAuthenticated]
+    pagination_class = NameCursorPagination
+    cache_labels = ('ingredient', 'stock')
 
-class MenuItemViewSet(viewsets.ModelViewSet):
+    @action(detail=False)
+    def stock(self, request):
+        """Stock of each ingredient at ``?at=`` (an ISO 8601 date and time), rebuilt from the stock ledger."""
+        try:
+            at = parse_datetime(request.query_params.get('at', ''))
+        except ValueError:
+            at = None
+        if at is None:
+            raise serializers.ValidationError({'at': 'Enter a valid date and time (YYYY-MM-DDTHH:MM).'})
+        if timezone.is_naive(at):
+            at = timezone.make_aware(at)
+        stock = StockMovement.objects.stock_at(at)
+        return Response([
+            {
+                'url': reverse('ingredient-detail', args=[pk], request=request),
+                'name': name,
+                'unit': unit,
+                'quantity': str(stock[pk]),
+            }
+            for pk, name, unit in Ingredient.objects.filter(pk__in=stock).order_by('name').values_list('pk', 'name', 'unit')
+        ])
+
+class MenuItemViewSet(ConditionalListMixin, viewsets.ModelViewSet):
     queryset = MenuItem.objects.all()
     serializer_class = MenuItemSerializer
     permission_classes = [ReadOnlyOrAuthenticated]
+    pagination_class = NameCursorPagination
+
+    @action(detail=False)
+    def availability(self, request):
+        """How many servings of each menu item current stock can make (null when it has no recipe)."""
+        servings = availability.get_availability()
+        return Response([
+            {
+                'url': reverse('menuitem-detail', args=[pk], request=request),
+                'name': name,
+                'available_servings': servings.get(pk),
+            }
+            for pk, name in MenuItem.objects.order_by('name').values_list('pk', 'name')
+        ])
+
+    @action(detail=False)
+    def engineering(self, request):
+        """Margin, sales and star/plowhorse/puzzle/dog class of each menu item between ``?start=`` and ``?end=`` (the last 28 days by default)."""
+        days = {}
+        for param in ('start', 'end'):
+            if request.query_params.get(param):
+                try:
+                    days[param] = parse_date(request.query_params[param])
+                except ValueError:
+                    days[param] = None
+                if days[param] is None:
+                    raise serializers.ValidationError({param: 'Enter a valid date (YYYY-MM-DD).'})
+        report = menu_engineering.report(**days)
+        return Response({
+            **report,
+            'menu_items': [
+                {'url': reverse('menuitem-detail', args=[row['id']], request=request), **row} for row in report['menu_items']
+            ],
+        })
 
 class RecipeRequirementViewSet(viewsets.ModelViewSet):
-    queryset = RecipeRequirement.objects.all()
+    queryset = RecipeRequirement.objects.order_by('pk')
     serializer_class = RecipeRequirementSerializer
     permission_classes = [ReadOnlyOrAuthenticated]
+    pagination_class = IdCursorPagination
 
 class PurchaseViewSet(viewsets.ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
-    permission_classes = [ReadOnlyOrAuthenticated]
\ No newline at end of file
+    permission_classes = [ReadOnlyOrAuthenticated]
+    pagination_class = PurchaseCursorPagination
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+        days = {}
+        for param in ('start', 'end'):
+            if params.get(param):
+                try:
+                    days[param] = parse_date(params[param])
+                except ValueError:
+                    days[param] = None
+                if days[param] is None:
+                    raise serializers.ValidationError({param: 'Enter a valid date (YYYY-MM-DD).'})
+        queryset = queryset.between(**days)
+        if params.get('menu_item'):
+            menu_items = params['menu_item'].split(',')
+            if not all(pk.isdigit() for pk in menu_items):
+                raise serializers.ValidationError({'menu_item': 'Enter a comma separated list of menu item IDs.'})
+            queryset = queryset.filter(menu_item_id__in=menu_items)
+        return queryset
+
+    def perform_create(self, serializer):
+        try:
+            serializer.save(logged_by=self.request.user)
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+    def perform_update(self, serializer):
+        try:
+            serializer.save()
+        except ValidationError as e:
+            raise serializers.ValidationError(e.messages)
+
+    @action(detail=False, methods=['post'])
+    def bulk(self, request):
+        """
+        Record a list of purchases at once. Either every row is saved or none
+        are; validation errors are returned as a list matching the rows.
+        """
+        context = self.get_serializer_context()
+        context['menu_items'] = MenuItem.objects.in_bulk()
+        serializer = self.get_serializer_class()(data=request.data, many=True, max_length=10000, context=context)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response({'created': len(serializer.instance)}, status=status.HTTP_201_CREATED)
\ No newline at end of file